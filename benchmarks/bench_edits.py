@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Latency of game actions with edits of the three game messages sent one
+after another and at the same time, against a local fake Bot API server
+answering every request after a delay, like a real network round-trip
+
+Run from repository root: python3 benchmarks/bench_edits.py
+"""
+
+import random
+import sys
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from os.path import dirname, join
+from statistics import median
+from threading import Thread
+from time import perf_counter, sleep
+
+from telegram import Bot, Update
+from telegram.utils.request import Request
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+# Bot reads its settings from command line on import
+argv, sys.argv = sys.argv, [sys.argv[0], '-c', 'config.json', '-e', 'dev']
+
+import blackjack_bot as bot  # noqa: E402
+from screen import MessageHandle, Screen  # noqa: E402
+
+CHAT = {'id': 1, 'type': 'private', 'first_name': 'Bench'}
+USER = {'id': 1, 'is_bot': False, 'first_name': 'Bench'}
+ACTIONS = ['hit', 'stand', 'double']
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+    """ Bot API answering after a delay """
+    delay = 0.03
+
+    def do_POST(self) -> None:
+        method = self.path.rsplit('/', 1)[-1]
+        data = loads(self.rfile.read(int(self.headers['Content-Length'])))
+        sleep(self.delay)
+        result = True
+        if method == 'editMessageText':
+            result = {'message_id': int(data['message_id']), 'date': 0,
+                      'chat': CHAT, 'text': data['text']}
+        body = dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class Context:
+    """ Just enough of CallbackContext for handlers """
+    def __init__(self, api: Bot) -> None:
+        self.bot = api
+        self.bot_data = {}
+        self.user_data = {}
+        for num, key in enumerate(['msg_status', 'msg_dealer',
+                                   'msg_player']):
+            self.user_data[key] = MessageHandle(CHAT['id'], num + 1)
+
+
+def make_update(api: Bot, data: str) -> Update:
+    return Update.de_json({'update_id': 1, 'callback_query': {
+        'id': '1', 'from': USER, 'chat_instance': '1', 'data': data,
+        'message': {'message_id': 3, 'date': 0, 'chat': CHAT}}}, api)
+
+
+def play(api: Bot, rounds: int) -> dict:
+    """ Play rounds, return: handler latencies by action """
+    random.seed(1)
+    context = Context(api)
+    times = {action: [] for action in ['game'] + ACTIONS}
+    for num in range(rounds):
+        for action in ['game', ACTIONS[num % len(ACTIONS)]]:
+            handler = getattr(bot, action)
+            start = perf_counter()
+            handler(make_update(api, action), context)
+            times[action].append(perf_counter() - start)
+    return times
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Game screen edits benchmark')
+    parser.add_argument('-r', '--rounds', type=int, default=60,
+                        help='rounds to play')
+    parser.add_argument('-d', '--delay', type=float, default=30,
+                        help='fake Bot API delay, ms')
+    args = parser.parse_args(argv[1:])
+    FakeAPI.delay = args.delay / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAPI)
+    Thread(target=server.serve_forever, daemon=True).start()
+    api = Bot('123:BENCHMARK', request=Request(con_pool_size=8),
+              base_url=f'http://127.0.0.1:{server.server_port}/bot')
+    bot.config['settings']['single_message'] = False
+    results = {}
+    for name, workers in [('one by one', 0), ('at once', 3)]:
+        bot.game_screen = Screen(workers)
+        results[name] = play(api, args.rounds)
+    print(f'Median handler latency, ms, Bot API delay {args.delay:.0f} ms')
+    print(f'{"action":>8}' + ''.join(f'{name:>12}' for name in results))
+    for action in ['game'] + ACTIONS:
+        print(f'{action:>8}' + ''.join(
+            f'{median(times[action]) * 1000:12.1f}'
+            for times in results.values()))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""
+Microbenchmark of game mechanics: deal, hit and stand throughput
+of current Game compared with the previous list-popping implementation
+
+Run from repository root: python3 benchmarks/bench_game.py
+"""
+
+import sys
+from argparse import ArgumentParser
+from os.path import dirname, join
+from random import shuffle
+from timeit import repeat
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from game import DECK, Game  # noqa: E402
+
+
+class LegacyGame:
+    """ Shoe handling of the previous implementation, kept for comparison """
+    def __init__(self, deck_count: int, low_deck_threshold: float,
+                 diller_hit_on: int) -> None:
+        self.deck_count = deck_count
+        self.low_deck_threshold = low_deck_threshold
+        self.diller_hit_on = diller_hit_on
+        self.make_deck(deck_count)
+        self.dealer_hand = []
+        self.player_hand = []
+        self.deal_cards()
+
+    def make_deck(self, deck_count: int) -> None:
+        deck = list(DECK * deck_count)
+        shuffle(deck)
+        self.deck = deck
+
+    def take_card(self, hand: list) -> None:
+        hand.append(self.deck[0])
+        self.deck.pop(0)
+        if len(self.deck) < 52 * self.deck_count * self.low_deck_threshold:
+            self.make_deck(self.deck_count)
+
+    def deal_cards(self) -> None:
+        self.dealer_hand.clear()
+        self.player_hand.clear()
+        for i in range(2):
+            self.take_card(self.dealer_hand)
+            self.take_card(self.player_hand)
+
+    def count_cards(self, hand: list) -> int:
+        count = 0
+        for card in sorted(hand, key=str, reverse=True):
+            value = card[0]
+            if isinstance(value, int):
+                count = count + value
+            elif value != 'A':
+                count = count + 10
+            elif count <= 10:
+                count = count + 11
+            else:
+                count = count + 1
+        return count
+
+    def hit(self) -> None:
+        self.take_card(self.player_hand)
+
+    def stand(self) -> None:
+        while self.count_cards(self.dealer_hand) <= self.diller_hit_on:
+            self.take_card(self.dealer_hand)
+
+
+def play_rounds(game, rounds: int) -> None:
+    """ Deal, hit once and stand - a typical short round """
+    for _ in range(rounds):
+        game.deal_cards()
+        game.hit()
+        game.stand()
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Game microbenchmark')
+    parser.add_argument('-r', '--rounds', type=int, default=10000,
+                        help='rounds per measurement')
+    parser.add_argument('-d', '--decks', type=int, nargs='+',
+                        default=[1, 4, 8], help='deck counts to measure')
+    args = parser.parse_args()
+    print(f'{"decks":>5} {"implementation":>14} {"rounds/s":>12}')
+    for deck_count in args.decks:
+        for name, cls in (('legacy', LegacyGame), ('current', Game)):
+            game = cls(deck_count, 0.2, 16)
+            best = min(repeat(lambda: play_rounds(game, args.rounds),
+                              number=1, repeat=5))
+            print(f'{deck_count:>5} {name:>14} {args.rounds / best:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
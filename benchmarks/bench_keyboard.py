@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+"""
+Keyboard build time per callback: cached keyboards compared with building
+every button from scratch, as get_keyboard did before
+
+Run from repository root: python3 benchmarks/bench_keyboard.py
+"""
+
+import sys
+from os.path import dirname, join
+from timeit import repeat
+
+from emoji import emojize
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+# Bot reads its settings from command line on import
+sys.argv = [sys.argv[0], '-c', 'config.json', '-e', 'dev']
+
+import blackjack_bot as bot  # noqa: E402
+
+
+class Context:
+    """ Just enough of CallbackContext for get_keyboard """
+    def __init__(self, user_data: dict) -> None:
+        self.user_data = user_data
+
+
+def legacy_keyboard(context: Context, new_game=False, double=False,
+                    bet_set=False, settings=False,
+                    start_message=False) -> InlineKeyboardMarkup:
+    """ Previous get_keyboard, building everything on every call """
+    messages_txt = bot.messages_txt
+    language, deck_count = bot.get_user_settings(context)
+    bet, balance = bot.get_user_bet_and_balance(context)
+    if new_game:
+        b_start = ' '.join([emojize(':game_die:'),
+                            messages_txt[language]['b_start']])
+        keyboard_row_1 = [InlineKeyboardButton(b_start,
+                                               callback_data='game')]
+    elif bet_set:
+        keyboard_row_1 = [
+            InlineKeyboardButton(emojize(':downwards_button:'),
+                                 callback_data='bet.decrease'),
+            InlineKeyboardButton(emojize(':upwards_button:'),
+                                 callback_data='bet.increase')]
+    elif settings:
+        b_rating = ' '.join([emojize(':trophy:'),
+                            messages_txt[language]['b_rating']])
+        b_language = ' '.join([emojize(':input_latin_uppercase:'),
+                              messages_txt[language]['b_language']])
+        b_language_caption = messages_txt[language]['b_language_caption']
+        b_deck_count = ' '.join([emojize(':input_numbers:'),
+                                messages_txt[language]['b_deck_count']])
+        b_reset = ' '.join([emojize(':money_bag:'),
+                            messages_txt[language]['b_reset']])
+        keyboard_row_1 = [
+            [InlineKeyboardButton(b_rating,
+                                  callback_data='settings.rating')],
+            [InlineKeyboardButton(': '.join([b_language,
+                                             b_language_caption]),
+                                  callback_data='settings.language')],
+            [InlineKeyboardButton(': '.join([b_deck_count,
+                                             str(deck_count)]),
+                                  callback_data='settings.deck_count')],
+            [InlineKeyboardButton(b_reset,
+                                  callback_data='settings.balance_reset')]]
+    else:
+        b_hit = ' '.join([emojize(':backhand_index_pointing_down:'),
+                         messages_txt[language]['b_hit']])
+        b_stand = ' '.join([emojize(':raised_hand:'),
+                           messages_txt[language]['b_stand']])
+        b_double = ' '.join([emojize(':victory_hand:'),
+                            messages_txt[language]['b_double']])
+        keyboard_row_1 = [InlineKeyboardButton(b_hit, callback_data='hit'),
+                          InlineKeyboardButton(b_stand,
+                                               callback_data='stand')]
+        if double:
+            keyboard_row_1.append(InlineKeyboardButton(
+                b_double, callback_data='double'))
+        if bot.hints_available(context):
+            b_hint = ' '.join([emojize(':light_bulb:'),
+                              messages_txt[language]['b_hint']])
+            keyboard_row_1.append(InlineKeyboardButton(
+                b_hint, callback_data='hint'))
+    bet = ' '.join([emojize(':dollar_banknote:'), str(bet),
+                   '[' + str(balance - bet) + ']'])
+    b_settings = ' '.join([emojize(':gear:'),
+                          messages_txt[language]['b_settings']])
+    keyboard_row_2 = [InlineKeyboardButton(bet, callback_data='bet'),
+                      InlineKeyboardButton(b_settings,
+                                           callback_data='settings')]
+    keyboard = [keyboard_row_1, keyboard_row_2]
+    if start_message:
+        keyboard = [keyboard_row_1]
+    if settings:
+        keyboard = keyboard_row_1 + [keyboard_row_2]
+    return InlineKeyboardMarkup(keyboard)
+
+
+# Keyboards of a typical round: game, hit, stand and bet menu
+LAYOUTS = [(False, True), (False, False), (True,),
+           (False, False, True), (False, False, False, True)]
+
+
+def callbacks(get_keyboard, contexts: list) -> None:
+    for context in contexts:
+        for layout in LAYOUTS:
+            get_keyboard(context, *layout)
+
+
+def main() -> None:
+    contexts = [Context({'bet': bet, 'balance': 100 + bet,
+                         'language': language, 'deck_count': 4})
+                for bet in range(2, 102, 2) for language in ('en', 'ru')]
+    for context in contexts:
+        for layout in LAYOUTS:
+            assert (legacy_keyboard(context, *layout).to_dict() ==
+                    bot.get_keyboard(context, *layout).to_dict())
+    builds = len(contexts) * len(LAYOUTS)
+    for name, get_keyboard in (('legacy', legacy_keyboard),
+                               ('cached', bot.get_keyboard)):
+        best = min(repeat(lambda: callbacks(get_keyboard, contexts),
+                          number=10, repeat=5)) / 10
+        print(f'{name:>6}: {best / builds * 10 ** 6:.1f} us per keyboard')
+
+
+if __name__ == '__main__':
+    main()
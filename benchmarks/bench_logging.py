@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+"""
+Time a handler thread spends on logging per update, three records like
+a game action logs: file handler writing and flushing every record, as
+before, and queued logging with listener thread writing the file
+
+Slow disk is simulated with a delay of every flush
+
+Run from repository root: python3 benchmarks/bench_logging.py -d 1
+"""
+
+import sys
+from argparse import ArgumentParser
+from logging import FileHandler, Formatter, getLogger
+from os import remove
+from os.path import dirname, join
+from queue import Queue
+from statistics import median
+from tempfile import gettempdir
+from time import perf_counter, sleep
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from logqueue import (BatchFileHandler, BatchListener,  # noqa: E402
+                      RecordQueueHandler)
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+UPDATES = 5000
+EVENTS = ['take card', '\U0001F44D Win - blackjack, bet: 4', 'stand']
+
+
+class SlowFileHandler(FileHandler):
+    """ File handler on a slow disk """
+    flush_delay = 0
+
+    def flush(self) -> None:
+        super().flush()
+        if self.flush_delay:
+            sleep(self.flush_delay)
+
+
+class SlowBatchFileHandler(BatchFileHandler):
+    """ Batch file handler on a slow disk """
+    flush_delay = 0
+
+    def flush_batch(self) -> None:
+        super().flush_batch()
+        if self.flush_delay:
+            sleep(self.flush_delay)
+
+
+def measure(name: str, handler) -> list:
+    """ Time of logging for every update, in microseconds """
+    logger = getLogger(name)
+    logger.propagate = False
+    logger.setLevel('INFO')
+    logger.addHandler(handler)
+    times = []
+    for num in range(UPDATES):
+        start = perf_counter()
+        for event in EVENTS:
+            logger.info(f'Player {num} - {event}')
+        times.append((perf_counter() - start) * 10 ** 6)
+    logger.removeHandler(handler)
+    return times
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Logging benchmark')
+    parser.add_argument('-d', '--delay', type=float, default=0,
+                        help='delay of every flush, ms')
+    args = parser.parse_args()
+    SlowFileHandler.flush_delay = args.delay / 1000
+    SlowBatchFileHandler.flush_delay = args.delay / 1000
+    filename = join(gettempdir(), 'bench_logging.txt')
+    file_handler = SlowFileHandler(filename, encoding='utf-8')
+    file_handler.setFormatter(Formatter(LOG_FORMAT))
+    results = {'file': measure('file', file_handler)}
+    file_handler.close()
+    queue = Queue()
+    batch_handler = SlowBatchFileHandler(filename, 100 * 2 ** 20, 1)
+    batch_handler.setFormatter(Formatter(LOG_FORMAT))
+    listener = BatchListener(queue, batch_handler)
+    listener.start()
+    start = perf_counter()
+    results['queue'] = measure('queue', RecordQueueHandler(queue))
+    listener.stop()
+    print(f'queue drained in {perf_counter() - start:.2f} s')
+    batch_handler.close()
+    print(f'Logging time per update, {len(EVENTS)} records, us, '
+          f'flush delay {args.delay} ms')
+    for name, times in results.items():
+        times.sort()
+        print(f'{name:>6}: median {median(times):6.1f}, '
+              f'99% {times[len(times) * 99 // 100]:7.1f}, '
+              f'max {times[-1]:8.1f}')
+    for suffix in ['', '.1']:
+        try:
+            remove(filename + suffix)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    main()
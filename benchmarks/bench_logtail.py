@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Time of getting the last log lines: tail process, as /logs did before,
+memory-mapped log file and in-memory buffer, on a generated log file
+
+Run from repository root: python3 benchmarks/bench_logtail.py -s 1024
+"""
+
+import sys
+from argparse import ArgumentParser
+from logging import Formatter, LogRecord
+from os import remove
+from os.path import dirname, join
+from subprocess import run
+from tempfile import gettempdir
+from timeit import repeat
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from logtail import LogBuffer, tail_file  # noqa: E402
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+LINE = ('2021-11-01 12:00:00,000 INFO __main__ Player {} - '
+        '\U0001F44D Win - blackjack, bet: 4\n')
+
+
+def make_log(filename: str, size: int) -> None:
+    """ Write log file of about size megabytes """
+    block = ''.join(LINE.format(num) for num in range(10000)).encode()
+    with open(filename, 'wb') as file:
+        for _ in range(size * 2 ** 20 // len(block) + 1):
+            file.write(block)
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Log tail benchmark')
+    parser.add_argument('-s', '--size', type=int, default=256,
+                        help='log file size, MB')
+    parser.add_argument('-n', '--lines', type=int, default=10,
+                        help='lines to get')
+    args = parser.parse_args()
+    filename = join(gettempdir(), 'bench_logtail.txt')
+    make_log(filename, args.size)
+    buffer = LogBuffer(filename, 1000)
+    buffer.setFormatter(Formatter(LOG_FORMAT))
+    for num in range(1000):
+        buffer.handle(LogRecord('__main__', 20, '', 0, f'Player {num}',
+                                None, None))
+    tail = run(['tail', '-n', str(args.lines), filename],
+               capture_output=True, universal_newlines=True).stdout
+    assert tail_file(filename, args.lines) == tail.rstrip('\n')
+    ways = {
+        'tail process': lambda: run(['tail', '-n', str(args.lines),
+                                     filename], capture_output=True,
+                                    universal_newlines=True).stdout,
+        'mmap file': lambda: tail_file(filename, args.lines),
+        'memory': lambda: buffer.tail(args.lines)
+    }
+    print(f'{args.lines} last lines of {args.size} MB log')
+    for name, way in ways.items():
+        best = min(repeat(way, number=100, repeat=5)) / 100
+        print(f'{name:>12}: {best * 10 ** 6:10.1f} us')
+    remove(filename)
+
+
+if __name__ == '__main__':
+    main()
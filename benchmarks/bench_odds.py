@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+"""
+Odds line queries of consecutive real games: time of exact odds, shown to
+players, compared with the recursion over compositions of the first
+version, and how far their odds are from each other
+
+Run from repository root: python3 benchmarks/bench_odds.py
+"""
+
+import sys
+from argparse import ArgumentParser
+from functools import lru_cache
+from gc import collect
+from os.path import dirname, join
+from random import seed
+from time import perf_counter
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from game import Game  # noqa: E402
+from odds import (ACE, CACHE_SIZE, CARD_KIND, KIND_POINTS,  # noqa: E402
+                  _outcome, count_score, dealer_odds, make_kind_composition)
+
+DILLER_HIT_ON = 16
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def legacy_final_odds(points: int, aces: int, cards: int, counts: tuple,
+                      diller_hit_on: int) -> tuple:
+    """ Odds of the first version, kept for comparison """
+    odds = [0.0] * (23 - diller_hit_on)
+    total = sum(counts)
+    cards = min(cards + 1, 3)
+    for kind, count in enumerate(counts):
+        if not count:
+            continue
+        share = count / total
+        next_points = points + KIND_POINTS[kind]
+        next_aces = aces + (kind == ACE)
+        score = count_score(next_points, next_aces)
+        if score > diller_hit_on:
+            odds[_outcome(score, cards, diller_hit_on)] += share
+            continue
+        rest = counts[:kind] + (count - 1,) + counts[kind + 1:]
+        next_odds = legacy_final_odds(next_points, next_aces, cards, rest,
+                                      diller_hit_on)
+        odds = [odd + share * next_odd
+                for odd, next_odd in zip(odds, next_odds)]
+    return tuple(odds)
+
+
+def legacy_dealer_odds(up_card: int, counts: tuple,
+                       diller_hit_on: int) -> dict:
+    odds = legacy_final_odds(KIND_POINTS[up_card], int(up_card == ACE), 1,
+                             tuple(counts), diller_hit_on)
+    result = dict(zip(range(diller_hit_on + 1, 22), odds))
+    result['bust'] = odds[-2]
+    result['blackjack'] = odds[-1]
+    return result
+
+
+def queries(deck_count: int, games: int) -> list:
+    """ Up card and composition the player sees, for every game """
+    game = Game(deck_count, 0.25, DILLER_HIT_ON)
+    result = []
+    for _ in range(games):
+        game.deal_cards()
+        counts = list(make_kind_composition(game.shoe_counts))
+        counts[CARD_KIND[game.dealer_hand[1][0]]] += 1
+        result.append((CARD_KIND[game.dealer_hand[0][0]], tuple(counts)))
+        game.hit()
+        game.stand()
+    return result
+
+
+def measure(func, args: list) -> tuple:
+    """ Median, 90th percentile and max of query time, ms, and results """
+    times = []
+    results = []
+    # Garbage of the run before isn't collected during this one
+    collect()
+    for up_card, counts in args:
+        started = perf_counter()
+        results.append(func(up_card, counts, DILLER_HIT_ON))
+        times.append((perf_counter() - started) * 1000)
+    times.sort()
+    return (times[len(times) // 2], times[len(times) * 9 // 10],
+            times[-1]), results
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Odds benchmark')
+    parser.add_argument('-g', '--games', type=int, default=250,
+                        help='consecutive games')
+    parser.add_argument('-d', '--deck-count', type=int, nargs='+',
+                        default=[1, 4, 8], help='numbers of decks')
+    args = parser.parse_args()
+    seed(1)
+    # Warm-up: dealer's draws are counted once for every up card
+    for up_card in range(len(KIND_POINTS)):
+        dealer_odds(up_card, (4,) * 8 + (16, 4), DILLER_HIT_ON)
+    print(f'{args.games} games, query time ms median/p90/max')
+    print(f'{"decks":>5} {"legacy":>20} {"current":>20} {"max diff":>9}')
+    for deck_count in args.deck_count:
+        games = queries(deck_count, args.games)
+        legacy, legacy_odds = measure(legacy_dealer_odds, games)
+        current, current_odds = measure(dealer_odds, games)
+        diff = max(abs(odds[key] - other[key])
+                   for odds, other in zip(legacy_odds, current_odds)
+                   for key in odds)
+        print(f'{deck_count:>5} ' +
+              ' '.join(f'{"/".join(f"{time:.2f}" for time in times):>20}'
+                       for times in [legacy, current]) + f' {diff:>9.1e}')
+
+
+if __name__ == '__main__':
+    main()
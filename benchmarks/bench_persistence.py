@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+Persistence flush latency: time to save one update - a user plays a round
+and his balance, total and last activity change - with PicklePersistence
+and SQLitePersistence, for different number of users
+
+Run from repository root: python3 benchmarks/bench_persistence.py
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from datetime import datetime
+from os import remove
+from os.path import dirname, exists, getsize, join
+from tempfile import mkdtemp
+from time import perf_counter
+
+from telegram.ext import PicklePersistence
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from persistence import SQLitePersistence  # noqa: E402
+
+
+def make_data(users: int) -> tuple:
+    """ bot_data and user_data for target number of users """
+    now = datetime.today()
+    bot_data = {
+        'users': {user: {'username': f'Player {user}',
+                         'language_code': 'en', 'last_active': now}
+                  for user in range(users)},
+        'total': {user: user % 200 - 100 for user in range(users)}}
+    user_data = {user: {'language': 'en', 'deck_count': 4, 'bet': 2,
+                        'balance': 100, 'in_game': False}
+                 for user in range(users)}
+    return bot_data, user_data
+
+
+def fill(filename: str, bot_data: dict, user_data: dict) -> None:
+    """ Save initial data, as if all these users have played before """
+    persistence = PicklePersistence(filename, single_file=True,
+                                    on_flush=True)
+    persistence.bot_data = bot_data
+    persistence.user_data = defaultdict(dict, user_data)
+    persistence.chat_data = defaultdict(dict)
+    persistence.conversations = {}
+    persistence.flush()
+
+
+def flush_latency(persistence, updates: int, users: int) -> float:
+    """ Average time of saving an update """
+    bot_data = persistence.get_bot_data()
+    user_data = persistence.get_user_data()
+    start = perf_counter()
+    for num in range(updates):
+        user = num * 7919 % users
+        bot_data['users'][user]['last_active'] = datetime.today()
+        bot_data['total'][user] += 2
+        user_data[user]['balance'] += 2
+        # The same calls dispatcher makes after every update
+        persistence.update_bot_data(bot_data)
+        persistence.update_user_data(user, user_data[user])
+    return (perf_counter() - start) / updates
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Persistence benchmark')
+    parser.add_argument('-u', '--users', type=int, nargs='+',
+                        default=[10000, 100000, 1000000],
+                        help='numbers of users')
+    parser.add_argument('-n', '--updates', type=int, default=20,
+                        help='updates to measure')
+    args = parser.parse_args()
+    folder = mkdtemp()
+    print(f'{"users":>8} {"backend":>8} {"flush, ms":>10} {"size, MB":>9}')
+    for users in args.users:
+        bot_data, user_data = make_data(users)
+        pickle_file = join(folder, 'data.pickle')
+        fill(pickle_file, bot_data, user_data)
+        pickle = PicklePersistence(pickle_file, single_file=True)
+        latency = flush_latency(pickle, args.updates, users)
+        print(f'{users:>8} {"pickle":>8} {latency * 1000:>10.2f} '
+              f'{getsize(pickle_file) / 2 ** 20:>9.1f}')
+        db_file = join(folder, 'data.sqlite')
+        fill(pickle_file, bot_data, user_data)
+        SQLitePersistence(db_file).import_pickle(pickle_file)
+        remove(pickle_file)
+        sqlite = SQLitePersistence(db_file)
+        latency = flush_latency(sqlite, args.updates, users)
+        sqlite.flush()
+        print(f'{users:>8} {"sqlite":>8} {latency * 1000:>10.2f} '
+              f'{getsize(db_file) / 2 ** 20:>9.1f}')
+        for filename in (db_file, db_file + '-wal', db_file + '-shm'):
+            if exists(filename):
+                remove(filename)
+
+
+if __name__ == '__main__':
+    main()
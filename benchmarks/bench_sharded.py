@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+"""
+Throughput of the bot as one process and sharded to worker processes,
+against a local fake Bot API server: it gives out games of many users by
+getUpdates and answers every other request after a delay, like a real
+network round-trip. Time is counted from the first update after workers
+are ready to the last answered callback query
+
+Run from repository root: python3 benchmarks/bench_sharded.py
+"""
+
+import sys
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from os import cpu_count
+from os.path import abspath, dirname, join
+from signal import SIGINT
+from subprocess import DEVNULL, Popen
+from tempfile import TemporaryDirectory
+from threading import Condition, Thread
+from time import perf_counter, sleep
+
+ROOT = abspath(join(dirname(__file__), '..'))
+TOKEN = '123:BENCHMARK'
+# Callbacks of every user, again and again
+ACTIONS = ['game', 'hit', 'stand', 'game', 'double', 'bet',
+           'bet.increase', 'bet', 'game', 'stand', 'settings',
+           'settings.rating']
+# Seconds to wait for one run
+TIMEOUT = 600
+
+
+class Updates:
+    """ Updates given out by getUpdates, and answered callback queries """
+    def __init__(self) -> None:
+        self.updates = []
+        self.answered = 0
+        self.started = None
+        self.finished = None
+        self.condition = Condition()
+
+    def add(self, updates: list) -> None:
+        with self.condition:
+            self.updates.extend(updates)
+            self.condition.notify_all()
+
+    def get(self, offset: int, timeout: float) -> list:
+        """ Updates from offset, waits for them up to timeout """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: len(self.updates) > offset, min(timeout, 1))
+            return self.updates[offset:offset + 100]
+
+    def answer(self) -> None:
+        with self.condition:
+            self.answered += 1
+            if self.answered == len(self.updates):
+                self.finished = perf_counter()
+            self.condition.notify_all()
+
+    def wait_answered(self, count: int) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: self.answered >= count,
+                                           TIMEOUT)
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+    """ Bot API answering after a delay """
+    protocol_version = 'HTTP/1.1'
+    delay = 0.03
+    updates = None
+    message_id = 0
+
+    def do_POST(self) -> None:
+        method = self.path.rsplit('/', 1)[-1]
+        data = loads(self.rfile.read(int(self.headers['Content-Length'])))
+        result = True
+        if method == 'getUpdates':
+            # Update ids are their places in the list
+            result = self.updates.get(int(data.get('offset') or 0),
+                                      float(data.get('timeout', 0)))
+        elif method == 'getMe':
+            result = {'id': 123, 'is_bot': True, 'first_name': 'Bench',
+                      'username': 'bench_bot'}
+        else:
+            sleep(self.delay)
+        if method == 'answerCallbackQuery':
+            self.updates.answer()
+        elif method in ['sendMessage', 'editMessageText']:
+            if method == 'sendMessage':
+                FakeAPI.message_id += 1
+            chat_id = int(data['chat_id'])
+            result = {'message_id': int(data.get('message_id',
+                                                 FakeAPI.message_id)),
+                      'date': 0, 'text': data['text'],
+                      'chat': {'id': chat_id, 'type': 'private'}}
+            if 'reply_markup' in data:
+                result['reply_markup'] = loads(data['reply_markup'])
+        body = dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # Bot was stopped while waiting for updates
+            pass
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def make_update(update_id: int, user_id: int, data: str) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Player {user_id}'}
+    return {'update_id': update_id, 'callback_query': {
+        'id': str(update_id), 'from': user, 'chat_instance': '1',
+        'data': data, 'message': {
+            'message_id': 1, 'date': 0,
+            'chat': {'id': user_id, 'type': 'private'}}}}
+
+
+def write_config(directory: str, port: int) -> str:
+    """ Repository config with fake Bot API and files in directory """
+    with open(join(ROOT, 'config.json')) as file:
+        config = loads(file.read())
+    config['base_url'] = f'http://127.0.0.1:{port}/bot'
+    config['token'] = {'bench': TOKEN}
+    config['lang_files'] = {lang: join(ROOT, filename) for lang, filename
+                            in config['lang_files'].items()}
+    config['settings']['strategy_file'] = join(
+        ROOT, config['settings']['strategy_file'])
+    config['persistence']['backend'] = 'sqlite'
+    filename = join(directory, 'config.json')
+    with open(filename, 'w') as file:
+        file.write(dumps(config, indent=2, ensure_ascii=False))
+    return filename
+
+
+def run(workers: int, users: int, rounds: int) -> float:
+    """ Bot handling updates, 0 workers - one process, return: updates/s """
+    updates = Updates()
+    FakeAPI.updates = updates
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAPI)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    with TemporaryDirectory() as directory:
+        config = write_config(directory, server.server_port)
+        if workers:
+            command = [join(ROOT, 'sharded.py'), '-w', str(workers)]
+        else:
+            command = [join(ROOT, 'blackjack_bot.py')]
+        process = Popen([sys.executable] + command +
+                        ['-c', config, '-e', 'bench'], cwd=directory,
+                        stdout=DEVNULL, stderr=DEVNULL)
+        # A game for every worker, so they are all started
+        warmup = max(workers, 1)
+        updates.add([make_update(num, num, 'game')
+                     for num in range(warmup)])
+        if not updates.wait_answered(warmup):
+            sys.exit('Bot did not start')
+        batch = []
+        for num in range(rounds * len(ACTIONS)):
+            for user_id in range(users):
+                batch.append(make_update(warmup + len(batch),
+                                         warmup + user_id,
+                                         ACTIONS[num % len(ACTIONS)]))
+        updates.started = perf_counter()
+        updates.add(batch)
+        if not updates.wait_answered(warmup + len(batch)):
+            sys.exit('Not every update was handled')
+        process.send_signal(SIGINT)
+        process.wait()
+    server.shutdown()
+    server.server_close()
+    return len(batch) / (updates.finished - updates.started)
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Sharded bot benchmark')
+    parser.add_argument('-u', '--users', type=int, default=50,
+                        help='players at the same time')
+    parser.add_argument('-r', '--rounds', type=int, default=1,
+                        help='times every player goes through actions')
+    parser.add_argument('-w', '--workers', type=int, nargs='+',
+                        default=[1, 2, 4], help='worker processes')
+    parser.add_argument('-d', '--delay', type=float, default=30,
+                        help='fake Bot API delay, ms')
+    args = parser.parse_args()
+    FakeAPI.delay = args.delay / 1000
+    print(f'{args.users} users, {args.rounds * len(ACTIONS)} updates each, '
+          f'Bot API delay {args.delay:.0f} ms, {cpu_count()} CPU')
+    print(f'{"bot":>16} {"updates/s":>10}')
+    for workers in [0] + args.workers:
+        name = f'{workers} workers' if workers else 'one process'
+        print(f'{name:>16} {run(workers, args.users, args.rounds):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
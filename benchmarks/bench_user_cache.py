@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+Resident memory with many registered users: every user's data loaded at
+start, as it was, and only recently active users kept in memory. Players
+come mostly from a small active group, with hits, misses and evictions
+
+Run from repository root: python3 benchmarks/bench_user_cache.py -u 1000000
+"""
+
+import sys
+from argparse import SUPPRESS, ArgumentParser
+from datetime import datetime
+from os import remove
+from os.path import dirname, join
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from random import Random
+from sqlite3 import connect
+from subprocess import run
+from tempfile import gettempdir
+from time import perf_counter
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from game import Game  # noqa: E402
+from persistence import SQLitePersistence  # noqa: E402
+from screen import MessageHandle  # noqa: E402
+
+# Different saved games to fill the database with
+SAMPLES = 1000
+
+
+def make_user_data(user_id: int) -> dict:
+    return {'language': 'en', 'deck_count': 4, 'bet': 2, 'balance': 100,
+            'in_game': True, 'game': Game(4, 0.2, 16),
+            'msg_status': MessageHandle(user_id, 1, b'12345678'),
+            'msg_dealer': MessageHandle(user_id, 2, b'12345678'),
+            'msg_player': MessageHandle(user_id, 3, b'12345678',
+                                        b'12345678')}
+
+
+def fill(filename: str, users: int) -> None:
+    """ Database with users' data, like SQLitePersistence writes it """
+    SQLitePersistence(filename)
+    samples = [dumps(make_user_data(num), HIGHEST_PROTOCOL)
+               for num in range(SAMPLES)]
+    db = connect(filename, isolation_level=None)
+    with db:
+        db.execute('BEGIN')
+        db.executemany('INSERT INTO user_data VALUES (?, ?)',
+                       ((user, samples[user % SAMPLES])
+                        for user in range(users)))
+    db.close()
+
+
+def resident_kb() -> int:
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def measure(filename: str, mode: str, users: int, capacity: int,
+            lookups: int) -> None:
+    """ One way of keeping data, in its own process for clean memory """
+    start = resident_kb()
+    started = perf_counter()
+    if mode == 'eager':
+        # As get_user_data was: every user at start
+        db = connect(filename)
+        user_data = {user_id: loads(data) for user_id, data
+                     in db.execute('SELECT user_id, data FROM user_data')}
+        print(f'{"all users":>14}: {resident_kb() - start:>9} KB, '
+              f'loaded in {perf_counter() - started:.1f} s')
+        return
+    if mode == 'bot_data':
+        now = datetime.today()
+        users_section = {user: {'username': f'Player {user}',
+                                'language_code': 'en', 'last_active': now}
+                         for user in range(users)}
+        total = {user: user % 200 - 100 for user in range(users)}
+        print(f'{"bot_data":>14}: {resident_kb() - start:>9} KB '
+              f'(users and total, always in memory)')
+        return users_section, total
+    persistence = SQLitePersistence(filename, cache_users=capacity)
+    user_data = persistence.get_user_data()
+    random = Random(1)
+    active = max(1, users // 100)
+    started = perf_counter()
+    for _ in range(lookups):
+        # 80% of updates come from 1% of users
+        if random.random() < 0.8:
+            user_id = random.randrange(active)
+        else:
+            user_id = random.randrange(users)
+        user_data[user_id]['balance'] += 1
+    took = perf_counter() - started
+    print(f'{"cache " + str(capacity):>14}: {resident_kb() - start:>9} KB, '
+          f'{took / lookups * 10 ** 6:.1f} us per lookup, '
+          f'{persistence.cache_counts}')
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='User data cache benchmark')
+    parser.add_argument('-u', '--users', type=int, default=10 ** 6,
+                        help='registered users')
+    parser.add_argument('-c', '--capacity', type=int, default=10000,
+                        help='users kept in memory')
+    parser.add_argument('-l', '--lookups', type=int, default=200000,
+                        help='updates from users')
+    # Options of measuring processes
+    parser.add_argument('-m', '--mode', help=SUPPRESS)
+    parser.add_argument('-f', '--file', help=SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        measure(args.file, args.mode, args.users, args.capacity,
+                args.lookups)
+        return
+    filename = join(gettempdir(), 'bench_user_cache.sqlite')
+    fill(filename, args.users)
+    print(f'Resident memory with {args.users} users')
+    for mode in ['eager', 'cache', 'bot_data']:
+        run([sys.executable, __file__, '-m', mode, '-f', filename,
+             '-u', str(args.users), '-c', str(args.capacity),
+             '-l', str(args.lookups)], check=True)
+    for suffix in ['', '-wal', '-shm']:
+        try:
+            remove(filename + suffix)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+Bytes per user: pickled size and memory of user's data with game screen
+kept as Message objects, as it was, and as message handles
+
+Run from repository root: python3 benchmarks/bench_user_data.py
+"""
+
+import sys
+from collections import deque
+from datetime import datetime
+from os.path import dirname, join
+from pickle import HIGHEST_PROTOCOL, dumps
+
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from telegram.ext import BasePersistence
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from game import Game  # noqa: E402
+from screen import MessageHandle, make_digest, markup_digest  # noqa: E402
+
+KEYS = ['msg_status', 'msg_dealer', 'msg_player']
+TEXTS = ['\U0001F3B0 Game started, bet: 2', 'Dealer: 10 ♠, ?',
+         'You: A ♥, 7 ♣ - 18']
+
+
+def make_markup() -> InlineKeyboardMarkup:
+    """ Keyboard like the one under player's hand """
+    buttons = ['\U0001F447 Hit', '✋ Stand', '✌ Double',
+               '\U0001F4A1 Hint', '\U0001F4B5 Bet', '⚙ Settings']
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=text[2:].lower())
+         for text in buttons[row:row + 3]] for row in [0, 3]])
+
+
+def make_message(bot: Bot, message_id: int, text: str,
+                 markup: InlineKeyboardMarkup = None) -> Message:
+    """ Message as it comes back from sendMessage """
+    data = {'message_id': message_id, 'date': int(datetime.now().timestamp()),
+            'chat': {'id': 392677870, 'type': 'private',
+                     'first_name': 'Player', 'username': 'player'},
+            'from': {'id': 123, 'is_bot': True, 'first_name': 'Blackjack',
+                     'username': 'blackjack_gamebot'},
+            'text': text}
+    if markup is not None:
+        data['reply_markup'] = markup.to_dict()
+    return Message.de_json(data, bot)
+
+
+def deep_size(value, skip: object) -> int:
+    """ Memory of an object and everything it refers to, except skip """
+    seen = {id(skip)}
+    size = 0
+    todo = deque([value])
+    while todo:
+        item = todo.pop()
+        if id(item) in seen or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            todo.extend(item.keys())
+            todo.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            todo.extend(item)
+        if hasattr(item, '__dict__'):
+            todo.append(vars(item))
+        for slot in getattr(type(item), '__slots__', ()):
+            if hasattr(item, slot):
+                todo.append(getattr(item, slot))
+    return size
+
+
+def main() -> None:
+    bot = Bot('123:BENCHMARK')
+    markup = make_markup()
+    old = {'language': 'en', 'deck_count': 4, 'bet': 2, 'balance': 100,
+           'in_game': True, 'game': Game(4, 0.2, 16), 'shown': {}}
+    for num, (key, text) in enumerate(zip(KEYS, TEXTS), 1):
+        message_markup = markup if key == 'msg_player' else None
+        old[key] = make_message(bot, num, text, message_markup)
+        old['shown'][num] = (make_digest(text), markup_digest(message_markup))
+    new = dict(old)
+    shown = new.pop('shown')
+    for key in KEYS:
+        new[key] = MessageHandle.from_message(old[key], shown)
+    print(f'{"":>16} {"pickled":>8} {"memory":>8}')
+    for name, data in [('messages', old), ('handles', new)]:
+        screen = {key: data[key] for key in KEYS + ['shown'] if key in data}
+        for part, value in [('screen', screen), ('user', data)]:
+            # Persistence replaces bot with a placeholder before pickling
+            pickled = len(dumps(BasePersistence.replace_bot(value),
+                                HIGHEST_PROTOCOL))
+            print(f'{name + " " + part:>16} {pickled:>8} '
+                  f'{deep_size(value, bot):>8}')
+
+
+if __name__ == '__main__':
+    main()
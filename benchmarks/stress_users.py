@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+"""
+Stress test of handling users at the same time: lots of simulated users
+spam game, hit, stand, double, bet and scoreboard callbacks, handled by
+update workers against a local fake Bot API server. Users' data cache
+is just bigger than workers, so users are dropped and loaded again all
+the time. Then it checks that every user's updates were handled in
+order, every balance matches user's total, the scoreboard matches
+totals, and saved data matches memory
+
+Run from repository root: python3 benchmarks/stress_users.py
+"""
+
+import sys
+from argparse import ArgumentParser
+from atexit import register
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+from os import chdir
+from os.path import abspath, dirname, join
+from pickle import loads as unpickle
+from random import Random
+from shutil import rmtree
+from sqlite3 import connect
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+ROOT = abspath(join(dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+TOKEN = '123:STRESS'
+ACTIONS = ['game', 'hit', 'hit', 'stand', 'stand', 'double', 'bet',
+           'bet.increase', 'bet.decrease', 'settings.rating']
+
+
+class FakeAPI(BaseHTTPRequestHandler):
+    """ Bot API answering after a delay """
+    protocol_version = 'HTTP/1.1'
+    delay = 0.005
+    message_id = 0
+    lock = Lock()
+
+    def do_POST(self) -> None:
+        method = self.path.rsplit('/', 1)[-1]
+        data = loads(self.rfile.read(int(self.headers['Content-Length'])))
+        sleep(self.delay)
+        result = True
+        if method in ['sendMessage', 'editMessageText']:
+            with self.lock:
+                FakeAPI.message_id += 1
+                message_id = FakeAPI.message_id
+            result = {'message_id': int(data.get('message_id', message_id)),
+                      'date': 0, 'text': data['text'],
+                      'chat': {'id': int(data['chat_id']),
+                               'type': 'private'}}
+        body = dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def write_config(directory: str, port: int, workers: int,
+                 cache_users: int) -> str:
+    """ Repository config with fake Bot API and files in directory """
+    with open(join(ROOT, 'config.json')) as file:
+        config = loads(file.read())
+    config['base_url'] = f'http://127.0.0.1:{port}/bot'
+    config['token'] = {'stress': TOKEN}
+    config['lang_files'] = {lang: join(ROOT, filename) for lang, filename
+                            in config['lang_files'].items()}
+    config['settings']['strategy_file'] = join(
+        ROOT, config['settings']['strategy_file'])
+    config['settings']['update_workers'] = workers
+    config['persistence']['backend'] = 'sqlite'
+    config['persistence']['cache_users'] = cache_users
+    filename = join(directory, 'config.json')
+    with open(filename, 'w') as file:
+        file.write(dumps(config, indent=2, ensure_ascii=False))
+    return filename
+
+
+def make_updates(users: int, count: int, seed: int) -> list:
+    """ Callbacks of users, mixed, every user starts with a game """
+    random = Random(seed)
+    updates = []
+    for user_id in range(1, users + 1):
+        updates.append((user_id, 'game'))
+    for _ in range(count - users):
+        updates.append((random.randint(1, users), random.choice(ACTIONS)))
+    return [{'update_id': num, 'callback_query': {
+        'id': str(num), 'chat_instance': '1', 'data': data,
+        'from': {'id': user_id, 'is_bot': False,
+                 'first_name': f'Player {user_id}'},
+        'message': {'message_id': 1, 'date': 0,
+                    'chat': {'id': user_id, 'type': 'private'}}}}
+            for num, (user_id, data) in enumerate(updates)]
+
+
+def check(bot, dispatcher, handled: dict, failed: list,
+          db_file: str) -> list:
+    """ Broken invariants, empty if everything is consistent """
+    errors = [f'update {update_id} of user {user_id}: {error!r}'
+              for update_id, user_id, error in failed]
+    for user_id, update_ids in handled.items():
+        if update_ids != sorted(update_ids):
+            errors.append(f'user {user_id}: updates out of order')
+    start = bot.config['defaults']['balance']
+    total = dispatcher.bot_data['total']
+    for user_id in handled:
+        balance = dispatcher.user_data[user_id].get('balance', start)
+        if balance != start + total.get(user_id, 0):
+            errors.append(f'user {user_id}: balance {balance}, total '
+                          f'{total.get(user_id, 0)}')
+    ranked = sorted(total, key=lambda user_id: (-total[user_id], user_id))
+    if len(bot.leaderboard) != len(total):
+        errors.append(f'scoreboard has {len(bot.leaderboard)} users, '
+                      f'total {len(total)}')
+    for place, user_id in enumerate(ranked, 1):
+        if bot.leaderboard.rank(user_id) != place:
+            errors.append(f'user {user_id}: place '
+                          f'{bot.leaderboard.rank(user_id)}, by total '
+                          f'{place}')
+    db = connect(db_file)
+    saved = {user_id: unpickle(data) for user_id, data in db.execute(
+        'SELECT user_id, data FROM user_data')}
+    saved_total = {key: unpickle(data) for key, data in db.execute(
+        "SELECT key, data FROM bot_data WHERE section = 'total'")}
+    db.close()
+    for user_id in handled:
+        balance = dispatcher.user_data[user_id].get('balance', start)
+        if user_id not in saved:
+            errors.append(f'user {user_id}: data is not saved')
+        elif saved[user_id].get('balance', start) != balance:
+            errors.append(f'user {user_id}: saved balance differs')
+    if saved_total != dict(total):
+        errors.append('saved total differs')
+    return errors
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Stress test of update workers')
+    parser.add_argument('-u', '--users', type=int, default=200,
+                        help='simulated users')
+    parser.add_argument('-n', '--updates', type=int, default=5000,
+                        help='callbacks from all users')
+    parser.add_argument('-w', '--workers', type=int, default=8,
+                        help='update workers')
+    parser.add_argument('-c', '--cache-users', type=int,
+                        help='users kept in memory, default and least: '
+                             'workers + 1')
+    parser.add_argument('-d', '--delay', type=float, default=5,
+                        help='fake Bot API delay, ms')
+    parser.add_argument('-s', '--seed', type=int, default=1,
+                        help='seed of users and their actions')
+    args = parser.parse_args()
+    FakeAPI.delay = args.delay / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeAPI)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    # Log, events and database are written in a directory of their own
+    directory = mkdtemp(prefix='stress_users_')
+    errors = []
+
+    def clean() -> None:
+        if not errors:
+            rmtree(directory)
+
+    # Registered first, so it runs after bot's files are written on exit
+    register(clean)
+    cache_users = args.cache_users
+    if cache_users is None:
+        cache_users = args.workers + 1
+    config = write_config(directory, server.server_port, args.workers,
+                          cache_users)
+    chdir(directory)
+    sys.argv = [sys.argv[0], '-c', config, '-e', 'stress']
+    import blackjack_bot as bot
+    api = bot.make_bot(TOKEN)
+    dispatcher = bot.make_dispatcher(api)
+    bot.prepare_dispatcher(dispatcher)
+    handled = {}
+
+    def remember(update: Update, context) -> None:
+        # Runs before game handlers, in the same thread
+        handled.setdefault(update.effective_user.id, []).append(
+            update.update_id)
+
+    dispatcher.add_handler(TypeHandler(Update, remember), group=-1)
+    failed = []
+
+    def fail(update: Update, context) -> None:
+        failed.append((update.update_id, update.effective_user.id,
+                       context.error))
+
+    dispatcher.add_error_handler(fail)
+    updates = [Update.de_json(data, api) for data in
+               make_updates(args.users, args.updates, args.seed)]
+    started = perf_counter()
+    for update in updates:
+        dispatcher.process_update(update)
+    dispatcher.stop()
+    took = perf_counter() - started
+    print(f'{len(updates)} updates of {args.users} users, {args.workers} '
+          f'workers, {cache_users} users in memory: {took:.1f} s, '
+          f'{len(updates) / took:.0f} updates/s, users loaded '
+          f'{dispatcher.user_data.counts["misses"]} times')
+    errors.extend(check(bot, dispatcher, handled, failed,
+                        bot.config['persistence']['db_file']))
+    server.shutdown()
+    for error in errors[:20]:
+        print(error)
+    print(f'{len(errors)} errors, files are in {directory}' if errors
+          else 'balances, scoreboard and saved data are consistent')
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
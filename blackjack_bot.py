@@ -2,19 +2,48 @@
 
 
 from argparse import ArgumentParser
+from atexit import register
 from datetime import datetime
+from functools import lru_cache, partial
+from io import BytesIO
 from json import load
-from logging import INFO, basicConfig, getLogger
-from subprocess import run
+from logging import INFO, Formatter, basicConfig, getLogger
+from os.path import splitext
+from queue import Queue
 from sys import exit
 
 from emoji import emojize
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import (InlineKeyboardButton, InlineKeyboardMarkup, Message,
+                      Update)
 from telegram.error import BadRequest
 from telegram.ext import (CallbackContext, CallbackQueryHandler,
-                          CommandHandler, PicklePersistence, Updater)
+                          CommandHandler, Dispatcher, JobQueue,
+                          PicklePersistence, Updater)
+from telegram.utils.request import Request
 
+from broadcast import Broadcaster
+from catalog import MEDALS, Messages, card_face
+from events import EventWriter
 from game import Game, RoundResult
+from logqueue import BatchFileHandler, BatchListener, RecordQueueHandler
+from logtail import LogBuffer
+from metrics import InstrumentedBot, Metrics
+from odds import CARD_KIND, dealer_odds, make_kind_composition
+from persistence import SQLitePersistence
+from profiler import Profiler
+from rating import Leaderboard
+from scheduler import UserDispatcher
+from screen import MessageHandle, Screen
+from strategy import Strategy
+
+# Built keyboards kept in memory, they are small and often the same
+KEYBOARD_CACHE_SIZE = 4096
+# /profile duration and functions in its result
+PROFILE_SECONDS = 10
+PROFILE_MAX_SECONDS = 600
+PROFILE_LINES = 40
+# user_data keys of game screen messages
+SCREEN_MESSAGES = ['msg_status', 'msg_dealer', 'msg_player', 'msg_screen']
 
 
 def read_json(filename):
@@ -31,7 +60,8 @@ def read_json(filename):
 
 def get_settings() -> tuple:
     """
-    Read command lines arguments, return: specified config and token
+    Read command lines arguments, return: specified config, token and
+    shard number, None if bot is not sharded
     """
     parser = ArgumentParser(
         prog='Blackjack Telegram bot')
@@ -39,11 +69,24 @@ def get_settings() -> tuple:
                         help='config file name')
     parser.add_argument('-e', '--environment', metavar='E',
                         help='environment key')
+    parser.add_argument('-s', '--shard', metavar='S', type=int,
+                        help='shard number, set by sharded.py')
     args = vars(parser.parse_args())
     conf = read_json(args['config'])
     env = args['environment']
     token = conf['token'][env]
-    return conf, token
+    return conf, token, args['shard']
+
+
+def shard_file(name: str) -> str:
+    """
+    File or directory name of this shard, so shards don't write the
+    same files: log.txt - log.1.txt, events - events.1
+    """
+    if shard is None:
+        return name
+    root, ext = splitext(name)
+    return f'{root}.{shard}{ext}'
 
 
 def log_event(update: Update, context: CallbackContext, event) -> None:
@@ -59,21 +102,34 @@ def log_event(update: Update, context: CallbackContext, event) -> None:
     logger.info(log)
 
 
+def emit_event(update: Update, kind: str, **fields) -> None:
+    """ For game event, it's written to events stream in background """
+    game_events.emit(update.effective_user.id, kind, **fields)
+
+
+def emit_shuffle(update: Update, game: Game, seed: int) -> None:
+    """
+    Game event if a new shoe was started while drawing cards, cards
+    after it are the first cursor cards of the new seed's shoe
+    """
+    if game.seed != seed:
+        emit_event(update, 'shuffle', seed=game.seed, cursor=game.cursor)
+
+
 def get_languages(config: dict) -> dict:
-    """ Read languages, return: languages dict """
+    """ Read languages, return: languages dict of message catalogs """
     messages = {}
     for lang in config['lang_files']:
-        messages[lang] = read_json(config['lang_files'][lang])
+        messages[lang] = Messages(read_json(config['lang_files'][lang]))
     return messages
 
 
 def start(update: Update, context: CallbackContext) -> None:
     """ Sends a welcome and also save user """
     language, _ = get_user_settings(context)
-    txt_welcome = messages_txt[language]['txt_welcome']
     markup = get_keyboard(context, True, False, False, False, True)
-    update.message.reply_text(txt_welcome, reply_markup=markup,
-                              parse_mode='HTML')
+    update.message.reply_text(messages_txt[language].txt_welcome,
+                              reply_markup=markup, parse_mode='HTML')
     check_and_save_user(update, context)
     log_event(update, context, 'sent start')
 
@@ -85,41 +141,37 @@ def stop(update: Update, context: CallbackContext) -> None:
     if len(command) == 1 and command[0].lower() == 'yes':
         try:
             # Delete user's message or get an exception
-            _, msg_status, msg_dealer, msg_player = (
-                get_user_game_data(context))
-            msg_status.delete()
-            msg_dealer.delete()
-            msg_player.delete()
+            _, screen_messages = get_user_game_data(context)
+            for handle in screen_messages:
+                context.bot.delete_message(handle.chat_id, handle.message_id)
             lm = 'sent stop with confirmation'
             log_event(update, context, lm)
             # Remove user data
             remove_user(update, context)
-            txt_goodbye = messages_txt[language]['txt_goodbye']
-            update.message.reply_text(txt_goodbye)
+            update.message.reply_text(messages_txt[language].txt_goodbye)
         except KeyError:
-            txt_second_goodbye = messages_txt[language]['txt_second_goodbye']
-            update.message.reply_text(txt_second_goodbye)
+            update.message.reply_text(
+                messages_txt[language].txt_second_goodbye)
             lm = 'sent stop once again'
             log_event(update, context, lm)
     else:
-        txt_stop = messages_txt[language]['txt_stop']
-        update.effective_message.reply_text(txt_stop)
+        update.effective_message.reply_text(messages_txt[language].txt_stop)
         log_event(update, context, 'sent stop')
 
 
 def game(update: Update, context: CallbackContext) -> None:
     """ Handling callback for new or existing game """
     language, deck_count = get_user_settings(context)
-    q_choice = messages_txt[language]['q_choice']
-    b_start = messages_txt[language]['b_start']
-    update.callback_query.answer(' - '.join([q_choice, b_start]))
-    txt_game = ' '.join([emojize(':slot_machine:'),
-                        messages_txt[language]['txt_game_start']])
+    messages = messages_txt[language]
+    update.callback_query.answer(' - '.join([messages.q_choice,
+                                             messages.b_start]))
+    txt_game = messages.txt_game_start_game
     threshold = config['settings']['low_deck_threshold']
     dealer_hit_on = config['settings']['diller_hit_on']
+    single_message = config['settings'].get('single_message', False)
     try:
         # If it works - it's a new game
-        game, msg_status, msg_dealer, msg_player = get_user_game_data(context)
+        game, _ = get_user_game_data(context)
         # If user change deck count - we should make new game for him
         if game.deck_count != deck_count:
             game = Game(deck_count, threshold, dealer_hit_on)
@@ -135,70 +187,80 @@ def game(update: Update, context: CallbackContext) -> None:
         context.user_data['game'] = game
         log_event(update, context, 'first game')
     context.user_data['in_game'] = True
+    # Shoe seed and cursor before the deal, to deal the shoe again for audit
+    seed, cursor = game.deal_shoe
+    emit_event(update, 'deal', deck_count=game.deck_count,
+               player=game.player_hand, dealer=game.dealer_hand[:1],
+               seed=seed, cursor=cursor)
+    emit_shuffle(update, game, seed)
     mtxt_dealer = make_hand_text(game.dealer_hand, True)
     mtxt_player = make_hand_text(game.player_hand, False)
     round_result = game.round_result
     markup = get_keyboard(context, False, True)
-    if round_result.result == 'blackjack' and round_result.winner == 'player':
+    if round_result is RoundResult.PLAYER_BLACKJACK:
         # If player have a blackjack
         context.user_data['in_game'] = False
         markup = get_keyboard(context, True)
         mtxt_dealer = make_hand_text(game.dealer_hand, False)
         txt_game = process_round_result(update, context, round_result)
         log_event(update, context, 'got blackjack')
+    elif config['settings'].get('show_odds', False):
+        txt_game = '\n'.join([txt_game, make_odds_text(game, language)])
     try:
         # For fist game, messed up messages, etc...
-        msg_status.edit_text(txt_game)
-        msg_dealer.edit_text(mtxt_dealer)
-        msg_player.edit_text(mtxt_player, reply_markup=markup)
-    except (BadRequest, UnboundLocalError):
-        msg_status = update.effective_message.reply_text(txt_game)
-        msg_dealer = update.effective_message.reply_text(mtxt_dealer)
-        msg_player = update.effective_message.reply_text(mtxt_player,
-                                                         reply_markup=markup)
+        if is_single_message(context) != single_message:
+            # Screen of the other layout, will be replaced
+            raise KeyError('msg_screen')
+        show_screen(context, txt_game, mtxt_dealer, mtxt_player, markup)
+    except (BadRequest, KeyError):
+        send_screen(update, context, txt_game, mtxt_dealer, mtxt_player,
+                    markup)
         log_event(update, context, 'first game or old keyboard')
-        # Save messages we sent for editing later
-        context.user_data['msg_status'] = msg_status
-        context.user_data['msg_dealer'] = msg_dealer
-        context.user_data['msg_player'] = msg_player
 
 
 def hit(update: Update, context: CallbackContext) -> None:
     """ Handling callback player takes a card """
     language, _ = get_user_settings(context)
-    q_choice = messages_txt[language]['q_choice']
-    b_hit = messages_txt[language]['b_hit']
-    update.callback_query.answer(' - '.join([q_choice, b_hit]))
-    game, msg_status, _, msg_player = get_user_game_data(context)
+    messages = messages_txt[language]
+    update.callback_query.answer(' - '.join([messages.q_choice,
+                                             messages.b_hit]))
+    game, _ = get_user_game_data(context)
     # Give card to player
+    seed = game.seed
     game.hit()
     log_event(update, context, 'take card')
+    emit_event(update, 'hit', player=list(game.player_hand))
+    emit_shuffle(update, game, seed)
     round_result = game.round_result
     mtxt_player = make_hand_text(game.player_hand, False)
+    txt_res = None
     markup = get_keyboard(context)
     # Check for bust or blackjack
     if round_result.result == 'bust' or round_result.result == 'blackjack':
-        msg_status.edit_text(process_round_result(
-            update, context, round_result))
+        txt_res = process_round_result(update, context, round_result)
         context.user_data['in_game'] = False
         markup = get_keyboard(context, True)
-    msg_player.edit_text(mtxt_player, reply_markup=markup)
+    show_screen(context, txt_res, None, mtxt_player, markup)
 
 
 def stand(update: Update, context: CallbackContext, from_double=False) -> None:
     """ Handling callback player stands """
     language, _ = get_user_settings(context)
-    q_choice = messages_txt[language]['q_choice']
-    b_stand = messages_txt[language]['b_stand']
-    update.callback_query.answer(' - '.join([q_choice, b_stand]))
-    game, msg_status, msg_dealer, msg_player = get_user_game_data(context)
+    messages = messages_txt[language]
+    update.callback_query.answer(' - '.join([messages.q_choice,
+                                             messages.b_stand]))
+    game, _ = get_user_game_data(context)
     # Game event - it's dealer's turn now
+    seed = game.seed
     game.stand()
     log_event(update, context, 'stand')
+    if not from_double:
+        emit_event(update, 'stand', player=list(game.player_hand))
+    emit_shuffle(update, game, seed)
     round_result = game.round_result
     mtxt_dealer = make_hand_text(game.dealer_hand, False)
     mtxt_player = make_hand_text(game.player_hand, False)
-    if round_result.result == 'blackjack' and round_result.winner == 'dealer':
+    if round_result is RoundResult.DEALER_BLACKJACK:
         # If dealer have a blackjack - we should show his hand
         mtxt_dealer = make_hand_text(game.dealer_hand, False)
     # If player doubles earlier
@@ -206,40 +268,65 @@ def stand(update: Update, context: CallbackContext, from_double=False) -> None:
         txt_res = process_round_result(update, context, round_result, True)
     else:
         txt_res = process_round_result(update, context, round_result)
-    msg_status.edit_text(txt_res)
     context.user_data['in_game'] = False
     markup = get_keyboard(context, True)
-    msg_dealer.edit_text(mtxt_dealer)
-    msg_player.edit_text(mtxt_player, reply_markup=markup)
+    show_screen(context, txt_res, mtxt_dealer, mtxt_player, markup)
 
 
 def double(update: Update, context: CallbackContext) -> None:
     """ Handling callback player doubles """
     language, _ = get_user_settings(context)
-    q_choice = messages_txt[language]['q_choice']
-    b_double = messages_txt[language]['b_double']
-    update.callback_query.answer(' - '.join([q_choice, b_double]))
-    game, msg_status, _, msg_player = get_user_game_data(context)
+    messages = messages_txt[language]
+    update.callback_query.answer(' - '.join([messages.q_choice,
+                                             messages.b_double]))
+    game, _ = get_user_game_data(context)
     # Giving user a card
+    seed = game.seed
     game.hit()
     log_event(update, context, 'double')
+    emit_event(update, 'double', player=list(game.player_hand))
+    emit_shuffle(update, game, seed)
     round_result = game.round_result
-    mtxt_player = make_hand_text(game.player_hand, False)
-    # Do not remove the keyboard
-    markup = get_keyboard(context, False, True)
-    msg_player.edit_text(mtxt_player, reply_markup=markup)
     # Check that it's not bust
     if round_result.result == 'bust':
         context.user_data['in_game'] = False
+        txt_res = process_round_result(update, context, round_result, True)
+        mtxt_player = make_hand_text(game.player_hand, False)
         markup = get_keyboard(context, True)
-        msg_player.edit_text(mtxt_player, reply_markup=markup)
-        msg_status.edit_text(process_round_result(
-            update, context, round_result, True))
+        show_screen(context, txt_res, None, mtxt_player, markup)
     else:
-        # Now it's dealers' turn
+        # Now it's dealers' turn, player's hand is shown with dealer's
         stand(update, context, True)
 
 
+def hint(update: Update, context: CallbackContext) -> None:
+    """ Handling callback player asks for a hint """
+    language, _ = get_user_settings(context)
+    game = context.user_data['game']
+    if not context.user_data['in_game'] or game.player_score > 21:
+        # For old keyboards
+        update.callback_query.answer()
+        return
+    action = strategy.action(game.deck_count,
+                             config['settings']['diller_hit_on'],
+                             game.player_soft, game.player_score,
+                             CARD_KIND[game.dealer_hand[0][0]],
+                             len(game.player_hand) == 2)
+    b_action = ['b_stand', 'b_hit', 'b_double'][action]
+    b_action = messages_txt[language][b_action]
+    update.callback_query.answer(' - '.join([messages_txt[language].b_hint,
+                                             b_action]))
+    log_event(update, context, f'asks for hint: {b_action}')
+
+
+def hints_available(context: CallbackContext) -> bool:
+    """ If there is a strategy table for user's game """
+    _, deck_count = get_user_settings(context)
+    return (strategy is not None and
+            strategy.supports(deck_count,
+                              config['settings']['diller_hit_on']))
+
+
 def get_keyboard(context: CallbackContext, new_game=False, double=False,
                  bet_set=False, settings=False,
                  start_message=False) -> InlineKeyboardMarkup:
@@ -256,89 +343,116 @@ def get_keyboard(context: CallbackContext, new_game=False, double=False,
     """
     language, deck_count = get_user_settings(context)
     bet, balance = get_user_bet_and_balance(context)
-    # Making first row of keyboard
     if new_game:
-        # For new game
-        b_start = ' '.join([emojize(':game_die:'),
-                            messages_txt[language]['b_start']])
-        keyboard_row_1 = []
-        keyboard_row_1.append(InlineKeyboardButton(b_start,
-                                                   callback_data='game'))
-        keyboard = [keyboard_row_1]
+        layout = 'new_game'
     elif bet_set:
-        # For bet set menu
-        keyboard_row_1 = []
-        keyboard_row_1.append(InlineKeyboardButton(
-            emojize(':downwards_button:'), callback_data='bet.decrease'))
-        keyboard_row_1.append(InlineKeyboardButton(
-            emojize(':upwards_button:'), callback_data='bet.increase'))
+        layout = 'bet_set'
     elif settings:
-        # For settings menu
-        b_rating = ' '.join([emojize(':trophy:'),
-                            messages_txt[language]['b_rating']])
-        b_language = ' '.join([emojize(':input_latin_uppercase:'),
-                              messages_txt[language]['b_language']])
-        b_language_caption = messages_txt[language]['b_language_caption']
-        b_deck_count = ' '.join([emojize(':input_numbers:'),
-                                messages_txt[language]['b_deck_count']])
-        b_reset = ' '.join([emojize(':money_bag:'),
-                            messages_txt[language]['b_reset']])
-        keyboard_row_1 = []
-        keyboard_row_1.append([InlineKeyboardButton(
-            b_rating, callback_data='settings.rating')])
-        keyboard_row_1.append([InlineKeyboardButton(
-            ': '.join([b_language, b_language_caption]),
-            callback_data='settings.language')])
-        keyboard_row_1.append([InlineKeyboardButton(
-            ': '.join([b_deck_count, str(deck_count)]),
-            callback_data='settings.deck_count')])
-        keyboard_row_1.append([InlineKeyboardButton(
-            b_reset, callback_data='settings.balance_reset')])
+        layout = 'settings'
+    elif double:
+        layout = 'double'
     else:
-        # Making ingame buttons
-        b_hit = ' '.join([emojize(':backhand_index_pointing_down:'),
-                         messages_txt[language]['b_hit']])
-        b_stand = ' '.join([emojize(':raised_hand:'),
-                           messages_txt[language]['b_stand']])
-        b_double = ' '.join([emojize(':victory_hand:'),
-                            messages_txt[language]['b_double']])
-        keyboard_row_1 = []
-        keyboard_row_1.append(InlineKeyboardButton(b_hit, callback_data='hit'))
-        keyboard_row_1.append(InlineKeyboardButton(b_stand,
-                                                   callback_data='stand'))
-        if double:
-            keyboard_row_1.append(InlineKeyboardButton(b_double,
-                                                       callback_data='double'))
-    # Making last row of keyboard
-    bet = ' '.join([emojize(':dollar_banknote:'), str(bet),
-                   '[' + str(balance - bet) + ']'])
-    b_settings = ' '.join([emojize(':gear:'),
-                          messages_txt[language]['b_settings']])
-    keyboard_row_2 = []
-    keyboard_row_2.append(InlineKeyboardButton(bet, callback_data='bet'))
-    keyboard_row_2.append(InlineKeyboardButton(b_settings,
-                                               callback_data='settings'))
-    keyboard = [keyboard_row_1, keyboard_row_2]
-    # For very first game
+        layout = 'ingame'
+    hint = layout in ['ingame', 'double'] and hints_available(context)
+    # Only settings menu shows deck count
+    if not settings:
+        deck_count = 0
+    return build_keyboard(language, layout, hint, start_message, bet,
+                          balance - bet, deck_count)
+
+
+def make_keyboard_rows(language: str) -> dict:
+    """ Making static keyboard rows and buttons for language """
+    messages = messages_txt[language]
+    b_hit = InlineKeyboardButton(messages.b_hit_game, callback_data='hit')
+    b_stand = InlineKeyboardButton(messages.b_stand_game,
+                                   callback_data='stand')
+    b_double = InlineKeyboardButton(messages.b_double_game,
+                                    callback_data='double')
+    b_language = ': '.join([messages.b_language_game,
+                            messages.b_language_caption])
+    rows = {
+        'new_game': (InlineKeyboardButton(messages.b_start_game,
+                                          callback_data='game'),),
+        'bet_set': (
+            InlineKeyboardButton(emojize(':downwards_button:'),
+                                 callback_data='bet.decrease'),
+            InlineKeyboardButton(emojize(':upwards_button:'),
+                                 callback_data='bet.increase')),
+        'ingame': (b_hit, b_stand),
+        'double': (b_hit, b_stand, b_double),
+        'hint': InlineKeyboardButton(messages.b_hint_game,
+                                     callback_data='hint'),
+        'rating': (InlineKeyboardButton(messages.b_rating_game,
+                                        callback_data='settings.rating'),),
+        'language': (InlineKeyboardButton(
+            b_language, callback_data='settings.language'),),
+        'reset': (InlineKeyboardButton(
+            messages.b_reset_game, callback_data='settings.balance_reset'),),
+        'settings': InlineKeyboardButton(messages.b_settings_game,
+                                         callback_data='settings')
+    }
+    return rows
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def build_keyboard(language: str, layout: str, hint: bool,
+                   start_message: bool, bet: int, free_balance: int,
+                   deck_count: int) -> InlineKeyboardMarkup:
+    """
+    Making keyboard from static rows with variable buttons:
+    bet with balance and deck count
+    """
+    rows = keyboard_rows[language]
+    keyboard_row_1 = rows[layout]
+    if hint:
+        keyboard_row_1 = keyboard_row_1 + (rows['hint'],)
     if start_message:
-        keyboard = [keyboard_row_1]
-    # Different layout for settings menu
-    if settings:
-        keyboard = keyboard_row_1 + [keyboard_row_2]
-    markup = InlineKeyboardMarkup(keyboard)
-    return markup
+        # For very first game
+        return InlineKeyboardMarkup([keyboard_row_1])
+    b_bet = ' '.join([emojize(':dollar_banknote:'), str(bet),
+                     '[' + str(free_balance) + ']'])
+    keyboard_row_2 = (InlineKeyboardButton(b_bet, callback_data='bet'),
+                      rows['settings'])
+    if layout == 'settings':
+        # Different layout for settings menu
+        b_deck_count = ': '.join([messages_txt[language].b_deck_count_game,
+                                 str(deck_count)])
+        keyboard = [rows['rating'], rows['language'],
+                    (InlineKeyboardButton(
+                        b_deck_count, callback_data='settings.deck_count'),),
+                    rows['reset'], keyboard_row_2]
+    else:
+        keyboard = [keyboard_row_1, keyboard_row_2]
+    return InlineKeyboardMarkup(keyboard)
 
 
 def make_hand_text(hand: list, hidden: bool) -> str:
     """ Returns hand text """
-    text = ''
-    for num, card in enumerate(hand):
-        if hidden and num > 0:
-            text = text
-        else:
-            text = text + str(card[0]) + ' ' + card[1] + '  '
-    # Remove of space in the end
-    return text.strip()
+    if hidden:
+        hand = hand[:1]
+    return '  '.join([card_face(card) for card in hand])
+
+
+def make_odds_text(game: Game, language: str) -> str:
+    """ Returns dealer's odds text, as player sees them """
+    counts = list(make_kind_composition(game.shoe_counts))
+    # Player doesn't know the hole card, for him it's still in the shoe.
+    # Unless the shoe was started after it, then the shoe has all cards
+    drawn_after = len(game.dealer_hand) + len(game.player_hand) - 3
+    if game.cursor > drawn_after:
+        counts[CARD_KIND[game.dealer_hand[1][0]]] += 1
+    odds = dealer_odds(CARD_KIND[game.dealer_hand[0][0]], tuple(counts),
+                       config['settings']['diller_hit_on'])
+    messages = messages_txt[language]
+    odds_text = []
+    for score, odd in odds.items():
+        if score == 'blackjack':
+            score = messages.txt_blackjack
+        elif score == 'bust':
+            score = messages.txt_bust
+        odds_text.append(f'{score} - {odd:.0%}')
+    return ': '.join([messages.txt_odds, ', '.join(odds_text)])
 
 
 def process_round_result(update: Update, context: CallbackContext,
@@ -352,32 +466,28 @@ def process_round_result(update: Update, context: CallbackContext,
     bet = org_bet
     if double:
         bet = bet * 2
-    txt_win = messages_txt[language]['txt_win']
-    txt_lose = messages_txt[language]['txt_lose']
-    txt_blackjack = messages_txt[language]['txt_blackjack']
-    txt_bust = messages_txt[language]['txt_bust']
-    txt_tie = messages_txt[language]['txt_tie']
+    messages = messages_txt[language]
     # Only for log - player don't see this
     txt_forfeit = 'forfeit'
     state_text = []
     if result.result == 'tie':
-        state_text.append(' '.join([emojize(':raised_fist:'), txt_tie]))
+        state_text.append(messages.txt_tie_game)
     else:
         if result.winner == 'player':
-            state_text.append(' '.join([emojize(':thumbs_up:'), txt_win]))
+            state_text.append(messages.txt_win_game)
             if result.result == 'blackjack':
-                state_text.append(txt_blackjack)
+                state_text.append(messages.txt_blackjack)
                 bet = int(bet * 1.5)
             elif result.result == 'bust':
-                state_text.append(txt_bust)
+                state_text.append(messages.txt_bust)
             balance = balance + bet
             update_total(update, context, bet)
         elif result.winner == 'dealer':
-            state_text.append(' '.join([emojize(':thumbs_down:'), txt_lose]))
+            state_text.append(messages.txt_lose_game)
             if result.result == 'blackjack':
-                state_text.append(txt_blackjack)
+                state_text.append(messages.txt_blackjack)
             elif result.result == 'bust':
-                state_text.append(txt_bust)
+                state_text.append(messages.txt_bust)
             elif result.result == 'forfeit':
                 # Only for log - player don't see this
                 state_text.append(txt_forfeit)
@@ -389,6 +499,10 @@ def process_round_result(update: Update, context: CallbackContext,
     else:
         state_text = ' - '.join(state_text)
     log_event(update, context, f'{state_text}, bet: {bet}')
+    game = context.user_data['game']
+    emit_event(update, 'round', result=result.result, winner=result.winner,
+               bet=bet, double=double, balance=balance,
+               player=list(game.player_hand), dealer=list(game.dealer_hand))
     return state_text
 
 
@@ -397,138 +511,103 @@ def bet(update: Update, context: CallbackContext) -> None:
     data = update.callback_query.data
     bet, balance = get_user_bet_and_balance(context)
     language, _ = get_user_settings(context)
-    _, msg_status, msg_dealer, msg_player = get_user_game_data(context)
-    q_choice = messages_txt[language]['q_choice']
-    q_bet_increase = messages_txt[language]['q_bet_increase']
-    q_bet_decrease = messages_txt[language]['q_bet_decrease']
-    q_bet_confirm = messages_txt[language]['q_bet_confirm']
-    q_bet_warn = messages_txt[language]['q_bet_warn']
-    txt_m_bet_title = messages_txt[language]['txt_m_bet_title']
-    txt_m_bet_game = ' '.join([emojize(':dollar_banknote:'),
-                               txt_m_bet_title])
-    txt_m_bet_hint = ' '.join([messages_txt[language]['txt_m_bet_hint'] +
-                               ':', str(config['settings']['min_bet']), '-',
-                               str(config['settings']['max_bet'])])
-    txt_m_bet_title_confirm = messages_txt[language]['txt_m_bet_title_confirm']
-    txt_m_bet_title_confirm_game = ' '.join([emojize(':check_mark_button:'),
-                                            txt_m_bet_title_confirm])
-    txt_m_goodluck = messages_txt[language]['txt_m_goodluck']
-    txt_m_bet = messages_txt[language]['txt_m_bet']
-    txt_bet_value = ': '.join([txt_m_bet, str(bet)])
+    # Only users with a game have the menu
+    get_user_game_data(context)
+    messages = messages_txt[language]
     markup = get_keyboard(context, False, False, True)
     # Player lose bet if game is active
     if context.user_data['in_game']:
         context.user_data['in_game'] = False
-        result = RoundResult
-        result.result = 'forfeit'
-        result.winner = 'dealer'
-        process_round_result(update, context, result)
+        process_round_result(update, context, RoundResult.FORFEIT)
+        # Forfeit is taken from balance, bet menu saves it below
+        bet, balance = get_user_bet_and_balance(context)
     if data == 'bet':
         # Try to figure are we open or close that menu
         user_in_menu = context.user_data.get('is_in_bet_menu', True)
         # If player go from one menu to another
         context.user_data['is_in_settings_menu'] = True
         if user_in_menu:
-            update.callback_query.answer(' - '.join([q_choice,
-                                                    txt_m_bet_title]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.txt_m_bet_title]))
             context.user_data['is_in_bet_menu'] = False
-            msg_status.edit_text(txt_m_bet_game)
-            msg_dealer.edit_text(txt_m_bet_hint)
-            msg_player.edit_text(txt_bet_value, reply_markup=markup)
+            txt_m_bet_hint = ' '.join([
+                messages.txt_m_bet_hint + ':',
+                str(config['settings']['min_bet']), '-',
+                str(config['settings']['max_bet'])])
+            txt_bet_value = ': '.join([messages.txt_m_bet, str(bet)])
+            show_screen(context, messages.txt_m_bet_title_game,
+                        txt_m_bet_hint, txt_bet_value, markup)
             log_event(update, context, 'opens bet set menu')
         else:
-            update.callback_query.answer(' - '.join([q_choice, q_bet_confirm]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.q_bet_confirm]))
             context.user_data['is_in_bet_menu'] = True
-            msg_status.edit_text(txt_m_bet_title_confirm_game)
-            msg_dealer.edit_text(txt_m_goodluck)
             context.user_data['in_game'] = False
             markup = get_keyboard(context, True)
-            msg_player.edit_reply_markup(markup)
+            show_screen(context, messages.txt_m_bet_title_confirm_game,
+                        messages.txt_m_goodluck, None, markup)
             log_event(update, context, 'exits bet set menu')
     else:
         # For menu buttons
         bet_action = data.split('.')[1]
         if bet_action == 'increase' and bet < config['settings']['max_bet']:
             bet = bet + 2
-            update.callback_query.answer(' - '.join([q_choice,
-                                                     q_bet_increase]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.q_bet_increase]))
             log_event(update, context, f'increased bet: {bet}')
+            emit_event(update, 'bet', bet=bet)
         elif bet_action == 'decrease' and bet > config['settings']['min_bet']:
             bet = bet - 2
-            update.callback_query.answer(' - '.join([q_choice,
-                                                     q_bet_decrease]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.q_bet_decrease]))
             log_event(update, context, f'decreased bet: {bet}')
+            emit_event(update, 'bet', bet=bet)
         else:
-            update.callback_query.answer(q_bet_warn)
+            update.callback_query.answer(messages.q_bet_warn)
             log_event(update, context, 'get to bet limit')
         set_user_bet_and_balance(context, bet, balance)
-        txt_bet = ': '.join([txt_m_bet, str(bet)])
+        txt_bet = ': '.join([messages.txt_m_bet, str(bet)])
         markup = get_keyboard(context, False, False, True)
-        try:
-            msg_player.edit_text(txt_bet, reply_markup=markup)
-        except BadRequest:
-            # For playes keep pressing buttons after limit
-            pass
+        show_screen(context, None, None, txt_bet, markup)
 
 
 def settings(update: Update, context: CallbackContext) -> None:
     """ Handling callback for settings menu """
     data = update.callback_query.data
     language, deck_count = get_user_settings(context)
-    _, msg_status, msg_dealer, msg_player = get_user_game_data(context)
-    q_choice = messages_txt[language]['q_choice']
-    q_sett_confirm = messages_txt[language]['q_sett_confirm']
-    q_sett_lang = messages_txt[language]['q_sett_lang']
-    q_sett_deck_c = messages_txt[language]['q_sett_deck_c']
-    q_sett_bal_reset = messages_txt[language]['q_sett_bal_reset']
-    txt_m_sett_title = messages_txt[language]['txt_m_sett_title']
-    txt_m_sett_title_game = ' '.join([emojize(':gear:'), txt_m_sett_title])
-    txt_m_sett_hint = messages_txt[language]['txt_m_sett_hint']
-    txt_m_sett_title_confirm = (
-        messages_txt[language]['txt_m_sett_title_confirm'])
-    txt_m_sett_title_confirm_game = ' '.join([emojize(':check_mark_button:'),
-                                             txt_m_sett_title_confirm])
-    txt_m_goodluck = messages_txt[language]['txt_m_goodluck']
-    txt_m_sett_b_reset = messages_txt[language]['txt_m_sett_b_reset']
-    txt_m_place = messages_txt[language]['txt_m_place']
-    txt_m_from = messages_txt[language]['txt_m_from']
-    b_deck_count = messages_txt[language]['b_deck_count']
-    b_rating = messages_txt[language]['b_rating']
-    b_rating_game = ' '.join([emojize(':trophy:'), b_rating])
+    # Only users with a game have the menu
+    get_user_game_data(context)
+    messages = messages_txt[language]
     markup = get_keyboard(context, False, False, False, True)
     # Player lose bet if game is active
     if context.user_data['in_game']:
         context.user_data['in_game'] = False
-        result = RoundResult
-        result.result = 'forfeit'
-        result.winner = 'dealer'
-        process_round_result(update, context, result)
+        process_round_result(update, context, RoundResult.FORFEIT)
     if data == 'settings':
         # Try to figure are we open or close that menu
         user_in_menu = context.user_data.get('is_in_settings_menu', True)
         # If player go from one menu to another
         context.user_data['is_in_bet_menu'] = True
         if user_in_menu:
-            update.callback_query.answer(' - '.join([q_choice,
-                                                    txt_m_sett_title]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.txt_m_sett_title]))
             context.user_data['is_in_settings_menu'] = False
-            msg_status.edit_text(txt_m_sett_title_game)
-            msg_dealer.edit_text(txt_m_sett_hint)
-            msg_player.edit_text('---', reply_markup=markup)
+            show_screen(context, messages.txt_m_sett_title_game,
+                        messages.txt_m_sett_hint, '---', markup)
             log_event(update, context, 'opens settings menu')
         else:
-            update.callback_query.answer(' - '.join([q_choice,
-                                                    q_sett_confirm]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.q_sett_confirm]))
             context.user_data['is_in_settings_menu'] = True
-            msg_status.edit_text(txt_m_sett_title_confirm_game)
-            msg_dealer.edit_text(txt_m_goodluck)
             context.user_data['in_game'] = False
             markup = get_keyboard(context, True)
-            msg_player.edit_reply_markup(markup)
+            show_screen(context, messages.txt_m_sett_title_confirm_game,
+                        messages.txt_m_goodluck, None, markup)
             log_event(update, context, 'exits settings menu')
     else:
         # For menu buttons
         setting = data.split('.')[1]
+        txt_status = txt_dealer = txt_player = None
         if setting == 'language':
             language_codes = list(config['lang_files'].keys())
             language_count = len(language_codes)
@@ -542,18 +621,15 @@ def settings(update: Update, context: CallbackContext) -> None:
             context.user_data['language'] = language
             # Get new language for callback query answer
             language, _ = get_user_settings(context)
-            b_language = messages_txt[language]['b_language']
-            b_language_caption = messages_txt[language]['b_language_caption']
-            txt_lang = ': '.join([b_language, b_language_caption])
-            txt_m_sett_title = messages_txt[language]['txt_m_sett_title']
-            txt_m_sett_title_game = ' '.join([emojize(':gear:'),
-                                              txt_m_sett_title])
-            q_choice = messages_txt[language]['q_choice']
-            q_sett_lang = messages_txt[language]['q_sett_lang']
-            update.callback_query.answer(' - '.join([q_choice, q_sett_lang]))
-            msg_status.edit_text(txt_m_sett_title_game)
-            msg_dealer.edit_text(txt_lang)
+            messages = messages_txt[language]
+            txt_lang = ': '.join([messages.b_language,
+                                  messages.b_language_caption])
+            update.callback_query.answer(' - '.join([messages.q_choice,
+                                                    messages.q_sett_lang]))
+            txt_status = messages.txt_m_sett_title_game
+            txt_dealer = txt_lang
             log_event(update, context, f'changes language: {language}')
+            emit_event(update, 'setting', name='language', value=language)
         elif setting == 'deck_count':
             if deck_count < 8:
                 context.user_data['deck_count'] = deck_count + 1
@@ -561,47 +637,37 @@ def settings(update: Update, context: CallbackContext) -> None:
                 context.user_data['deck_count'] = 1
             # Get deck count for proper visualisation
             _, deck_count = get_user_settings(context)
-            txt_deck_count = ': '.join([b_deck_count, str(deck_count)])
-            update.callback_query.answer(' - '.join([q_choice, q_sett_deck_c]))
-            msg_dealer.edit_text(txt_deck_count)
+            txt_dealer = ': '.join([messages.b_deck_count, str(deck_count)])
+            update.callback_query.answer(' - '.join([messages.q_choice,
+                                                    messages.q_sett_deck_c]))
             lm = f'changed deck count: {deck_count}'
+            emit_event(update, 'setting', name='deck_count',
+                       value=deck_count)
             log_event(update, context, lm)
         elif setting == 'balance_reset':
             # We can erase it - there will be defaults
             context.user_data.pop('bet', None)
             context.user_data.pop('balance', None)
-            update.callback_query.answer(' - '.join([q_choice,
-                                                    q_sett_bal_reset]))
+            update.callback_query.answer(' - '.join([
+                messages.q_choice, messages.q_sett_bal_reset]))
             log_event(update, context, 'resets balance')
-            try:
-                # For players keep pressing button
-                msg_dealer.edit_text(txt_m_sett_b_reset)
-            except BadRequest:
-                pass
+            emit_event(update, 'setting', name='balance_reset',
+                       value=config['defaults']['balance'])
+            txt_dealer = messages.txt_m_sett_b_reset
         elif setting == 'rating':
-            update.callback_query.answer(' - '.join([q_choice,
-                                                    b_rating]))
+            update.callback_query.answer(' - '.join([messages.q_choice,
+                                                    messages.b_rating]))
             txt_rating = make_rating_text(context)
-            txt_rating = b_rating_game + 2 * '\n' + txt_rating
+            txt_dealer = messages.b_rating_game + 2 * '\n' + txt_rating
             user_id = update.effective_user.id
-            place = context.bot_data['rating'][user_id]['place']
-            places_total = context.bot_data['rating'][user_id]['places_total']
-            txt_user_rating = ' '.join([txt_m_place + ':', str(place),
-                                       txt_m_from, str(places_total)])
+            place = leaderboard.rank(user_id) or '-'
+            places_total = len(leaderboard)
+            txt_player = ' '.join([messages.txt_m_place + ':', str(place),
+                                   messages.txt_m_from, str(places_total)])
             log_event(update, context, 'asks for rating')
-            try:
-                # For players keep pressing button
-                msg_dealer.edit_text(txt_rating)
-                # Do not remove keyboard for smoooth visualisation
-                msg_player.edit_text(txt_user_rating, reply_markup=markup)
-            except BadRequest:
-                pass
+        # Keyboard shows changed settings
         markup = get_keyboard(context, False, False, False, True)
-        try:
-            msg_player.edit_reply_markup(markup)
-        except BadRequest:
-            # For players keep pressing button
-            pass
+        show_screen(context, txt_status, txt_dealer, txt_player, markup)
 
 
 def get_user_settings(context: CallbackContext) -> tuple:
@@ -640,46 +706,46 @@ def update_total(update: Update, context: CallbackContext, delta: int) -> None:
     total = context.bot_data['total']
     # If it's very first entry for user
     total[user_id] = total.get(user_id, 0) + delta
+    leaderboard.update(user_id, total[user_id])
+
+
+def shared_section(context: CallbackContext, section: str) -> dict:
+    """
+    bot_data section, with users of other shards if bot is sharded
+    """
+    if shard is None:
+        # Copy, handlers of other users could add entries while it's read
+        return dict(context.bot_data.get(section, {}))
+    return datafile.read_section(section)
+
+
+def get_username(context: CallbackContext, user_id: int) -> str:
+    """ User's name, users of other shards are read from database """
+    users = context.bot_data['users']
+    if user_id in users or shard is None:
+        return users[user_id]['username']
+    return datafile.read_entry('users', user_id)['username']
 
 
 def make_rating_text(context: CallbackContext) -> str:
     """ Make scoreboard text, return this text """
-    users = context.bot_data['users']
-    total = context.bot_data['total']
-    board = []
-    for item in total:
-        board.append((users[item]['username'], total[item], item))
-    board.sort(key=lambda tup: tup[1], reverse=True)
-    places_total = len(board)
-    # If it's very first entry
-    context.bot_data['rating'] = context.bot_data.get('rating', {})
-    board_txt = ''
-    for num, board_entry in enumerate(board):
-        # Let's count like humans do
-        num += 1
-        username, score, chat_id = board_entry
-        # If it's very first entry for user
-        context.bot_data['rating'][chat_id] = (
-            context.bot_data['rating'].get(chat_id, {}))
-        user_rating = context.bot_data['rating']
-        user_rating[chat_id]['place'] = num
-        user_rating[chat_id]['places_total'] = places_total
-        # Limit the top
-        if num <= config['settings']['rating_places']:
-            if num == 1:
-                num = emojize(':1st_place_medal:')
-            elif num == 2:
-                num = emojize(':2nd_place_medal:')
-            elif num == 3:
-                num = emojize(':3rd_place_medal:')
+    def render(top: list) -> str:
+        board_txt = ''
+        for num, board_entry in enumerate(top):
+            # Let's count like humans do
+            num += 1
+            chat_id, score = board_entry
+            username = get_username(context, chat_id)
+            if num <= len(MEDALS):
+                num = MEDALS[num - 1]
             else:
                 num = f'{num:02d} '
             board_txt = board_txt + ' '.join([num, username, ' ',
                                              str(score)]) + '\n'
-        else:
-            pass
-    # Remove space in the end
-    return board_txt.split()
+        # Remove space in the end
+        return board_txt.strip()
+
+    return leaderboard.top(render)
 
 
 def get_user_game_data(context: CallbackContext) -> tuple:
@@ -687,15 +753,99 @@ def get_user_game_data(context: CallbackContext) -> tuple:
     Get user's game state
 
     Returns:
-        msg_status - first message,
-        msg_dealer - middle message,
-        msg_player - last message
+        game - user's game,
+        screen_messages - status, dealer and player messages, or the only
+            message of single message layout
      """
     game = context.user_data['game']
+    if is_single_message(context):
+        return game, (context.user_data['msg_screen'],)
     msg_status = context.user_data['msg_status']
     msg_dealer = context.user_data['msg_dealer']
     msg_player = context.user_data['msg_player']
-    return game, msg_status, msg_dealer, msg_player
+    return game, (msg_status, msg_dealer, msg_player)
+
+
+def is_single_message(context: CallbackContext) -> bool:
+    """ If user's game screen is a single message """
+    return 'msg_screen' in context.user_data
+
+
+def make_screen_text(screen: list) -> str:
+    """ Single message text from status, dealer and player texts """
+    return '\n\n'.join(screen)
+
+
+def show_screen(context: CallbackContext, status: str, dealer: str,
+                player: str, markup: InlineKeyboardMarkup) -> None:
+    """
+    Edit game screen, parts set to None are left as they are
+
+    Three messages layout edits only changed messages, at the same time
+    with edit workers, single message layout edits its message once.
+    Edits that change nothing are skipped
+    """
+    _, screen_messages = get_user_game_data(context)
+    if is_single_message(context):
+        screen = context.user_data['screen']
+        for num, text in enumerate([status, dealer, player]):
+            if text is not None:
+                screen[num] = text
+        game_screen.edit_text(context.bot, screen_messages[0],
+                              make_screen_text(screen), markup)
+        return
+    msg_status, msg_dealer, msg_player = screen_messages
+    edits = []
+    if status is not None:
+        edits.append(partial(game_screen.edit_text, context.bot, msg_status,
+                             status))
+    if dealer is not None:
+        edits.append(partial(game_screen.edit_text, context.bot, msg_dealer,
+                             dealer))
+    if player is not None:
+        edits.append(partial(game_screen.edit_text, context.bot, msg_player,
+                             player, markup))
+    else:
+        edits.append(partial(game_screen.edit_reply_markup, context.bot,
+                             msg_player, markup))
+    # Messages are independent, their edits could go at the same time
+    game_screen.run(edits)
+
+
+def send_screen(update: Update, context: CallbackContext, status: str,
+                dealer: str, player: str,
+                markup: InlineKeyboardMarkup) -> None:
+    """ Send new game screen in layout from config, for editing later """
+    for key in SCREEN_MESSAGES + ['screen']:
+        context.user_data.pop(key, None)
+
+    def send(key: str, text: str, markup=None) -> None:
+        message = update.effective_message.reply_text(text,
+                                                      reply_markup=markup)
+        context.user_data[key] = game_screen.remember(message, text, markup)
+
+    if config['settings'].get('single_message', False):
+        screen = [status, dealer, player]
+        context.user_data['screen'] = screen
+        send('msg_screen', make_screen_text(screen), markup)
+    else:
+        send('msg_status', status)
+        send('msg_dealer', dealer)
+        send('msg_player', player, markup)
+
+
+def migrate_user_data(user_data: dict) -> bool:
+    """
+    Replace game screen Message objects, saved before handles, with
+    handles, return: if there were any
+    """
+    shown = user_data.pop('shown', {})
+    migrated = False
+    for key in SCREEN_MESSAGES:
+        if isinstance(user_data.get(key), Message):
+            user_data[key] = MessageHandle.from_message(user_data[key], shown)
+            migrated = True
+    return migrated
 
 
 def check_and_save_user(update: Update, context: CallbackContext) -> None:
@@ -724,6 +874,7 @@ def remove_user(update: Update, context: CallbackContext) -> None:
     # Remove user from user rating and mail list
     for d in context.bot_data:
         context.bot_data[d].pop(user_id, None)
+    leaderboard.remove(user_id)
     log_event(update, context, f'removed user: {user_id}')
 
 
@@ -740,29 +891,20 @@ def announce(update: Update, context: CallbackContext) -> None:
             command = context.args
             lang_code = None
             # If command was with language code
-            if command[0].lower() == 'ru' or command[0].lower() == 'en':
+            if command[0].lower() in config['lang_files']:
                 lang_code = command[0].lower()
                 command.pop(0)
             msg = ' '.join(command)
-            users = context.bot_data['users']
-            count = 0
-            for user in users:
-                # If command was with language code
-                if lang_code is not None:
-                    lm = f'sent announce for language {lang_code}'
-                    log_event(update, context, lm)
-                    if users[user]['language_code'] == lang_code:
-                        update.effective_message.bot.send_message(
-                            chat_id=user, text=msg)
-                else:
-                    lm = 'sent announce for all'
-                    log_event(update, context, lm)
-                    update.effective_message.bot.send_message(
-                        chat_id=user, text=msg)
-                count += 1
-                lm = (f'sent message "{msg}" to user {user},' +
-                      f' total sent {count} messages')
-                log_event(update, context, lm)
+            users = shared_section(context, 'users')
+            chat_ids = [user for user in users if lang_code is None or
+                        users[user]['language_code'] == lang_code]
+            # Sent in background, owner gets a summary when it's done
+            place = broadcaster.add(msg, chat_ids, config['owner_id'])
+            update.message.reply_text(f'Announce for {len(chat_ids)} users '
+                                      f'is queued, place in queue: {place}')
+            lm = (f'sent announce "{msg}" for '
+                  f'{lang_code or "all"}, {len(chat_ids)} users')
+            log_event(update, context, lm)
 
 
 def logs(update: Update, context: CallbackContext) -> None:
@@ -771,19 +913,20 @@ def logs(update: Update, context: CallbackContext) -> None:
         lm = "sent logs, but it's a secret command!"
         log_event(update, context, lm)
     else:
+        log_count = config['logging']['log_length']
         if len(context.args) == 0:
-            log_count = str(config['logging']['log_length'])
             lm = f'sent logs without arguments, {log_count} taken'
             log_event(update, context, lm)
-        elif len(context.args) == 1:
-            log_count = context.args[0]
+        elif len(context.args) == 1 and context.args[0].isdigit():
+            log_count = int(context.args[0])
             log_event(update, context, f'sent logs with {log_count} lentg')
         else:
-            lm = 'sent logs with improper arguments'
+            lm = f'sent logs with improper arguments, {log_count} taken'
             log_event(update, context, lm)
-        result = run(['tail', '-n', log_count, log_file],
-                     capture_output=True, universal_newlines=True)
-        log = result.stdout
+        log = log_buffer.tail(log_count)
+        if not log:
+            # Telegram doesn't send empty messages
+            return
         if len(log) > 4096:
             for x in range(0, len(log), 4096):
                 update.message.reply_text(log[x:x+4096])
@@ -797,12 +940,13 @@ def usersinfo(update: Update, context: CallbackContext) -> None:
         lm = "sent users, but it's a secret command!"
         log_event(update, context, lm)
     else:
-        users = context.bot_data['users']
+        users = shared_section(context, 'users')
+        totals = shared_section(context, 'total')
         playersinfo = []
         for user in users:
             try:
-                place = str(context.bot_data['rating'][user]['place'])
-                total = str(context.bot_data['total'][user])
+                place = str(leaderboard.rank(user) or '-')
+                total = str(totals[user])
             except KeyError:
                 place = '-'
                 total = '-'
@@ -829,42 +973,266 @@ def usersinfo(update: Update, context: CallbackContext) -> None:
         log_event(update, context, 'sent users')
 
 
-def main(token: str) -> None:
-    """ Start a bot with handlers """
-    updater = Updater(token, persistence=datafile)
-    dispatcher = updater.dispatcher
-    dispatcher.add_handler(CommandHandler('start', start))
-    dispatcher.add_handler(CommandHandler('stop', stop, pass_args=True))
+def stats(update: Update, context: CallbackContext) -> None:
+    """ Secret command for getting handlers and Bot API latency """
+    if update.effective_message.chat_id != config['owner_id']:
+        lm = "sent stats, but it's a secret command!"
+        log_event(update, context, lm)
+    else:
+        text = metrics.summary()
+        if isinstance(datafile, SQLitePersistence):
+            text += f'\nuser data cache: {datafile.cache_counts}'
+        for x in range(0, len(text), 4096):
+            update.message.reply_text(text[x:x+4096])
+        log_event(update, context, 'sent stats')
+
+
+def profile(update: Update, context: CallbackContext) -> None:
+    """ Secret command for profiling handlers for n seconds """
+    if update.effective_message.chat_id != config['owner_id']:
+        lm = "sent profile, but it's a secret command!"
+        log_event(update, context, lm)
+    else:
+        seconds = PROFILE_SECONDS
+        if len(context.args) == 1 and context.args[0].isdigit():
+            seconds = min(int(context.args[0]), PROFILE_MAX_SECONDS)
+        if not profiler.start():
+            update.message.reply_text('Profiler is already running')
+            return
+        context.job_queue.run_once(send_profile, seconds,
+                                   context=update.effective_message.chat_id)
+        update.message.reply_text(f'Profiling handlers for {seconds} '
+                                  'seconds')
+        log_event(update, context, f'started profile for {seconds} seconds')
+
+
+def send_profile(context: CallbackContext) -> None:
+    """ Stop profiler and send its result to owner """
+    result = profiler.stop(PROFILE_LINES)
+    if not result:
+        context.bot.send_message(context.job.context,
+                                 'No updates were handled')
+        return
+    context.bot.send_document(context.job.context,
+                              BytesIO(result.encode()),
+                              filename='profile.txt')
+
+
+def timed(handler):
+    """
+    Handler with its time in metrics, profiled while /profile works
+    """
+    return profiler.wrap(metrics.timed('bot_handler_seconds', handler,
+                                       handler=handler.__name__))
+
+
+def make_bot(token: str) -> InstrumentedBot:
+    """ Bot with connections for every thread calling Bot API """
+    # Connections for Updater's default workers, update, edit and
+    # announce workers
+    con_pool_size = (8 + config['settings'].get('update_workers', 0) +
+                     config['settings'].get('edit_workers', 0) +
+                     config.get('broadcast', {}).get('workers', 4))
+    kwargs = {}
+    if 'base_url' in config:
+        # Local Bot API server
+        kwargs['base_url'] = config['base_url']
+    return InstrumentedBot(token, metrics,
+                           request=Request(con_pool_size=con_pool_size),
+                           **kwargs)
+
+
+def make_dispatcher(bot: InstrumentedBot) -> Dispatcher:
+    """
+    Dispatcher with job queue, handling users at the same time if
+    there are update workers
+    """
+    job_queue = JobQueue()
+    workers = config['settings'].get('update_workers', 0)
+    if workers and not isinstance(datafile, SQLitePersistence):
+        # Pickle persistence walks through all data while saving it
+        logger.warning('updates are handled one by one with pickle '
+                       'persistence')
+        workers = 0
+    if workers:
+        dispatcher = UserDispatcher(bot, Queue(), job_queue=job_queue,
+                                    persistence=datafile,
+                                    user_workers=workers)
+    else:
+        dispatcher = Dispatcher(bot, Queue(), job_queue=job_queue,
+                                persistence=datafile)
+    job_queue.set_dispatcher(dispatcher)
+    return dispatcher
+
+
+def prepare_dispatcher(dispatcher: Dispatcher) -> None:
+    """ Prepare loaded data and add handlers """
+    # Sections are made before handlers, so handlers working at the
+    # same time don't make them twice
+    for section in ['users', 'total']:
+        dispatcher.bot_data.setdefault(section, {})
+    if isinstance(datafile, SQLitePersistence):
+        # New sections have no entries to save, and saved as a whole
+        # they would replace entries saved by other shards
+        dispatcher.bot_data.take_changed()
+    # Places are counted by leaderboard now, no need to keep them
+    dispatcher.bot_data.pop('rating', None)
+    leaderboard.load(dispatcher.bot_data.get('total', {}))
+    # SQLite loads users when they come and upgrades them on load
+    if not isinstance(datafile, SQLitePersistence):
+        migrated = [user_id for user_id, user_data
+                    in dispatcher.user_data.items()
+                    if migrate_user_data(user_data)]
+        if migrated:
+            # Pickle file would be written for every user, so they are
+            # saved with their next update
+            logger.info(f'game screen messages of {len(migrated)} users '
+                        'are replaced with handles')
+    dispatcher.add_handler(CommandHandler('start', timed(start)))
+    dispatcher.add_handler(CommandHandler('stop', timed(stop),
+                                          pass_args=True))
     # Adding handlers
-    dispatcher.add_handler(CallbackQueryHandler(game, pattern='game'))
-    dispatcher.add_handler(CallbackQueryHandler(hit, pattern='hit'))
-    dispatcher.add_handler(CallbackQueryHandler(stand, pattern='stand'))
-    dispatcher.add_handler(CallbackQueryHandler(double, pattern='double'))
-    dispatcher.add_handler(CallbackQueryHandler(bet, pattern='bet*'))
-    dispatcher.add_handler(CallbackQueryHandler(settings, pattern='settings*'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(game), pattern='game'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(hit), pattern='hit'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(stand),
+                                                pattern='stand'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(double),
+                                                pattern='double'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(hint), pattern='hint'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(bet), pattern='bet*'))
+    dispatcher.add_handler(CallbackQueryHandler(timed(settings),
+                                                pattern='settings*'))
     # Secret commands
-    dispatcher.add_handler(CommandHandler('announce',
-                                          announce, pass_args=True))
-    dispatcher.add_handler(CommandHandler('logs',
-                                          logs, pass_args=True))
-    dispatcher.add_handler(CommandHandler('users', usersinfo))
+    dispatcher.add_handler(CommandHandler('announce', timed(announce),
+                                          pass_args=True))
+    dispatcher.add_handler(CommandHandler('logs', timed(logs),
+                                          pass_args=True))
+    dispatcher.add_handler(CommandHandler('users', timed(usersinfo)))
+    dispatcher.add_handler(CommandHandler('stats', timed(stats)))
+    dispatcher.add_handler(CommandHandler('profile', timed(profile),
+                                          pass_args=True))
+    metrics_settings = config.get('metrics', {})
+    if metrics_settings.get('interval', 0):
+        metrics_file = shard_file(metrics_settings['file'])
+        metrics.start_writing(metrics_file, metrics_settings['interval'])
+        register(metrics.write, metrics_file)
+
+
+def log_counts() -> None:
+    logger.info(f'screen edits: {game_screen.counts}')
+    if isinstance(datafile, SQLitePersistence):
+        logger.info(f'user data cache: {datafile.cache_counts}')
+
+
+def main(token: str) -> None:
+    """ Start a bot with handlers """
+    updater = Updater(dispatcher=make_dispatcher(make_bot(token)))
+    prepare_dispatcher(updater.dispatcher)
+    broadcaster.start(updater.bot)
     updater.start_polling(drop_pending_updates=True)
     updater.idle()
+    log_counts()
+
+
+def serve_shard(token: str, updates) -> None:
+    """
+    Handle updates of this shard's users, put in updates queue by
+    sharded.py receiver as dicts, until None
+    """
+    bot = make_bot(token)
+    dispatcher = make_dispatcher(bot)
+    prepare_dispatcher(dispatcher)
+    dispatcher.job_queue.start()
+    broadcaster.start(bot)
+    logger.info(f'shard {shard} started')
+    while True:
+        data = updates.get()
+        if data is None:
+            break
+        dispatcher.process_update(Update.de_json(data, bot))
+    # Handle updates still queued for users
+    dispatcher.stop()
+    dispatcher.job_queue.stop()
+    datafile.flush()
+    log_counts()
 
 
 # Get configuration and token
-config, token = get_settings()
+config, token, shard = get_settings()
 messages_txt = get_languages(config)
 
-# Logs
-log_file = config['logging']['log_file']
+# Logs, written by listener thread, handlers only put records in queue
+log_file = shard_file(config['logging']['log_file'])
 log_format = '%(asctime)s %(levelname)s %(name)s %(message)s'
-basicConfig(filename=log_file, format=log_format, level=INFO)
+log_file_handler = BatchFileHandler(
+    log_file, config['logging'].get('max_bytes', 0),
+    config['logging'].get('backup_count', 0),
+    config['logging'].get('rotate_hours', 0) * 3600)
+# Last lines for /logs, so they are not read from the file
+log_buffer = LogBuffer(log_file, config['logging'].get('buffer_lines', 1000))
+for handler in [log_file_handler, log_buffer]:
+    handler.setFormatter(Formatter(log_format))
+log_queue = Queue()
+log_listener = BatchListener(log_queue, log_file_handler, log_buffer)
+basicConfig(handlers=[RecordQueueHandler(log_queue)], level=INFO)
+log_listener.start()
+# Queued records are written on exit
+register(log_listener.stop)
 logger = getLogger(__name__)
 
+# Strategy table for hints
+try:
+    strategy = Strategy(config['settings']['strategy_file'])
+except (FileNotFoundError, ValueError) as error:
+    strategy = None
+    logger.warning(f'hints are turned off: {error}')
+
+# Keyboards
+keyboard_rows = {lang: make_keyboard_rows(lang) for lang in messages_txt}
+
+# Edits of game screens
+game_screen = Screen(config['settings'].get('edit_workers', 0))
+
+# Game events for analytics
+events_settings = config.get('events', {})
+game_events = EventWriter(
+    shard_file(events_settings.get('directory', 'events')),
+    events_settings.get('segment_bytes', 2 ** 26))
+game_events.start()
+register(game_events.stop)
+
+# Announces, unfinished ones are resumed on start
+broadcast_settings = config.get('broadcast', {})
+broadcaster = Broadcaster(
+    shard_file(broadcast_settings.get('checkpoint_file', 'broadcast.json')),
+    broadcast_settings.get('rate', 25), broadcast_settings.get('workers', 4))
+
+# Latency of handlers, Bot API calls and persistence
+metrics = Metrics()
+profiler = Profiler()
+
+# Scoreboard
+leaderboard = Leaderboard(config['settings']['rating_places'])
+
 # Persistance
 data_filename = config['persistence']['data_file']
-datafile = PicklePersistence(filename=data_filename)
+if config['persistence'].get('backend', 'pickle') == 'sqlite':
+    cache_users = config['persistence'].get('cache_users', 0)
+    update_workers = config['settings'].get('update_workers', 0)
+    if cache_users and cache_users <= update_workers:
+        # Users being handled are kept in memory, one more is loaded
+        logger.warning(f'cache_users {cache_users} is raised to '
+                       f'{update_workers + 1}, over update_workers')
+        cache_users = update_workers + 1
+    datafile = SQLitePersistence(
+        config['persistence']['db_file'], cache_users=cache_users,
+        on_load=migrate_user_data)
+    # Move data from pickle file on first start
+    if datafile.import_pickle(data_filename):
+        logger.info(f'imported data from {data_filename}')
+else:
+    datafile = PicklePersistence(filename=data_filename)
+metrics.instrument_persistence(datafile)
 
 # Working until we get a SIGNAL
 if __name__ == '__main__':
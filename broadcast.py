@@ -0,0 +1,205 @@
+"""
+Broadcast
+
+Announces are sent in background, no faster than Telegram allows, with
+retries after flood and network errors. Progress is saved in checkpoint
+file, so after restart an announce goes on from where it stopped
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from json import dump, load
+from logging import getLogger
+from os import replace
+from os.path import exists
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+
+from telegram import Bot
+from telegram.error import (BadRequest, NetworkError, RetryAfter,
+                            TelegramError, Unauthorized)
+
+# Telegram allows about 30 messages per second for a bot and one message
+# per second for a chat
+RATE = 25
+CHAT_INTERVAL = 1
+ATTEMPTS = 5
+# Seconds between checkpoints
+SAVE_INTERVAL = 5
+# Chats given to workers at a time
+CHUNK = 100
+# Pause before sending announce again after an error
+RETRY_SECONDS = 30
+
+logger = getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Rate limit: tokens come with rate per second, up to capacity, and
+    every send takes one
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.__rate = rate
+        self.__capacity = capacity
+        self.__tokens = capacity
+        self.__time = monotonic()
+        self.__lock = Lock()
+
+    def __refill(self) -> None:
+        now = monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens +
+                            (now - self.__time) * self.__rate)
+        self.__time = now
+
+    def take(self) -> None:
+        """ Wait for a token and take it """
+        with self.__lock:
+            self.__refill()
+            self.__tokens -= 1
+            # Token is taken in advance, wait until it comes
+            wait = -self.__tokens / self.__rate
+        if wait > 0:
+            sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """ No tokens for seconds, like after a flood error """
+        with self.__lock:
+            self.__refill()
+            self.__tokens = min(self.__tokens, 0) - seconds * self.__rate
+
+
+class Broadcaster:
+    """
+    Queue of announces, sent one by one by background thread, every
+    announce is sent to its chats by several workers at the same time
+
+    Checkpoint keeps chats which didn't get an announce yet, a chat could
+    get it twice if the bot was stopped right after sending
+    """
+    def __init__(self, filename: str, rate: float = RATE,
+                 workers: int = 4) -> None:
+        self.__filename = filename
+        self.__bucket = TokenBucket(rate, rate)
+        self.__workers = workers
+        self.__bot = None
+        self.__lock = Lock()
+        self.__wakeup = Event()
+        self.__last_sent = {}
+        self.__jobs = []
+        if exists(filename):
+            with open(filename) as file:
+                self.__jobs = load(file)
+
+    @property
+    def queued(self) -> int:
+        """ Announces not sent yet """
+        with self.__lock:
+            return len(self.__jobs)
+
+    def start(self, bot: Bot) -> None:
+        """ Start sending, announces from checkpoint go first """
+        self.__bot = bot
+        if self.__jobs:
+            logger.info(f'resuming {len(self.__jobs)} announces')
+        Thread(target=self.__run, name='broadcast', daemon=True).start()
+
+    def add(self, text: str, chat_ids: list, owner_id: int) -> int:
+        """ Queue announce, return: its place in queue """
+        with self.__lock:
+            self.__jobs.append({'text': text, 'owner_id': owner_id,
+                                'pending': list(chat_ids), 'delivered': 0,
+                                'failed': 0})
+            self.__save()
+            place = len(self.__jobs)
+        self.__wakeup.set()
+        return place
+
+    def __save(self) -> None:
+        """ Write checkpoint, file is replaced only when it's written """
+        with open(self.__filename + '.tmp', 'w') as file:
+            dump(self.__jobs, file)
+        replace(self.__filename + '.tmp', self.__filename)
+
+    def __run(self) -> None:
+        while True:
+            with self.__lock:
+                job = self.__jobs[0] if self.__jobs else None
+            if job is None:
+                self.__wakeup.wait()
+                self.__wakeup.clear()
+                continue
+            try:
+                self.__send_job(job)
+            except Exception:
+                # Announce goes on from its checkpoint
+                logger.exception('sending announce failed')
+                sleep(RETRY_SECONDS)
+
+    def __send_job(self, job: dict) -> None:
+        """ Send announce to every pending chat, then summary to owner """
+        pending = job['pending']
+        logger.info(f'sending announce to {len(pending)} chats')
+        saved = monotonic()
+        with ThreadPoolExecutor(self.__workers) as pool:
+            for start in range(0, len(pending), CHUNK):
+                results = pool.map(self.__send,
+                                   pending[start:start + CHUNK],
+                                   repeat(job['text']))
+                # Results come in order, so sent chats are the first
+                for num, delivered in enumerate(results, start + 1):
+                    with self.__lock:
+                        job['delivered' if delivered else 'failed'] += 1
+                        if monotonic() - saved > SAVE_INTERVAL:
+                            job['pending'] = pending[num:]
+                            self.__save()
+                            saved = monotonic()
+        with self.__lock:
+            job['pending'] = []
+            self.__save()
+        summary = (f'Announce "{job["text"][:64]}" is done, '
+                   f'delivered: {job["delivered"]}, '
+                   f'failed: {job["failed"]}')
+        logger.info(summary)
+        self.__send(job['owner_id'], summary)
+        with self.__lock:
+            self.__jobs.pop(0)
+            self.__save()
+            # Only recent sends matter for chat limit
+            now = monotonic()
+            self.__last_sent = {chat_id: time for chat_id, time
+                                in self.__last_sent.items()
+                                if time > now - CHAT_INTERVAL}
+
+    def __wait_for_chat(self, chat_id: int) -> None:
+        """ Keep the interval between messages to one chat """
+        with self.__lock:
+            now = monotonic()
+            send_at = max(now, self.__last_sent.get(chat_id, 0) +
+                          CHAT_INTERVAL)
+            self.__last_sent[chat_id] = send_at
+        if send_at > now:
+            sleep(send_at - now)
+
+    def __send(self, chat_id: int, text: str) -> bool:
+        """ Send message, return: if it was delivered """
+        for attempt in range(ATTEMPTS):
+            self.__bucket.take()
+            self.__wait_for_chat(chat_id)
+            try:
+                self.__bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as error:
+                # Flood limit is for the whole bot, every worker waits
+                self.__bucket.pause(error.retry_after)
+            except (BadRequest, Unauthorized) as error:
+                # Chat not found, bot was blocked by user...
+                logger.info(f'announce to {chat_id} failed: {error}')
+                return False
+            except NetworkError:
+                sleep(2 ** attempt)
+            except TelegramError as error:
+                logger.info(f'announce to {chat_id} failed: {error}')
+                return False
+        logger.info(f'announce to {chat_id} failed after {ATTEMPTS} tries')
+        return False
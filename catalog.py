@@ -0,0 +1,60 @@
+"""
+Message catalog
+
+Strings of every language are read once at startup into objects with
+attribute access, titles with emoji prefixes and card faces are made
+once too, so handlers only fetch ready strings
+"""
+
+from emoji import emojize
+
+from game import DECK
+
+# Strings shown with emoji in game, available as <key>_game
+EMOJI = {
+    'b_deck_count': ':input_numbers:',
+    'b_double': ':victory_hand:',
+    'b_hint': ':light_bulb:',
+    'b_hit': ':backhand_index_pointing_down:',
+    'b_language': ':input_latin_uppercase:',
+    'b_rating': ':trophy:',
+    'b_reset': ':money_bag:',
+    'b_settings': ':gear:',
+    'b_stand': ':raised_hand:',
+    'b_start': ':game_die:',
+    'txt_game_start': ':slot_machine:',
+    'txt_lose': ':thumbs_down:',
+    'txt_m_bet_title': ':dollar_banknote:',
+    'txt_m_bet_title_confirm': ':check_mark_button:',
+    'txt_m_sett_title': ':gear:',
+    'txt_m_sett_title_confirm': ':check_mark_button:',
+    'txt_tie': ':raised_fist:',
+    'txt_win': ':thumbs_up:'
+}
+# Scoreboard places with medals
+MEDALS = tuple(map(emojize, [':1st_place_medal:', ':2nd_place_medal:',
+                             ':3rd_place_medal:']))
+# Text of every card, as it's shown in hand
+CARD_FACES = {card: f'{card[0]} {card[1]}' for card in DECK}
+
+
+class Messages:
+    """
+    Strings of one language, every key of language file is an attribute,
+    keys from EMOJI also have <key>_game attribute with emoji prefix
+    """
+    def __init__(self, strings: dict) -> None:
+        for key, text in strings.items():
+            setattr(self, key, text)
+            if key in EMOJI:
+                setattr(self, key + '_game',
+                        ' '.join([emojize(EMOJI[key]), text]))
+
+    def __getitem__(self, key: str) -> str:
+        """ String by key, for keys chosen at runtime """
+        return getattr(self, key)
+
+
+def card_face(card: tuple) -> str:
+    """ Card text, cards from old saved games could have other suits """
+    return CARD_FACES.get(card) or f'{card[0]} {card[1]}'
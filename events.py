@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+"""
+Game events
+
+Game actions, round results and settings changes as JSON lines in
+append-only segment files. Handlers only put events in a queue, they are
+encoded and written by a background thread. Every start of the bot
+begins a new segment, and a segment is closed when it's full
+
+    python3 events.py -d DIRECTORY -u USER -t TYPE - print events
+"""
+
+from argparse import ArgumentParser
+from glob import glob
+from json import dumps, loads
+from logging import getLogger
+from os import makedirs
+from os.path import basename, join
+from queue import SimpleQueue
+from threading import Thread
+from time import time
+
+from game import SUITS
+
+SEGMENT_BYTES = 64 * 2 ** 20
+# Cards are written like 10S or AH
+SUIT_CODES = dict(zip(SUITS, 'SDCH'))
+# Fields with hands, written as card codes
+HANDS = ['player', 'dealer']
+
+logger = getLogger(__name__)
+
+
+def card_code(card: tuple) -> str:
+    return f'{card[0]}{SUIT_CODES.get(card[1], "?")}'
+
+
+def segment_name(directory: str, number: int) -> str:
+    return join(directory, f'events-{number:06d}.jsonl')
+
+
+def list_segments(directory: str) -> list:
+    """ Segment files in order they were written """
+    return sorted(glob(join(directory, 'events-*.jsonl')))
+
+
+class EventWriter:
+    """ Queue of events, written to segment files by background thread """
+    def __init__(self, directory: str,
+                 segment_bytes: int = SEGMENT_BYTES) -> None:
+        makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__segment_bytes = segment_bytes
+        segments = list_segments(directory)
+        self.__number = 0
+        if segments:
+            self.__number = int(basename(segments[-1])[7:13])
+        self.__queue = SimpleQueue()
+        self.__thread = Thread(target=self.__run, name='events',
+                               daemon=True)
+
+    def start(self) -> None:
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """ Write every queued event and stop """
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def emit(self, user_id: int, kind: str, **fields) -> None:
+        """
+        Queue event, hands must be copies, as they are encoded later
+        """
+        self.__queue.put((time(), user_id, kind, fields))
+
+    @staticmethod
+    def encode(event: tuple) -> bytes:
+        timestamp, user_id, kind, fields = event
+        for field in HANDS:
+            if field in fields:
+                fields[field] = ' '.join(map(card_code, fields[field]))
+        return (dumps({'time': round(timestamp, 3), 'user': user_id,
+                       'type': kind, **fields}, ensure_ascii=False,
+                      separators=(',', ':')) + '\n').encode()
+
+    @staticmethod
+    def __close(file) -> None:
+        """ Close segment, it could fail to write the rest of events """
+        try:
+            file.close()
+        except OSError:
+            logger.exception('closing events segment failed')
+
+    def __run(self) -> None:
+        file = None
+        size = 0
+        while True:
+            event = self.__queue.get()
+            if event is None:
+                break
+            try:
+                line = self.encode(event)
+            except Exception:
+                logger.exception(f'dropped {event[2]} event of {event[1]}')
+                continue
+            try:
+                if file is None or size + len(line) > self.__segment_bytes:
+                    if file is not None:
+                        self.__close(file)
+                        file = None
+                    self.__number += 1
+                    file = open(segment_name(self.__directory,
+                                             self.__number), 'ab')
+                    size = 0
+                file.write(line)
+                size += len(line)
+                # Events that come together are written together
+                if self.__queue.empty():
+                    file.flush()
+            except OSError:
+                # Like disk full, a part of line could be written, so
+                # next events go to a new segment
+                logger.exception('writing events failed, dropped events')
+                if file is not None:
+                    self.__close(file)
+                    file = None
+        if file is not None:
+            self.__close(file)
+
+
+def read_events(directory: str):
+    """
+    Generator of events from every segment, one by one, line which was
+    being written when the bot stopped is skipped
+    """
+    for segment in list_segments(directory):
+        with open(segment, 'rb') as file:
+            for line in file:
+                if line.endswith(b'\n'):
+                    yield loads(line)
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Game events reader')
+    parser.add_argument('-d', '--directory', default='events',
+                        help='events directory')
+    parser.add_argument('-u', '--user', type=int, help='only user id')
+    parser.add_argument('-t', '--type', help='only event type')
+    args = parser.parse_args()
+    for event in read_events(args.directory):
+        if ((args.user is None or event['user'] == args.user) and
+                (args.type is None or event['type'] == args.type)):
+            print(dumps(event, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,67 @@
-from random import shuffle
+from enum import Enum
+from random import Random, getrandbits
+from struct import Struct
 
 from emoji import emojize
 
+# Bump on any change of game rules - simulation caches depend on it
+RULES_VERSION = 1
 
-class RoundResult:
+CARDS = [2, 3, 4, 5, 6, 7, 8, 9, 10, 'J', 'Q', 'K', 'A']
+SUITS = list(map(emojize, [':spade_suit:', ':diamond_suit:',
+                           ':club_suit:', ':heart_suit:']))
+# One deck, built once - shoes are made of copies of it
+DECK = tuple((card, suit) for suit in SUITS for card in CARDS)
+# Card index in CARDS, for counting cards left in shoe
+RANKS = {card: num for num, card in enumerate(CARDS)}
+# Card points, aces are counted apart as they could be 1 or 11
+POINTS = {2: 2, 3: 3, 4: 4, 5: 5, 6: 6, 7: 7, 8: 8, 9: 9, 10: 10,
+          'J': 10, 'Q': 10, 'K': 10, 'A': 0}
+# Card code is its index in DECK
+CODES = {card: code for code, card in enumerate(DECK)}
+CODE_RANKS = tuple(RANKS[card[0]] for card in DECK)
+CODE_POINTS = tuple(POINTS[card[0]] for card in DECK)
+CODE_ACES = tuple(int(card[0] == 'A') for card in DECK)
+# Saved game: version, deck count, dealer hit score, shuffle threshold,
+# shoe seed and cursor, dealer's and player's card count, then the cards.
+# Shoes of version 1 were shuffled whole, their seeds deal other cards
+STATE = Struct('<BBBdQHBB')
+STATE_VERSION = 2
+
+
+def draw_code(order: list, cursor: int, random: Random) -> int:
+    """
+    Fisher-Yates step: swap a random undrawn card under the cursor,
+    return: its code
+    """
+    # Not randrange, it's several times slower, bias is below 1e-13
+    swap = cursor + int(random.random() * (len(order) - cursor))
+    order[cursor], order[swap] = order[swap], order[cursor]
+    return order[cursor]
+
+
+def make_shoe(deck_count: int, seed: int) -> bytes:
+    """ Card codes of a shoe in the order they are dealt """
+    order = list(range(len(DECK))) * deck_count
+    random = Random(seed)
+    for cursor in range(len(order)):
+        draw_code(order, cursor, random)
+    return bytes(order)
+
+
+def legacy_code(card: tuple) -> int:
+    """
+    Code of a card from games saved with cards, suits could be other
+    emoji variants, then card keeps its rank
+    """
+    if card in CODES:
+        return CODES[card]
+    suits = [suit.rstrip('\ufe0f') for suit in SUITS]
+    suit = card[1].rstrip('\ufe0f')
+    return CODES[(card[0], SUITS[suits.index(suit) if suit in suits else 0])]
+
+
+class RoundResult(Enum):
     """
     Representation of the round result
 
@@ -11,7 +69,7 @@ class RoundResult:
         result: result of the round,
         winner: who win the round
 
-    Valid results: None, tie, blackjack, bust, score
+    Valid results: tie, blackjack, bust, score, forfeit
     Valid winners: None, dealer, player
 
     The outcome of the game must be determined by a combination of
@@ -19,86 +77,208 @@ class RoundResult:
 
     If result is bust - winner is always the opposite side
     """
-    def __init__(self) -> None:
-        self.__result = None
-        self.__winner = None
-
-    @property
-    def result(self):
-        return self.__result
+    PLAYER_BLACKJACK = ('blackjack', 'player')
+    DEALER_BLACKJACK = ('blackjack', 'dealer')
+    PLAYER_BUST = ('bust', 'dealer')
+    DEALER_BUST = ('bust', 'player')
+    PLAYER_SCORE = ('score', 'player')
+    DEALER_SCORE = ('score', 'dealer')
+    TIE = ('tie', None)
+    FORFEIT = ('forfeit', 'dealer')
 
-    @result.setter
-    def result(self, value):
-        if value in ['blackjack', 'tie', 'bust', 'score', 'forfeit']:
-            self.__result = value
-        else:
-            raise ValueError
+    def __init__(self, result: str, winner: str) -> None:
+        self.result = result
+        self.winner = winner
 
-    @property
-    def winner(self):
-        return self.__winner
 
-    @winner.setter
-    def winner(self, value):
-        if value in ['dealer', 'player']:
-            self.__winner = value
-        else:
-            raise ValueError
+class Game:
+    """
+    Game mechanics
 
+    Cards are kept as codes, indexes in DECK. Shoe is not saved at all:
+    every draw is a shuffle step of random numbers from the shoe's seed,
+    and cards before the cursor are drawn, so a game is saved in a few
+    tens of bytes and every shoe can be dealt again from its seed.
+    Partly shuffled shoe is only kept in memory
+    """
+    # Not private names, PTB's replace_bot walks slots by their names
+    __slots__ = ('_deck_size', '_low_deck_threshold', '_diller_hit_on',
+                 '_seed', '_cursor', '_order', '_random', '_deal_shoe',
+                 '_shoe_counts',
+                 '_low_deck_size', '_dealer_hand', '_player_hand',
+                 '_dealer_count', '_player_count', '_round_result')
 
-class Game:
-    """ Game mechanics """
     def __init__(self, deck_count: int, low_deck_threshold: float,
                  diller_hit_on: int) -> None:
+        self._deck_size = deck_count
+        self._low_deck_threshold = low_deck_threshold
+        self._diller_hit_on = diller_hit_on
         self.__make_deck(deck_count)
-        self.__deck_size = deck_count
-        self.__low_deck_threshold = low_deck_threshold
-        self.__diller_hit_on = diller_hit_on
-        self.__dealer_hand = []
-        self.__player_hand = []
+        self._dealer_hand = []
+        self._player_hand = []
+        # Hand counts as [points without aces, aces]
+        self._dealer_count = [0, 0]
+        self._player_count = [0, 0]
+        self._round_result = None
         # Deal two cards at the beginning of the game
         self.deal_cards()
 
+    def to_bytes(self) -> bytes:
+        """ Game state: settings, shoe seed and cursor, and hands """
+        return STATE.pack(STATE_VERSION, self._deck_size,
+                          self._diller_hit_on, self._low_deck_threshold,
+                          self._seed, self._cursor,
+                          len(self._dealer_hand),
+                          len(self._player_hand)) + bytes(
+            self._dealer_hand + self._player_hand)
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """ Game from to_bytes state, shoe is shuffled on next draw """
+        (version, deck_count, diller_hit_on, low_deck_threshold, seed,
+         cursor, dealer_cards, player_cards) = STATE.unpack_from(data)
+        if version not in [1, STATE_VERSION]:
+            raise ValueError(f'unknown game state version {version}')
+        game = cls.__new__(cls)
+        if version == 1:
+            # Hands are kept, and a new shoe is started
+            game.__restore(deck_count, low_deck_threshold, diller_hit_on,
+                           getrandbits(64), 0)
+        else:
+            game.__restore(deck_count, low_deck_threshold, diller_hit_on,
+                           seed, cursor)
+        game._deal_shoe = None
+        hands = data[STATE.size:]
+        game._dealer_hand = list(hands[:dealer_cards])
+        game._player_hand = list(hands[dealer_cards:
+                                        dealer_cards + player_cards])
+        game._dealer_count = game.__make_count(game._dealer_hand)
+        game._player_count = game.__make_count(game._player_hand)
+        return game
+
+    def __reduce__(self) -> tuple:
+        """ Pickled as to_bytes state """
+        return self.__class__.from_bytes, (self.to_bytes(),)
+
+    def __setstate__(self, state) -> None:
+        """
+        Restore game pickled by older versions, with a whole shoe of
+        cards, hands are kept, and a new shoe is started
+        """
+        deck_count = state['_Game__deck_size']
+        self.__restore(deck_count, state['_Game__low_deck_threshold'],
+                       state['_Game__diller_hit_on'], getrandbits(64), 0)
+        self._deal_shoe = None
+        self._dealer_hand = [legacy_code(card)
+                              for card in state['_Game__dealer_hand']]
+        self._player_hand = [legacy_code(card)
+                              for card in state['_Game__player_hand']]
+        self._dealer_count = self.__make_count(self._dealer_hand)
+        self._player_count = self.__make_count(self._player_hand)
+
+    def __restore(self, deck_count: int, low_deck_threshold: float,
+                  diller_hit_on: int, seed: int, cursor: int) -> None:
+        self._deck_size = deck_count
+        self._low_deck_threshold = low_deck_threshold
+        self._diller_hit_on = diller_hit_on
+        self._low_deck_size = 52 * deck_count * low_deck_threshold
+        self._seed = seed
+        self._cursor = cursor
+        self._order = None
+        self._random = None
+        self._shoe_counts = None
+        self._round_result = None
+
     @property
-    def dealer_hand(self):
-        return self.__dealer_hand
+    def dealer_hand(self) -> list:
+        return [DECK[code] for code in self._dealer_hand]
 
     @property
-    def player_hand(self):
-        return self.__player_hand
+    def player_hand(self) -> list:
+        return [DECK[code] for code in self._player_hand]
 
     @property
     def deck_count(self):
-        return self.__deck_size
+        return self._deck_size
+
+    @property
+    def seed(self) -> int:
+        """ Seed of the current shoe, make_shoe deals it again """
+        return self._seed
+
+    @property
+    def cursor(self) -> int:
+        """ Cards drawn from the current shoe """
+        return self._cursor
+
+    @property
+    def deal_shoe(self) -> tuple:
+        """
+        Seed and cursor of the shoe the round was dealt from, a new shoe
+        could be started while dealing
+        """
+        return self._deal_shoe
+
+    @property
+    def player_score(self) -> int:
+        return self.__count_cards(self._player_count)
+
+    @property
+    def player_soft(self) -> bool:
+        """ If one of player's aces counts as 11 """
+        points, aces = self._player_count
+        return aces > 0 and points <= 10
+
+    @property
+    def shoe_counts(self) -> tuple:
+        """ Counts of cards left in shoe, in CARDS order """
+        if self._shoe_counts is None:
+            self.__load_shoe()
+        return tuple(self._shoe_counts)
 
     @property
     def round_result(self):
-        return self.__get_round_result()
+        # Result only changes when a card is drawn
+        if self._round_result is None:
+            self._round_result = self.__get_round_result()
+        return self._round_result
 
     def __make_deck(self, deck_count: int) -> None:
-        """ Create deck from target number of decks """
-        cards = [2, 3, 4, 5, 6, 7, 8, 9, 10, 'J', 'Q', 'K', 'A']
-        suits = list(map(emojize, [':spade_suit:', ':diamond_suit:',
-                                   ':club_suit:', ':heart_suit:']))
-        deck = []
-        while deck_count > 0:
-            deck_count -= 1
-            for suit in suits:
-                for card in cards:
-                    deck.append((card, suit))
-        shuffle(deck)
-        self.__deck = deck
+        """ Start a new shoe from target number of decks """
+        self.__restore(deck_count, self._low_deck_threshold,
+                       self._diller_hit_on, getrandbits(64), 0)
+        self.__load_shoe()
+
+    def __load_shoe(self) -> None:
+        """
+        Shoe in memory: drawn cards of a restored shoe are drawn again
+        from its seed, cards after the cursor are shuffled when drawn
+        """
+        order = list(range(len(DECK))) * self._deck_size
+        random = Random(self._seed)
+        counts = [4 * self._deck_size] * len(CARDS)
+        for cursor in range(self._cursor):
+            counts[CODE_RANKS[draw_code(order, cursor, random)]] -= 1
+        self._order = order
+        self._random = random
+        self._shoe_counts = counts
 
     def __check_and_remake_deck(self) -> None:
         """ Shuffle the deck if target card count below threshold """
-        if (len(self.__deck) < 52 * self.__deck_size *
-           self.__low_deck_threshold):
-            self.__make_deck(self.__deck_size)
+        if len(self._order) - self._cursor < self._low_deck_size:
+            self.__make_deck(self._deck_size)
 
-    def __take_card(self, hand: list) -> None:
+    def __take_card(self, hand: list, count: list) -> None:
         """ Put a card in target hand and remove from deck """
-        hand = hand.append(self.__deck[0])
-        self.__deck.pop(0)
+        if self._order is None:
+            self.__load_shoe()
+        code = draw_code(self._order, self._cursor, self._random)
+        hand.append(code)
+        self._shoe_counts[CODE_RANKS[code]] -= 1
+        count[0] += CODE_POINTS[code]
+        count[1] += CODE_ACES[code]
+        self._round_result = None
+        self._cursor += 1
         # Check if there is enough cards in deck
         self.__check_and_remake_deck()
 
@@ -107,80 +287,72 @@ class Game:
         Deal two cards for dealer and player in
         the beginning of the round
         """
-        self.__dealer_hand.clear()
-        self.__player_hand.clear()
+        self._dealer_hand.clear()
+        self._player_hand.clear()
+        self._dealer_count[:] = [0, 0]
+        self._player_count[:] = [0, 0]
+        self._deal_shoe = (self._seed, self._cursor)
         for i in range(2):
-            self.__take_card(self.__dealer_hand)
-            self.__take_card(self.__player_hand)
-
-    def __count_cards(self, hand: list) -> int:
-        """ Card score count """
-        # We should place aces at the end of the list
-        tmp_hand = sorted(hand, key=str, reverse=True)
-        count = 0
-        for card in tmp_hand:
-            value = card[0]
-            if isinstance(value, int):
-                count = count + value
-            elif value != 'A':
-                count = count + 10
-            else:
-                if count <= 10:
-                    count = count + 11
-                else:
-                    count = count + 1
-        return count
+            self.__take_card(self._dealer_hand, self._dealer_count)
+            self.__take_card(self._player_hand, self._player_count)
+
+    @staticmethod
+    def __make_count(hand: list) -> list:
+        """ Hand count from scratch """
+        return [sum(CODE_POINTS[code] for code in hand),
+                sum(CODE_ACES[code] for code in hand)]
+
+    @staticmethod
+    def __count_cards(count: list) -> int:
+        """
+        Card score count
+
+        All aces go after other cards: the first one is 11 if it fits
+        into points of other cards, the rest are always 1
+        """
+        points, aces = count
+        if aces and points <= 10:
+            return points + aces + 10
+        return points + aces
 
     def hit(self) -> None:
         """ Player takes a card """
-        self.__take_card(self.player_hand)
+        self.__take_card(self._player_hand, self._player_count)
 
     def stand(self) -> None:
         """ Player hold and pass game to dealer """
         while self.__make_diller_desicion():
-            self.__take_card(self.dealer_hand)
+            self.__take_card(self._dealer_hand, self._dealer_count)
 
     def __make_diller_desicion(self) -> bool:
         """ Dealer descision making """
-        score = self.__count_cards(self.dealer_hand)
-        if score <= self.__diller_hit_on:
+        score = self.__count_cards(self._dealer_count)
+        if score <= self._diller_hit_on:
             return True
         else:
             return False
 
     def __get_round_result(self) -> RoundResult:
         """ Return game state after a round """
-        result = RoundResult()
-        d_score = self.__count_cards(self.__dealer_hand)
-        p_score = self.__count_cards(self.__player_hand)
-        d_card_count = len(self.__dealer_hand)
-        p_card_count = len(self.__player_hand)
+        d_score = self.__count_cards(self._dealer_count)
+        p_score = self.__count_cards(self._player_count)
+        d_card_count = len(self._dealer_hand)
+        p_card_count = len(self._player_hand)
         if (p_score == 21 and p_card_count == 2 and
-           self.__dealer_hand[0][0] not in [10, 'J', 'Q', 'K', 'A']):
-            result.result = 'blackjack'
-            result.winner = 'player'
+           DECK[self._dealer_hand[0]][0] not in [10, 'J', 'Q', 'K', 'A']):
+            return RoundResult.PLAYER_BLACKJACK
         elif (d_score == 21 and d_card_count == 2 and
               p_score == 21 and p_card_count == 2):
-            result.result = 'tie'
+            return RoundResult.TIE
         elif d_score == 21 and d_card_count == 2:
-            result.result = 'blackjack'
-            result.winner = 'dealer'
-        elif d_score > 21:
-            result.result = 'bust'
-            result.winner = 'player'
+            return RoundResult.DEALER_BLACKJACK
         elif d_score > 21:
-            result.result = 'bust'
-            result.winner = 'player'
+            return RoundResult.DEALER_BUST
         elif p_score > 21:
-            result.result = 'bust'
-            result.winner = 'dealer'
+            return RoundResult.PLAYER_BUST
         # Score counting after all special conditions
         elif d_score > p_score:
-            result.result = 'score'
-            result.winner = 'dealer'
+            return RoundResult.DEALER_SCORE
         elif p_score > d_score:
-            result.result = 'score'
-            result.winner = 'player'
-        elif d_score == p_score:
-            result.result = 'tie'
-        return result
+            return RoundResult.PLAYER_SCORE
+        return RoundResult.TIE
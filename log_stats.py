@@ -0,0 +1,263 @@
+#!/usr/bin/python3
+"""
+Log statistics
+
+Streams through log files, current and rotated ones, and prints per user
+and per day statistics: sessions, rounds, win rate, net result and peak
+of players at the same time. Lines are read, parsed and counted by a
+pipeline of generators, so memory doesn't grow with log size. Files are
+split into chunks, which are counted by a pool of processes
+
+    python3 log_stats.py -c config.json [FILE ...]
+"""
+
+import re
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from glob import glob
+from json import load
+from os import cpu_count
+from os.path import getsize, splitext
+
+from emoji import emojize
+
+from catalog import EMOJI
+
+# Pause after which next action starts a new session
+SESSION_GAP = timedelta(minutes=30)
+CHUNK_BYTES = 64 * 2 ** 20
+RESULTS = {emojize(EMOJI[key]): result for key, result
+           in [('txt_win', 'win'), ('txt_lose', 'lose'), ('txt_tie', 'tie')]}
+# Username can have ' - ' too, so event is matched from the end
+EVENT = re.compile(r'(?P<user>.+?) - (?P<event>new game(?: - changed deck '
+                   r'count)?|first game|take card|stand|double|(?P<result>'
+                   + '|'.join(RESULTS) + r') (?P<text>.*), bet: (?P<bet>\d+))')
+ACTIONS = {'new game': 'games', 'new game - changed deck count': 'games',
+           'first game': 'games', 'take card': 'hits', 'stand': 'stands',
+           'double': 'doubles'}
+USER_FIELDS = ['games', 'hits', 'stands', 'doubles', 'rounds', 'win',
+               'lose', 'tie', 'blackjack', 'bust', 'net']
+DAY_FIELDS = ['rounds', 'win', 'net']
+
+
+def read_lines(task: tuple):
+    """
+    Lines of a file chunk, line belongs to the chunk where it starts
+    """
+    filename, start, end = task
+    with open(filename, 'rb') as file:
+        if start:
+            file.seek(start - 1)
+            # Line started in previous chunk is read by its task
+            file.readline()
+        while file.tell() < end:
+            line = file.readline()
+            if not line:
+                break
+            yield line.decode(errors='replace')
+
+
+def parse_events(lines, details: dict):
+    """
+    Game events from log lines: time, username, event and its values
+    """
+    for line in lines:
+        # asctime has a space, then levelname and logger name
+        parts = line.rstrip('\n').split(' ', 4)
+        if len(parts) < 5:
+            continue
+        match = EVENT.fullmatch(parts[4])
+        if match is None:
+            continue
+        try:
+            time = datetime.fromisoformat(f'{parts[0]} {parts[1][:8]}')
+        except ValueError:
+            continue
+        if match['result']:
+            # Result text, then blackjack or bust, if there was one
+            texts = match['text'].split(' - ')
+            detail = details.get(texts[1]) if len(texts) > 1 else None
+            yield (time, match['user'], RESULTS[match['result']], detail,
+                   int(match['bet']))
+        else:
+            yield time, match['user'], ACTIONS[match['event']], None, 0
+
+
+def count_chunk(task: tuple, details: dict) -> tuple:
+    """
+    Counters of a file chunk, and activity periods of every user, which
+    are joined into sessions with other chunks later
+    """
+    users = defaultdict(lambda: dict.fromkeys(USER_FIELDS, 0))
+    days = defaultdict(lambda: dict.fromkeys(DAY_FIELDS, 0))
+    periods = defaultdict(list)
+    for time, user, kind, detail, bet in parse_events(read_lines(task),
+                                                        details):
+        counters = users[user]
+        counters[kind] += 1
+        if kind in RESULTS.values():
+            net = {'win': bet, 'lose': -bet, 'tie': 0}[kind]
+            day = days[time.date()]
+            counters['rounds'] += 1
+            counters['net'] += net
+            # Player's blackjacks and busts
+            if (kind, detail) in [('win', 'blackjack'), ('lose', 'bust')]:
+                counters[detail] += 1
+            day['rounds'] += 1
+            day['win'] += kind == 'win'
+            day['net'] += net
+        user_periods = periods[user]
+        if user_periods and time - user_periods[-1][1] < SESSION_GAP:
+            user_periods[-1][1] = max(user_periods[-1][1], time)
+        else:
+            user_periods.append([time, time])
+    # Plain dicts, lambdas can't be sent back from a process
+    return dict(users), dict(days), dict(periods)
+
+
+def make_tasks(filenames: list, chunk_bytes: int) -> list:
+    tasks = []
+    for filename in filenames:
+        size = getsize(filename)
+        for start in range(0, size, chunk_bytes):
+            tasks.append((filename, start, min(start + chunk_bytes, size)))
+    return tasks
+
+
+def join_sessions(periods: list) -> list:
+    """ Activity periods of a user joined into sessions """
+    sessions = []
+    for start, end in sorted(periods):
+        if sessions and start - sessions[-1][1] < SESSION_GAP:
+            sessions[-1][1] = max(sessions[-1][1], end)
+        else:
+            sessions.append([start, end])
+    return sessions
+
+
+def peak_players(sessions: dict) -> dict:
+    """ Most players in session at the same time, by day """
+    changes = []
+    for user_sessions in sessions.values():
+        for start, end in user_sessions:
+            changes.append((start, -1))
+            changes.append((end, 1))
+    # Session starts go before ends at the same second
+    changes.sort()
+    peaks = defaultdict(int)
+    players = 0
+    day = None
+    for time, change in changes:
+        # Players in session at midnight are the first peak of a day,
+        # and of every day after it with no changes at all
+        while day is not None and day < time.date():
+            day += timedelta(days=1)
+            if players:
+                peaks[day] = players
+        players -= change
+        day = time.date()
+        peaks[day] = max(peaks[day], players)
+    return peaks
+
+
+def collect(filenames: list, details: dict, workers: int,
+            chunk_bytes: int = CHUNK_BYTES) -> tuple:
+    """ Statistics of every user and every day """
+    users = defaultdict(lambda: dict.fromkeys(USER_FIELDS, 0))
+    days = defaultdict(lambda: dict.fromkeys(DAY_FIELDS, 0))
+    periods = defaultdict(list)
+    tasks = make_tasks(filenames, chunk_bytes)
+    with ProcessPoolExecutor(workers) as pool:
+        for chunk_users, chunk_days, chunk_periods in pool.map(
+                count_chunk, tasks, [details] * len(tasks)):
+            for total, chunk in [(users, chunk_users), (days, chunk_days)]:
+                for key, counters in chunk.items():
+                    for field, value in counters.items():
+                        total[key][field] = total[key].get(field, 0) + value
+            for user, user_periods in chunk_periods.items():
+                periods[user].extend(user_periods)
+    sessions = {user: join_sessions(user_periods)
+                for user, user_periods in periods.items()}
+    for user, user_sessions in sessions.items():
+        users[user]['sessions'] = len(user_sessions)
+        for start, end in user_sessions:
+            day = days[start.date()]
+            day['sessions'] = day.get('sessions', 0) + 1
+            # Session after midnight counts the user on both days
+            for num in range((end.date() - start.date()).days + 1):
+                day = days[start.date() + timedelta(days=num)]
+                day.setdefault('users', set()).add(user)
+    for day, peak in peak_players(sessions).items():
+        days[day]['peak'] = peak
+    return users, days
+
+
+def win_rate(counters: dict) -> str:
+    if not counters['rounds']:
+        return '-'
+    return f'{counters["win"] / counters["rounds"]:.1%}'
+
+
+def print_stats(users: dict, days: dict, top: int) -> None:
+    print(f'{"user":<24} {"sessions":>8} {"rounds":>8} {"win rate":>8} '
+          f'{"bj":>6} {"bust":>6} {"double":>6} {"net":>10}')
+    ranked = sorted(users.items(), key=lambda item: -item[1]['rounds'])
+    for user, counters in ranked[:top]:
+        print(f'{user[:24]:<24} {counters.get("sessions", 0):>8} '
+              f'{counters["rounds"]:>8} {win_rate(counters):>8} '
+              f'{counters["blackjack"]:>6} {counters["bust"]:>6} '
+              f'{counters["doubles"]:>6} '
+              f'{counters["net"]:>10}')
+    if len(ranked) > top:
+        print(f'... {len(ranked) - top} more users')
+    print()
+    print(f'{"day":<10} {"users":>6} {"sessions":>8} {"peak":>5} '
+          f'{"rounds":>8} {"win rate":>8} {"net":>10}')
+    for day, counters in sorted(days.items()):
+        print(f'{day.isoformat():<10} {len(counters.get("users", ())):>6} '
+              f'{counters.get("sessions", 0):>8} '
+              f'{counters.get("peak", 0):>5} {counters["rounds"]:>8} '
+              f'{win_rate(counters):>8} {counters["net"]:>10}')
+
+
+def read_config(config_file: str) -> tuple:
+    """
+    Log file and round result details, they are logged in user's
+    language, so texts of every language lead to one name
+    """
+    details = {'forfeit': 'forfeit'}
+    with open(config_file) as file:
+        config = load(file)
+    for lang_file in config['lang_files'].values():
+        with open(lang_file, encoding='utf-8') as file:
+            strings = load(file)
+        details[strings['txt_blackjack']] = 'blackjack'
+        details[strings['txt_bust']] = 'bust'
+    return details, config['logging']['log_file']
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Log statistics')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help='log files, default: log file from config, '
+                             'rotated ones and logs of shards')
+    parser.add_argument('-c', '--config', default='config.json',
+                        help='bot config file')
+    parser.add_argument('-w', '--workers', type=int, default=cpu_count(),
+                        help='processes')
+    parser.add_argument('-n', '--top', type=int, default=20,
+                        help='users with most rounds to show')
+    args = parser.parse_args()
+    details, log_file = read_config(args.config)
+    # Sharded bot writes a log per shard: log.1.txt
+    root, ext = splitext(log_file)
+    filenames = args.files or sorted(set(
+        glob(log_file) + glob(log_file + '.*') + glob(f'{root}.*{ext}*')))
+    users, days = collect(filenames, details, args.workers)
+    print_stats(users, days, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Queued logging
+
+Handler threads only put records in a queue, records are written to the
+log file by a listener thread, which flushes the file once for a batch
+of records. Log file is rotated by size and by time
+"""
+
+from logging import LogRecord
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from time import time
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    Queue handler passing records as they are, they are formatted by
+    listener thread, not by the thread which logs
+    """
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
+class BatchFileHandler(RotatingFileHandler):
+    """
+    Log file which is flushed only by flush_batch, and rotated when it's
+    bigger than max_bytes or older than interval seconds
+    """
+    def __init__(self, filename: str, max_bytes: int = 0,
+                 backup_count: int = 0, interval: float = 0) -> None:
+        super().__init__(filename, maxBytes=max_bytes,
+                         backupCount=backup_count, encoding='utf-8')
+        self.__interval = interval
+        self.__rollover_at = time() + interval
+
+    def flush(self) -> None:
+        """ Every record is not flushed, see flush_batch """
+
+    def flush_batch(self) -> None:
+        """ Flush records written since the last flush """
+        with self.lock:
+            if self.stream and hasattr(self.stream, 'flush'):
+                self.stream.flush()
+
+    def shouldRollover(self, record: LogRecord) -> bool:
+        if self.__interval and time() >= self.__rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.flush_batch()
+        super().doRollover()
+        self.__rollover_at = time() + self.__interval
+
+    def close(self) -> None:
+        self.flush_batch()
+        super().close()
+
+
+class BatchListener(QueueListener):
+    """
+    Queue listener flushing batch handlers when the queue is empty, or
+    after batch records, if records keep coming
+    """
+    def __init__(self, queue, *handlers, batch: int = 1000) -> None:
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.__batch = batch
+        self.__count = 0
+
+    def handle(self, record: LogRecord) -> None:
+        super().handle(record)
+        self.__count += 1
+        if self.__count >= self.__batch or self.queue.empty():
+            self.__count = 0
+            self.__flush()
+
+    def __flush(self) -> None:
+        for handler in self.handlers:
+            if isinstance(handler, BatchFileHandler):
+                handler.flush_batch()
+
+    def stop(self) -> None:
+        """ Write every queued record and stop """
+        super().stop()
+        self.__flush()
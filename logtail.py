@@ -0,0 +1,64 @@
+"""
+Log tail
+
+Last lines of the log without running tail: recent lines are kept in
+memory by a logging handler, older ones are found from the end of the
+memory-mapped log file, so only the tail of the file is ever read
+"""
+
+from collections import deque
+from logging import Handler, LogRecord
+from mmap import ACCESS_READ, mmap
+from os.path import getsize
+
+
+def tail_file(filename: str, count: int) -> str:
+    """ Last count lines of a file """
+    try:
+        if count <= 0 or getsize(filename) == 0:
+            return ''
+    except FileNotFoundError:
+        return ''
+    with open(filename, 'rb') as file, \
+            mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+        end = len(data)
+        # Line break at the very end doesn't start a line
+        if data[end - 1:end] == b'\n':
+            end -= 1
+        start = end
+        for _ in range(count):
+            start = data.rfind(b'\n', 0, start)
+            if start == -1:
+                break
+        return data[start + 1:end].decode(errors='replace')
+
+
+class LogBuffer(Handler):
+    """
+    Logging handler keeping the last lines of formatted records, asked
+    lines that are not in memory, like right after start, are read from
+    the log file
+    """
+    def __init__(self, filename: str, capacity: int) -> None:
+        super().__init__()
+        self.__filename = filename
+        self.__lines = deque(maxlen=capacity)
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            lines = self.format(record).splitlines()
+        except Exception:
+            self.handleError(record)
+            return
+        with self.lock:
+            self.__lines.extend(lines)
+
+    def tail(self, count: int) -> str:
+        """ Last count lines of the log """
+        if count <= 0:
+            return ''
+        with self.lock:
+            if count <= len(self.__lines):
+                lines = list(self.__lines)
+                return '\n'.join(lines[len(lines) - count:])
+        return tail_file(self.__filename, count)
@@ -0,0 +1,212 @@
+"""
+Metrics
+
+Latency histograms of handlers, Bot API calls and persistence, with
+fixed buckets, so an observation is a bisect and a few additions. They
+are shown by /stats command and written to a file in Prometheus text
+format for node exporter's textfile collector
+"""
+
+from bisect import bisect_left
+from functools import wraps
+from logging import getLogger
+from os import replace
+from threading import Lock, Thread
+from time import perf_counter, sleep
+
+from telegram.ext import ExtBot
+
+# Upper bounds of buckets, seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+           5, 10)
+HELP = {
+    'bot_handler_seconds': 'Time of handling an update',
+    'bot_api_seconds': 'Time of a Bot API call',
+    'bot_api_errors_total': 'Bot API calls ended with an error',
+    'bot_persistence_seconds': 'Time of saving data'
+}
+
+logger = getLogger(__name__)
+
+
+class Histogram:
+    """ Count of observations in every bucket, their sum and maximum """
+    def __init__(self, buckets: tuple = BUCKETS) -> None:
+        self.__buckets = buckets
+        # The last one is for values over the last bucket
+        self.__counts = [0] * (len(buckets) + 1)
+        self.__sum = 0
+        self.__max = 0
+        self.__lock = Lock()
+
+    def observe(self, value: float) -> None:
+        place = bisect_left(self.__buckets, value)
+        with self.__lock:
+            self.__counts[place] += 1
+            self.__sum += value
+            if value > self.__max:
+                self.__max = value
+
+    def snapshot(self) -> tuple:
+        """ Bucket counts, sum and maximum at one moment """
+        with self.__lock:
+            return list(self.__counts), self.__sum, self.__max
+
+    def quantile(self, counts: list, share: float) -> float:
+        """ Upper bound of the bucket where share of observations ends """
+        total = sum(counts)
+        seen = 0
+        for bound, count in zip(self.__buckets, counts):
+            seen += count
+            if seen >= total * share:
+                return bound
+        return float('inf')
+
+    @property
+    def buckets(self) -> tuple:
+        return self.__buckets
+
+
+class Metrics:
+    """ Histograms and counters by name and labels """
+    def __init__(self) -> None:
+        self.__histograms = {}
+        self.__counters = {}
+        self.__lock = Lock()
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        """ Histogram with the labels, made on first use """
+        key = (name, tuple(labels.items()))
+        histogram = self.__histograms.get(key)
+        if histogram is None:
+            with self.__lock:
+                histogram = self.__histograms.setdefault(key, Histogram())
+        return histogram
+
+    def count(self, name: str, **labels) -> None:
+        key = (name, tuple(labels.items()))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + 1
+
+    def timed(self, name: str, func, **labels):
+        """ Function wrapper, observing its time in histogram """
+        histogram = self.histogram(name, **labels)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        return wrapper
+
+    def instrument_persistence(self, persistence) -> None:
+        """
+        Time saving of user and bot data, dispatcher calls it after
+        every update
+        """
+        for method in ['update_user_data', 'update_bot_data']:
+            setattr(persistence, method, self.timed(
+                'bot_persistence_seconds', getattr(persistence, method),
+                operation=method))
+
+    def __items(self) -> tuple:
+        with self.__lock:
+            return (sorted(self.__histograms.items()),
+                    sorted(self.__counters.items()))
+
+    def render(self) -> str:
+        """ Every metric in Prometheus text format """
+        lines = []
+        histograms, counters = self.__items()
+        described = set()
+        for (name, labels), histogram in histograms:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            counts, total, _ = histogram.snapshot()
+            seen = 0
+            bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                seen += count
+                bucket_labels = format_labels(labels + (('le', bound),))
+                lines.append(f'{name}_bucket{bucket_labels} {seen}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {seen}')
+        for (name, labels), value in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        Text for /stats: count, mean, 50th and 95th percentile and
+        maximum, in milliseconds
+        """
+        lines = ['count, ms: avg, p50, p95 (bucket bounds), max']
+        histograms, counters = self.__items()
+        errors = {labels: value for (_, labels), value in counters}
+        for (name, labels), histogram in histograms:
+            counts, total, longest = histogram.snapshot()
+            count = sum(counts)
+            if not count:
+                continue
+            label = ','.join(value for _, value in labels)
+            line = (f'{name[4:-8]} {label}: {count}, '
+                    f'avg {total / count * 1000:.1f}, '
+                    f'p50 {histogram.quantile(counts, 0.5) * 1000:g}, '
+                    f'p95 {histogram.quantile(counts, 0.95) * 1000:g}, '
+                    f'max {longest * 1000:.1f}')
+            if labels in errors and name == 'bot_api_seconds':
+                line += f', errors {errors[labels]}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def write(self, filename: str) -> None:
+        """ Write metrics file, replace it at once for readers """
+        with open(filename + '.tmp', 'w') as file:
+            file.write(self.render())
+        replace(filename + '.tmp', filename)
+
+    def start_writing(self, filename: str, interval: float) -> None:
+        """ Write metrics file every interval seconds in background """
+        def run() -> None:
+            while True:
+                sleep(interval)
+                try:
+                    self.write(filename)
+                except OSError as error:
+                    logger.warning(f'metrics are not written: {error}')
+        Thread(target=run, name='metrics', daemon=True).start()
+
+
+class InstrumentedBot(ExtBot):
+    """ Bot timing every Bot API call, and counting failed ones """
+    def __init__(self, token: str, metrics: Metrics, **kwargs) -> None:
+        super().__init__(token, **kwargs)
+        self.metrics = metrics
+
+    def _post(self, endpoint: str, *args, **kwargs):
+        start = perf_counter()
+        try:
+            return super()._post(endpoint, *args, **kwargs)
+        except Exception:
+            self.metrics.count('bot_api_errors_total', method=endpoint)
+            raise
+        finally:
+            self.metrics.histogram('bot_api_seconds', method=endpoint).observe(
+                perf_counter() - start)
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value
+                          in zip(labels, escaped)) + '}'
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+"""
+Exact dealer odds
+
+Probabilities of dealer's final score for the dealer rule of game.Game,
+for an up card and remaining shoe composition. Composition is a tuple of
+card counts by kind: 2-9, ten-value card and ace
+
+Dealer's final hand only depends on which cards he drew, not on their
+order. So for every up card and dealer rule, cards dealer could finish
+with and how many orders of them he could draw are counted once. Odds
+for a composition are then chances of these draws, a few array products
+whatever the composition is
+"""
+
+from argparse import ArgumentParser
+from functools import lru_cache
+
+import numpy as np
+
+# Card kinds: 0-7 are 2-9, 8 is ten-value card, 9 is ace
+KINDS = 10
+ACE = 9
+KIND_POINTS = (2, 3, 4, 5, 6, 7, 8, 9, 10, 0)
+CARD_KIND = {2: 0, 3: 1, 4: 2, 5: 3, 6: 4, 7: 5, 8: 6, 9: 7,
+             10: 8, 'J': 8, 'Q': 8, 'K': 8, 'A': 9}
+# Bounded, so a long running bot with 8 decks doesn't eat all memory
+CACHE_SIZE = 2 ** 16
+
+
+def make_composition(deck_count: int) -> tuple:
+    """ Composition of a full shoe """
+    return (4 * deck_count,) * 8 + (16 * deck_count, 4 * deck_count)
+
+
+def make_kind_composition(card_counts: tuple) -> tuple:
+    """ Composition from counts of cards in game.CARDS order """
+    return tuple(card_counts[:8]) + (sum(card_counts[8:12]),
+                                     card_counts[12])
+
+
+def count_score(points: int, aces: int) -> int:
+    """ Score count, same as Game.__count_cards """
+    if aces and points <= 10:
+        return points + aces + 10
+    return points + aces
+
+
+def _outcome(score: int, cards: int, diller_hit_on: int) -> int:
+    """ Index of a final score in odds, see dealer_odds """
+    if score > 21:
+        return 21 - diller_hit_on
+    elif score == 21 and cards == 2:
+        return 22 - diller_hit_on
+    return score - diller_hit_on - 1
+
+
+def _dealer_score(up_card: int, drawn: tuple) -> int:
+    """ Score of dealer's hand: up card and drawn cards by kind """
+    points = KIND_POINTS[up_card] + sum(
+        num * points for num, points in zip(drawn, KIND_POINTS))
+    return count_score(points, int(up_card == ACE) + drawn[ACE])
+
+
+@lru_cache(maxsize=None)
+def _dealer_draws(up_card: int, diller_hit_on: int) -> tuple:
+    """
+    Cards dealer could finish with, same as Game.stand
+
+    Returns: most cards of a kind, indexes of drawn cards' counts in
+    ways of _final_odds, number of cards, orders they could be drawn in,
+    and outcome indexes in odds
+    """
+    # Drawn cards by kind dealer still hits on, and their orders
+    orders = {(0,) * KINDS: 1}
+    finals = {}
+    while orders:
+        next_orders = {}
+        for drawn, count in orders.items():
+            for kind in range(KINDS):
+                cards = drawn[:kind] + (drawn[kind] + 1,) + drawn[kind + 1:]
+                # Only the last card makes dealer stand
+                if _dealer_score(up_card, cards) > diller_hit_on:
+                    finals[cards] = finals.get(cards, 0) + count
+                else:
+                    next_orders[cards] = next_orders.get(cards, 0) + count
+        orders = next_orders
+    outcomes = [_outcome(_dealer_score(up_card, cards), 1 + sum(cards),
+                         diller_hit_on) for cards in finals]
+    drawn = np.array(list(finals), dtype=np.intp)
+    most = int(drawn.max())
+    return (most, drawn + np.arange(KINDS) * (most + 1), drawn.sum(axis=1),
+            np.array(list(finals.values()), dtype=float),
+            np.array(outcomes, dtype=np.intp))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _final_odds(up_card: int, counts: tuple, diller_hit_on: int) -> tuple:
+    """
+    Odds of dealer's outcomes: final scores from diller_hit_on + 1 to
+    21, then bust, then blackjack
+    """
+    most, drawn, sizes, orders, outcomes = _dealer_draws(up_card,
+                                                         diller_hit_on)
+    steps = np.arange(most + 1)
+    # Chance of an order of drawn cards: ways to draw every kind's cards
+    # one by one, to ways to draw that many cards from the whole shoe
+    ways = np.maximum(np.array(counts)[:, None] - steps, 0)
+    ways = np.cumprod(np.hstack([np.ones((KINDS, 1)), ways[:, :-1]]),
+                      axis=1).ravel()
+    # More cards than shoe has can't be drawn, ways of some kind are 0
+    total = np.cumprod(np.hstack([1.0, np.maximum(
+        sum(counts) - np.arange(sizes.max()), 1)]))
+    chances = orders * ways[drawn].prod(axis=1) / total[sizes]
+    return tuple(np.bincount(outcomes, chances,
+                             minlength=23 - diller_hit_on).tolist())
+
+
+def dealer_odds(up_card: int, counts: tuple, diller_hit_on: int) -> dict:
+    """
+    Odds of dealer's outcomes by up card kind and composition of cards
+    dealer could draw, including the hole card
+
+    Returns: dict of final score, 'bust' and 'blackjack' probabilities
+    """
+    odds = _final_odds(up_card, tuple(counts), diller_hit_on)
+    result = dict(zip(range(diller_hit_on + 1, 22), odds))
+    result['bust'] = odds[-2]
+    result['blackjack'] = odds[-1]
+    return result
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Dealer odds')
+    parser.add_argument('-d', '--deck-count', type=int, default=4,
+                        help='number of decks')
+    parser.add_argument('-H', '--diller-hit-on', type=int, default=16,
+                        help='score dealer still hits on')
+    args = parser.parse_args()
+    shoe = make_composition(args.deck_count)
+    names = [str(num) for num in range(2, 11)[:8]] + ['10', 'A']
+    print('up  ' + ' '.join(f'{score:>6}' for score in
+                            range(args.diller_hit_on + 1, 22)) +
+          '   bust     bj')
+    for kind in range(KINDS):
+        counts = list(shoe)
+        counts[kind] -= 1
+        odds = dealer_odds(kind, tuple(counts), args.diller_hit_on)
+        print(f'{names[kind]:<3} ' +
+              ' '.join(f'{odd:>6.2%}' for odd in odds.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""
+SQLite persistence
+
+Keeps every user's data and every user's entry of bot_data in its own
+row, so saving an update only writes rows of the user it came from.
+user_data is loaded when the user comes, and only recently active users
+are kept in memory
+"""
+
+from collections import OrderedDict, defaultdict
+from os.path import exists
+from pickle import HIGHEST_PROTOCOL, dumps, load, loads
+from sqlite3 import connect
+from threading import Lock
+
+from telegram.ext import BasePersistence
+
+# Key of bot_data sections which are not dicts, saved as a whole
+WHOLE = ''
+
+
+class TrackedDict(dict):
+    """ Dict remembering keys that were set or removed """
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.changed = set()
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.changed.add(key)
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self.changed.add(key)
+
+    def pop(self, key, *default):
+        self.changed.add(key)
+        return super().pop(key, *default)
+
+    def popitem(self) -> tuple:
+        key, value = super().popitem()
+        self.changed.add(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        self.changed.add(key)
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs) -> None:
+        other = dict(*args, **kwargs)
+        super().update(other)
+        self.changed.update(other)
+
+    def clear(self) -> None:
+        self.changed.update(self)
+        super().clear()
+
+    def take_changed(self) -> set:
+        """ Return changed keys and forget them """
+        changed, self.changed = self.changed, set()
+        # Handler of another user could be adding a key to it right now,
+        # copy is made at once
+        return set(changed)
+
+
+class BotData(TrackedDict):
+    """
+    bot_data with sections (users, total...) as tracked dicts,
+    handlers keep working with them as with usual dicts
+    """
+    def __setitem__(self, key, value) -> None:
+        if self.get(key) is value:
+            # Like bot_data['total'] = bot_data.get('total', {})
+            return
+        if isinstance(value, dict) and not isinstance(value, TrackedDict):
+            value = TrackedDict(value)
+            value.changed.update(value)
+        super().__setitem__(key, value)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+class UserDataCache(defaultdict):
+    """
+    user_data of up to capacity recently active users, 0 - no limit.
+    Users that are not in memory are loaded on first access, least
+    recently used ones are dropped. Dispatcher saves user's data after
+    every update, so a dropped user is saved already, unless an update
+    of the user is still handled: such users are pinned and never dropped
+    """
+    def __init__(self, load, capacity: int = 0) -> None:
+        super().__init__(dict)
+        self.__load = load
+        self.__capacity = capacity
+        # Users from least to most recently used
+        self.__order = OrderedDict()
+        # Users with updates being handled, and how many of them
+        self.__pins = {}
+        self.__counts = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.__lock = Lock()
+
+    @property
+    def counts(self) -> dict:
+        """ Lookups of users in memory, loaded users and dropped users """
+        with self.__lock:
+            return dict(self.__counts)
+
+    def __getitem__(self, user_id: int) -> dict:
+        with self.__lock:
+            if dict.__contains__(self, user_id):
+                self.__counts['hits'] += 1
+                self.__order.move_to_end(user_id)
+                return dict.__getitem__(self, user_id)
+            self.__counts['misses'] += 1
+            data = self.__load(user_id)
+            dict.__setitem__(self, user_id, data)
+            self.__order[user_id] = None
+            self.__evict()
+            return data
+
+    def pin(self, user_id: int) -> None:
+        """ Keep user in memory until unpin, while the update is handled """
+        with self.__lock:
+            self.__pins[user_id] = self.__pins.get(user_id, 0) + 1
+
+    def unpin(self, user_id: int) -> None:
+        with self.__lock:
+            self.__pins[user_id] -= 1
+            if not self.__pins[user_id]:
+                del self.__pins[user_id]
+            self.__evict()
+
+    def __evict(self) -> None:
+        """ Drop least recently used users over capacity, but not pinned """
+        extra = len(self.__order) - self.__capacity
+        if not self.__capacity or extra <= 0:
+            return
+        evicted = []
+        for user_id in self.__order:
+            if user_id not in self.__pins:
+                evicted.append(user_id)
+                if len(evicted) == extra:
+                    break
+        for user_id in evicted:
+            del self.__order[user_id]
+            dict.__delitem__(self, user_id)
+        self.__counts['evictions'] += len(evicted)
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    Persistence in SQLite database in WAL mode
+
+    user_data is saved per user. bot_data sections which are dicts,
+    like users or total, are saved per key: keys set or removed since
+    the last save, and entries of the user the update came from, as
+    handlers change them in place
+
+    user_data of cache_users recently active users is kept in memory,
+    0 - of every user who came since start. on_load gets every loaded
+    user's data, to upgrade data saved by older versions
+    """
+    def __init__(self, filename: str, store_user_data: bool = True,
+                 store_bot_data: bool = True, cache_users: int = 0,
+                 on_load=None) -> None:
+        super().__init__(store_user_data=store_user_data,
+                         store_chat_data=False, store_bot_data=store_bot_data)
+        self.filename = filename
+        self.user_data = None
+        self.bot_data = None
+        self.__cache_users = cache_users
+        self.__on_load = on_load
+        self.__lock = Lock()
+        self.__db = connect(filename, check_same_thread=False,
+                            isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        # Commit doesn't wait for disk, WAL keeps the database consistent
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS user_data '
+                          '(user_id INTEGER PRIMARY KEY, data BLOB)')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS bot_data '
+                          '(section TEXT, key, data BLOB, '
+                          'PRIMARY KEY (section, key))')
+        # Data has no Bot instances to replace, and handlers must keep
+        # working with our tracked dicts and cache, not with their copies
+        for method in ['get_user_data', 'update_user_data', 'get_bot_data',
+                       'update_bot_data']:
+            vars(self).pop(method, None)
+
+    def import_pickle(self, filename: str) -> bool:
+        """
+        Fill empty database from PicklePersistence single file,
+        return: if data was imported
+        """
+        if not exists(filename):
+            return False
+        with self.__lock:
+            if (self.__db.execute('SELECT 1 FROM user_data LIMIT 1')
+                    .fetchone() or self.__db.execute(
+                        'SELECT 1 FROM bot_data LIMIT 1').fetchone()):
+                return False
+            with open(filename, 'rb') as file:
+                data = load(file)
+            with self.__db:
+                self.__db.execute('BEGIN IMMEDIATE')
+                self.__db.executemany(
+                    'INSERT INTO user_data VALUES (?, ?)',
+                    ((user_id, dumps(user_data, HIGHEST_PROTOCOL))
+                     for user_id, user_data in data['user_data'].items()))
+                for section, value in data['bot_data'].items():
+                    self.__write_section(section, value)
+        return True
+
+    def __write_section(self, section: str, value) -> None:
+        """ Write whole bot_data section """
+        self.__db.execute('DELETE FROM bot_data WHERE section = ?',
+                          (section,))
+        if isinstance(value, dict):
+            self.__db.executemany(
+                'INSERT INTO bot_data VALUES (?, ?, ?)',
+                ((section, key, dumps(item, HIGHEST_PROTOCOL))
+                 for key, item in value.items()))
+        else:
+            self.__db.execute('INSERT INTO bot_data VALUES (?, ?, ?)',
+                              (section, WHOLE, dumps(value,
+                                                     HIGHEST_PROTOCOL)))
+
+    def __write_entries(self, section: str, value: dict,
+                        keys: set) -> None:
+        """ Write or remove target keys of bot_data section """
+        for key in keys:
+            if key in value:
+                self.__db.execute(
+                    'INSERT OR REPLACE INTO bot_data VALUES (?, ?, ?)',
+                    (section, key, dumps(value[key], HIGHEST_PROTOCOL)))
+            else:
+                self.__db.execute('DELETE FROM bot_data WHERE section = ? '
+                                  'AND key = ?', (section, key))
+
+    @property
+    def cache_counts(self) -> dict:
+        """ Hits, misses and evictions of user_data in memory """
+        if self.user_data is None:
+            return {}
+        return self.user_data.counts
+
+    def __load_user(self, user_id: int) -> dict:
+        """ User's saved data, empty for new user """
+        with self.__lock:
+            row = self.__db.execute('SELECT data FROM user_data '
+                                    'WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return {}
+        data = loads(row[0])
+        if self.__on_load is not None:
+            self.__on_load(data)
+        return data
+
+    def read_section(self, section: str) -> dict:
+        """
+        bot_data section as it's saved now, with entries written by
+        other processes
+        """
+        with self.__lock:
+            return {key: loads(data) for key, data in self.__db.execute(
+                'SELECT key, data FROM bot_data WHERE section = ?',
+                (section,))}
+
+    def read_entry(self, section: str, key):
+        """ Saved entry of bot_data section, None if there is no entry """
+        with self.__lock:
+            row = self.__db.execute('SELECT data FROM bot_data WHERE '
+                                    'section = ? AND key = ?',
+                                    (section, key)).fetchone()
+        return None if row is None else loads(row[0])
+
+    def get_user_data(self) -> UserDataCache:
+        if self.user_data is None:
+            self.user_data = UserDataCache(self.__load_user,
+                                           self.__cache_users)
+        return self.user_data
+
+    def get_chat_data(self) -> defaultdict:
+        return defaultdict(dict)
+
+    def get_bot_data(self) -> BotData:
+        if self.bot_data is None:
+            sections = {}
+            with self.__lock:
+                for section, key, data in self.__db.execute(
+                        'SELECT section, key, data FROM bot_data'):
+                    if key == WHOLE:
+                        sections[section] = loads(data)
+                    else:
+                        sections.setdefault(section, TrackedDict())
+                        dict.__setitem__(sections[section], key, loads(data))
+            self.bot_data = BotData(sections)
+            self.bot_data.take_changed()
+        return self.bot_data
+
+    def get_conversations(self, name: str) -> dict:
+        return {}
+
+    def update_conversation(self, name: str, key: tuple,
+                            new_state: object) -> None:
+        pass
+
+    def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    def update_user_data(self, user_id: int, data: dict) -> None:
+        with self.__lock, self.__db:
+            self.__db.execute('BEGIN IMMEDIATE')
+            if data:
+                self.__db.execute(
+                    'INSERT OR REPLACE INTO user_data VALUES (?, ?)',
+                    (user_id, dumps(data, HIGHEST_PROTOCOL)))
+            else:
+                self.__db.execute('DELETE FROM user_data WHERE user_id = ?',
+                                  (user_id,))
+            # Handlers change user's entries in place, like last activity
+            if self.bot_data is not None:
+                for section, value in self.bot_data.items():
+                    if isinstance(value, TrackedDict):
+                        self.__write_entries(section, value, {user_id})
+
+    def update_bot_data(self, data: BotData) -> None:
+        with self.__lock, self.__db:
+            self.__db.execute('BEGIN IMMEDIATE')
+            for section in data.take_changed():
+                if section in data:
+                    self.__write_section(section, data[section])
+                    if isinstance(data[section], TrackedDict):
+                        data[section].take_changed()
+                else:
+                    self.__db.execute('DELETE FROM bot_data '
+                                      'WHERE section = ?', (section,))
+            for section, value in data.items():
+                if isinstance(value, TrackedDict):
+                    self.__write_entries(section, value,
+                                         value.take_changed())
+                else:
+                    # Not a dict, it's small - just save it
+                    self.__write_section(section, value)
+
+    def flush(self) -> None:
+        with self.__lock:
+            self.__db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
@@ -0,0 +1,67 @@
+"""
+Profiler
+
+Handlers are profiled on demand: wrapped handler checks one attribute
+while profiler is off, and runs under its own cProfile while it's on, so
+handlers in different threads don't mix their profiles. Profiles are
+added up and shown by cumulative time when profiling stops
+"""
+
+from cProfile import Profile
+from functools import wraps
+from io import StringIO
+from pstats import Stats
+from threading import Lock
+
+
+class Profiler:
+    """ Profile of every wrapped handler call between start and stop """
+    def __init__(self) -> None:
+        self.__stats = None
+        self.__lock = Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.__stats is not None
+
+    def start(self) -> bool:
+        """ Start profiling, return: False if it's already running """
+        with self.__lock:
+            if self.__stats is not None:
+                return False
+            self.__stats = Stats()
+            return True
+
+    def stop(self, count: int) -> str:
+        """
+        Stop profiling, return: count functions with most cumulative
+        time, empty if nothing was called
+        """
+        with self.__lock:
+            stats, self.__stats = self.__stats, None
+        if stats is None or not stats.total_calls:
+            return ''
+        stats.stream = StringIO()
+        stats.sort_stats('cumulative').print_stats(count)
+        return stats.stream.getvalue()
+
+    def wrap(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.__stats is None:
+                return func(*args, **kwargs)
+            profile = Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Since Python 3.12 only one profile can work at a time
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.__lock:
+                    # Profiling could stop while the handler worked
+                    if self.__stats is not None:
+                        self.__stats.add(profile)
+        return wrapper
@@ -0,0 +1,85 @@
+"""
+Scoreboard index
+
+Keeps users ordered by total, so any user's place and the top of
+the scoreboard are found without sorting everyone
+"""
+
+from threading import RLock
+
+from sortedcontainers import SortedList
+
+
+class Leaderboard:
+    """
+    Users ordered by total, ties by user id, safe to use from several
+    threads
+
+    Rendered top is cached until a score inside the top changes
+    """
+    def __init__(self, places: int) -> None:
+        self.__places = places
+        self.__scores = {}
+        self.__board = SortedList()
+        self.__top = None
+        # Reentrant, update removes user's old score
+        self.__lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self.__scores)
+
+    def load(self, total: dict) -> None:
+        """ Build index from users' totals """
+        with self.__lock:
+            self.__scores = dict(total)
+            self.__board = SortedList((-score, user_id)
+                                      for user_id, score in total.items())
+            self.__top = None
+
+    def __in_top(self, key: tuple) -> bool:
+        return self.__board.bisect_left(key) < self.__places
+
+    def update(self, user_id: int, score: int) -> None:
+        """ Set user's total """
+        with self.__lock:
+            self.remove(user_id)
+            key = (-score, user_id)
+            self.__board.add(key)
+            self.__scores[user_id] = score
+            if self.__in_top(key):
+                self.__top = None
+
+    def remove(self, user_id: int) -> None:
+        """ Remove user from scoreboard """
+        with self.__lock:
+            score = self.__scores.pop(user_id, None)
+            if score is None:
+                return
+            key = (-score, user_id)
+            if self.__in_top(key):
+                self.__top = None
+            self.__board.remove(key)
+
+    def rank(self, user_id: int) -> int:
+        """ User's place, counting from 1, None if user is not rated """
+        with self.__lock:
+            score = self.__scores.get(user_id)
+            if score is None:
+                return None
+            return self.__board.index((-score, user_id)) + 1
+
+    def top(self, render) -> str:
+        """
+        Scoreboard top, rendered by render function from a list of
+        (user_id, score), cached until the top changes
+        """
+        with self.__lock:
+            if self.__top is None:
+                self.__top = render(self.entries())
+            return self.__top
+
+    def entries(self) -> list:
+        """ Scoreboard top as a list of (user_id, score) """
+        with self.__lock:
+            return [(user_id, -score) for score, user_id
+                    in self.__board.islice(0, self.__places)]
@@ -0,0 +1,96 @@
+"""
+Per user scheduler
+
+Updates of one user are handled one after another, in the order they
+came, updates of different users are handled at the same time by a pool
+of threads. User's next updates wait in user's queue, not in the pool,
+so a user sending lots of updates takes one thread at a time and users
+take turns
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from threading import Condition
+
+from telegram import Update
+from telegram.ext import Dispatcher
+
+logger = getLogger(__name__)
+
+
+class UserScheduler:
+    """ Functions run in order for every key, keys in parallel """
+    def __init__(self, workers: int) -> None:
+        self.__pool = ThreadPoolExecutor(workers, thread_name_prefix='user')
+        # Keys with a running function, and their functions to run next
+        self.__queues = {}
+        self.__idle = Condition()
+
+    def submit(self, key, func, *args) -> None:
+        """ Run func after every function submitted with the key """
+        with self.__idle:
+            queue = self.__queues.get(key)
+            if queue is not None:
+                queue.append((func, args))
+                return
+            self.__queues[key] = deque()
+        self.__pool.submit(self.__run, key, func, args)
+
+    def __run(self, key, func, args: tuple) -> None:
+        try:
+            func(*args)
+        except Exception:
+            logger.exception(f'scheduled function failed for {key}')
+        with self.__idle:
+            queue = self.__queues[key]
+            if not queue:
+                del self.__queues[key]
+                self.__idle.notify_all()
+                return
+            func, args = queue.popleft()
+        # Back to the end of the pool queue, after other users
+        self.__pool.submit(self.__run, key, func, args)
+
+    def stop(self) -> None:
+        """ Wait for every submitted function and stop threads """
+        with self.__idle:
+            self.__idle.wait_for(lambda: not self.__queues)
+        self.__pool.shutdown()
+
+
+class UserDispatcher(Dispatcher):
+    """
+    Dispatcher handling every user's updates in order, and updates of
+    different users at the same time, by user_workers threads.
+    user_data with pin and unpin, like persistence.UserDataCache, keeps
+    users in memory until their data is saved after handlers
+    """
+    def __init__(self, *args, user_workers: int, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__scheduler = UserScheduler(user_workers)
+        self.__pinning = hasattr(self.user_data, 'pin')
+
+    def process_update(self, update: object) -> None:
+        user = None
+        if isinstance(update, Update):
+            user = update.effective_user
+        # Updates without a user go in order too
+        user_id = None if user is None else user.id
+        self.__scheduler.submit(user_id, self.__handle, user_id, update)
+
+    def __handle(self, user_id: int, update: object) -> None:
+        """ Handle update, user can't be dropped until his data is saved """
+        if user_id is None or not self.__pinning:
+            super().process_update(update)
+            return
+        self.user_data.pin(user_id)
+        try:
+            super().process_update(update)
+        finally:
+            self.user_data.unpin(user_id)
+
+    def stop(self) -> None:
+        """ Stop getting updates, then handle the ones already got """
+        super().stop()
+        self.__scheduler.stop()
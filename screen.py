@@ -0,0 +1,141 @@
+"""
+Screen edits
+
+Game screen messages are kept as small handles: chat and message ids and
+a short hash of the text and keyboard last shown. Messages are edited by
+ids, and edits which change nothing are not sent, they only cost a
+request and end with "Message is not modified" error
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from hashlib import blake2b
+from threading import Lock
+
+from telegram import Bot, InlineKeyboardMarkup, Message
+from telegram.error import BadRequest
+
+# Telegram error for edit which changes nothing
+NOT_MODIFIED = 'message is not modified'
+
+
+def make_digest(data: str) -> bytes:
+    """ Short hash of text, None for no text """
+    if data is None:
+        return None
+    return blake2b(data.encode(), digest_size=8).digest()
+
+
+def markup_digest(markup: InlineKeyboardMarkup) -> bytes:
+    """ Short hash of keyboard, None for no keyboard """
+    if markup is None:
+        return None
+    return make_digest(markup.to_json())
+
+
+class MessageHandle:
+    """
+    Message of game screen, everything needed to edit it, without
+    Message object with its chat, user, keyboard and bot
+    """
+    __slots__ = ('chat_id', 'message_id', 'text_hash', 'markup_hash')
+
+    def __init__(self, chat_id: int, message_id: int, text_hash: bytes = None,
+                 markup_hash: bytes = None) -> None:
+        self.chat_id = chat_id
+        self.message_id = message_id
+        # No text hash - what message shows is not known
+        self.text_hash = text_hash
+        self.markup_hash = markup_hash
+
+    def __reduce__(self) -> tuple:
+        """ Pickled as a tuple of fields, without their names """
+        return MessageHandle, (self.chat_id, self.message_id,
+                               self.text_hash, self.markup_hash)
+
+    @classmethod
+    def from_message(cls, message: Message, shown: dict):
+        """ Handle of message saved before handles, with its hashes """
+        return cls(message.chat_id, message.message_id,
+                   *shown.get(message.message_id, (None, None)))
+
+
+class Screen:
+    """
+    Edits of messages with counters of edits sent, skipped as they
+    change nothing, and failed
+
+    Hashes of what is shown are kept in message handles. With workers,
+    edits of different messages are sent at the same time
+    """
+    def __init__(self, workers: int = 0) -> None:
+        self.__lock = Lock()
+        self.__counts = {'sent': 0, 'skipped': 0, 'failed': 0}
+        self.__pool = None
+        if workers:
+            self.__pool = ThreadPoolExecutor(workers,
+                                             thread_name_prefix='edit')
+
+    @property
+    def counts(self) -> dict:
+        with self.__lock:
+            return dict(self.__counts)
+
+    def __count(self, counter: str) -> None:
+        with self.__lock:
+            self.__counts[counter] += 1
+
+    def run(self, edits: list) -> None:
+        """
+        Run edits, every one for its own message, at the same time if
+        there are workers. First edit's error is raised after all edits
+        are done, so the next edit of a message is always sent after this
+        """
+        if self.__pool is None or len(edits) < 2:
+            for edit in edits:
+                edit()
+            return
+        futures = [self.__pool.submit(edit) for edit in edits]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def remember(self, message: Message, text: str,
+                 markup: InlineKeyboardMarkup = None) -> MessageHandle:
+        """ Handle of new message, remembering what it shows """
+        return MessageHandle(message.chat_id, message.message_id,
+                             make_digest(text), markup_digest(markup))
+
+    def edit_text(self, bot: Bot, handle: MessageHandle, text: str,
+                  markup: InlineKeyboardMarkup = None) -> None:
+        """ Edit message text and keyboard, if they are not shown already """
+        text_hash, markup_hash = make_digest(text), markup_digest(markup)
+        if (handle.text_hash, handle.markup_hash) == (text_hash,
+                                                      markup_hash):
+            self.__count('skipped')
+            return
+        self.__edit(bot.edit_message_text, text, chat_id=handle.chat_id,
+                    message_id=handle.message_id, reply_markup=markup)
+        handle.text_hash, handle.markup_hash = text_hash, markup_hash
+
+    def edit_reply_markup(self, bot: Bot, handle: MessageHandle,
+                          markup: InlineKeyboardMarkup) -> None:
+        """ Edit message keyboard, if it's not shown already """
+        markup_hash = markup_digest(markup)
+        if handle.text_hash is not None and handle.markup_hash == markup_hash:
+            self.__count('skipped')
+            return
+        self.__edit(bot.edit_message_reply_markup, chat_id=handle.chat_id,
+                    message_id=handle.message_id, reply_markup=markup)
+        handle.markup_hash = markup_hash
+
+    def __edit(self, edit, *args, **kwargs) -> None:
+        """ Send edit, message that is already shown is not an error """
+        try:
+            edit(*args, **kwargs)
+        except BadRequest as error:
+            self.__count('failed')
+            # Like after restart, when hashes of new messages were not saved
+            if NOT_MODIFIED not in error.message.lower():
+                raise
+        else:
+            self.__count('sent')
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+Sharded bot
+
+Receiver gets updates by long polling and routes every update to one of
+worker processes by user id, so user's updates are handled by the same
+worker, in order, while different users are handled in parallel.
+Workers share SQLite database, where each of them writes only rows of
+its users, and scoreboard, which is kept by store process
+
+    python3 sharded.py -c config.json -e dev -w 4
+"""
+
+import atexit
+import sys
+from argparse import ArgumentParser
+from json import load
+from logging import INFO, basicConfig, getLogger
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+from signal import SIG_IGN, SIGINT, SIGTERM, default_int_handler, signal
+from threading import Lock
+from time import sleep
+
+from telegram import Bot
+from telegram.error import NetworkError
+
+from persistence import SQLitePersistence
+from rating import Leaderboard
+
+# Seconds of long polling
+POLL_TIMEOUT = 10
+# Pause after failed getUpdates
+RETRY_SECONDS = 1
+
+logger = getLogger(__name__)
+
+
+class RemoteLeaderboard:
+    """
+    Store's scoreboard for bot's handlers, top is rendered again only
+    when it changes
+    """
+    def __init__(self, board) -> None:
+        self.__board = board
+        self.__entries = None
+        self.__top = None
+        self.__lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self.__board)
+
+    def load(self, total: dict) -> None:
+        """ Store loads scoreboard of every shard's users on start """
+
+    def update(self, user_id: int, score: int) -> None:
+        self.__board.update(user_id, score)
+
+    def remove(self, user_id: int) -> None:
+        self.__board.remove(user_id)
+
+    def rank(self, user_id: int) -> int:
+        return self.__board.rank(user_id)
+
+    def top(self, render) -> str:
+        entries = self.__board.entries()
+        with self.__lock:
+            if entries != self.__entries:
+                self.__entries = entries
+                self.__top = render(entries)
+            return self.__top
+
+
+class StoreManager(BaseManager):
+    """ Store process with state shared by workers """
+
+
+# Store serves every worker in its own thread, Leaderboard has a lock
+StoreManager.register('Leaderboard', Leaderboard,
+                      exposed=['__len__', 'load', 'update', 'remove',
+                               'rank', 'entries'])
+
+
+def ignore_signals() -> None:
+    """ Receiver stops workers and store when it's stopped """
+    signal(SIGINT, SIG_IGN)
+    signal(SIGTERM, SIG_IGN)
+
+
+def work(shard: int, config_file: str, environment: str, board,
+         updates) -> None:
+    """ Worker process: bot handling updates of its shard """
+    ignore_signals()
+    sys.argv = ['blackjack_bot.py', '-c', config_file, '-e', environment,
+                '-s', str(shard)]
+    # Bot is set up on import, for the shard from arguments
+    import blackjack_bot
+    blackjack_bot.leaderboard = RemoteLeaderboard(board)
+    blackjack_bot.serve_shard(blackjack_bot.token, updates)
+    # Process exits without atexit, queued logs and events are written
+    atexit._run_exitfuncs()
+
+
+def receive(bot: Bot, queues: list) -> None:
+    """ Route updates to workers by user id until interrupted """
+    bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    while True:
+        try:
+            updates = bot.get_updates(offset, timeout=POLL_TIMEOUT)
+        except NetworkError as error:
+            logger.warning(f'getting updates failed: {error}')
+            sleep(RETRY_SECONDS)
+            continue
+        for update in updates:
+            user = update.effective_user
+            shard = 0 if user is None else user.id % len(queues)
+            queues[shard].put(update.to_dict())
+            offset = update.update_id + 1
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Sharded Blackjack Telegram bot')
+    parser.add_argument('-c', '--config', metavar='C', default='config.json',
+                        help='config file name')
+    parser.add_argument('-e', '--environment', metavar='E', default='dev',
+                        help='environment key')
+    parser.add_argument('-w', '--workers', metavar='W', type=int, default=2,
+                        help='worker processes')
+    args = parser.parse_args()
+    try:
+        with open(args.config) as file:
+            config = load(file)
+    except FileNotFoundError:
+        sys.exit(f'File "{args.config}" does not exist')
+    if config['persistence'].get('backend', 'pickle') != 'sqlite':
+        sys.exit('Workers share data in SQLite database, set persistence '
+                 'backend to sqlite')
+    basicConfig(format='%(asctime)s %(levelname)s %(name)s %(message)s',
+                level=INFO)
+    signal(SIGTERM, default_int_handler)
+    persistence = SQLitePersistence(config['persistence']['db_file'])
+    # Here and not in workers, so they don't import it at the same time
+    if persistence.import_pickle(config['persistence']['data_file']):
+        logger.info(f'imported data from '
+                    f'{config["persistence"]["data_file"]}')
+    # Workers are started clean, not as copies of receiver
+    context = get_context('spawn')
+    manager = StoreManager(ctx=context)
+    manager.start(ignore_signals)
+    board = manager.Leaderboard(config['settings']['rating_places'])
+    board.load(persistence.read_section('total'))
+    queues = [context.Queue() for _ in range(args.workers)]
+    workers = [context.Process(target=work, name=f'shard {shard}',
+                               args=(shard, args.config, args.environment,
+                                     board, queue))
+               for shard, queue in enumerate(queues)]
+    for worker in workers:
+        worker.start()
+    kwargs = {}
+    if 'base_url' in config:
+        kwargs['base_url'] = config['base_url']
+    bot = Bot(config['token'][args.environment], **kwargs)
+    logger.info(f'receiving updates for {args.workers} workers')
+    try:
+        receive(bot, queues)
+    except KeyboardInterrupt:
+        logger.info('stopping workers')
+    finally:
+        # Workers handle updates they got, then stop
+        for queue in queues:
+            queue.put(None)
+        for worker in workers:
+            worker.join()
+        manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
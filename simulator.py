@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+"""
+Batch blackjack simulator
+
+Plays lots of rounds at once with NumPy, following the rules of game.Game
+and payouts of process_round_result, to tune game settings
+"""
+
+from argparse import ArgumentParser
+from typing import NamedTuple
+
+import numpy as np
+
+from game import CARDS
+from strategy import Strategy
+
+# Bump on any change of simulation results - sweep cache depends on it
+SIMULATOR_VERSION = 1
+# Cards are kept as rank indexes in game.CARDS: 0 is 2, 8 is 10, 12 is ace
+RANKS = len(CARDS)
+ACE = CARDS.index('A')
+RANK_POINTS = np.array([2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 0],
+                       dtype=np.int16)
+# Dealer's up card for strategies: 0-7 are 2-9, 8 is ten-value, 9 is ace
+UP_CARDS = 10
+UP_CARD = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 8, 8, 8, 9], dtype=np.intp)
+TEN_UP_CARD = 8
+
+# Player actions
+STAND, HIT, DOUBLE = 0, 1, 2
+# Round payouts in initial bets, see process_round_result
+PAYOUTS = (-2, -1, 0, 1, 1.5, 2)
+
+
+class SimulationResult(NamedTuple):
+    """
+    Simulation summary
+
+    Contains:
+        rounds: number of played rounds,
+        house_edge: average player loss per initial bet,
+        house_edge_error: standard error of the house edge,
+        player_bust_rate: share of rounds player busts,
+        dealer_bust_rate: share of rounds dealer busts,
+        payouts: share of rounds for every payout from PAYOUTS
+    """
+    rounds: int
+    house_edge: float
+    house_edge_error: float
+    player_bust_rate: float
+    dealer_bust_rate: float
+    payouts: dict
+
+
+def make_strategy(stand_on: int = 17) -> np.ndarray:
+    """
+    Simple strategy: hit until score reaches stand_on, never double
+
+    Strategy is an array of actions indexed by:
+    first decision (double is possible), soft hand, score, dealer up card
+    """
+    strategy = np.full((2, 2, 22, UP_CARDS), STAND, dtype=np.int8)
+    strategy[:, :, :stand_on] = HIT
+    return strategy
+
+
+def count_score(points: np.ndarray, aces: np.ndarray) -> np.ndarray:
+    """ Score count, same as Game.__count_cards """
+    return points + aces + 10 * ((aces > 0) & (points <= 10))
+
+
+class Shoes:
+    """ Independent shoes, one for each simultaneously played round """
+    def __init__(self, count: int, deck_count: int,
+                 low_deck_threshold: float,
+                 rng: np.random.Generator) -> None:
+        deck = np.repeat(np.arange(RANKS, dtype=np.int8), 4)
+        self.__size = 52 * deck_count
+        self.__low_deck_size = self.__size * low_deck_threshold
+        self.__rng = rng
+        self.__cards = rng.permuted(np.tile(deck, (count, deck_count)),
+                                    axis=1)
+        self.__cursor = np.zeros(count, dtype=np.intp)
+
+    def draw(self, rows: np.ndarray) -> np.ndarray:
+        """ Draw a card from every shoe in rows, return card ranks """
+        cursor = self.__cursor[rows]
+        cards = self.__cards[rows, cursor]
+        cursor += 1
+        self.__cursor[rows] = cursor
+        # Shuffle low shoes, same as Game.__check_and_remake_deck
+        low = rows[self.__size - cursor < self.__low_deck_size]
+        if low.size:
+            self.__cards[low] = self.__rng.permuted(self.__cards[low],
+                                                    axis=1)
+            self.__cursor[low] = 0
+        return cards
+
+
+class Hands:
+    """ Hand counts for every simultaneously played round """
+    def __init__(self, count: int) -> None:
+        self.points = np.zeros(count, dtype=np.int16)
+        self.aces = np.zeros(count, dtype=np.int16)
+        self.cards = np.zeros(count, dtype=np.int16)
+
+    def take(self, rows: np.ndarray, cards: np.ndarray) -> None:
+        """ Put drawn cards into hands in rows """
+        self.points[rows] += RANK_POINTS[cards]
+        self.aces[rows] += cards == ACE
+        self.cards[rows] += 1
+
+    def score(self, rows: np.ndarray = None) -> np.ndarray:
+        if rows is None:
+            return count_score(self.points, self.aces)
+        return count_score(self.points[rows], self.aces[rows])
+
+    def soft(self, rows: np.ndarray) -> np.ndarray:
+        """ If an ace counts as 11 """
+        return (self.aces[rows] > 0) & (self.points[rows] <= 10)
+
+
+def play_rounds(shoes: Shoes, count: int, diller_hit_on: int,
+                strategy: np.ndarray) -> tuple:
+    """
+    Play a round on every shoe
+
+    Returns: payouts, player bust and dealer bust flags
+    """
+    every = np.arange(count)
+    dealer = Hands(count)
+    player = Hands(count)
+    # Same order as Game.deal_cards
+    up_card = shoes.draw(every)
+    dealer.take(every, up_card)
+    player.take(every, shoes.draw(every))
+    dealer.take(every, shoes.draw(every))
+    player.take(every, shoes.draw(every))
+    up_card = UP_CARD[up_card]
+    payouts = np.zeros(count)
+    doubled = np.zeros(count, dtype=bool)
+    player_bust = np.zeros(count, dtype=bool)
+    dealer_blackjack = dealer.score() == 21
+    # Player blackjack counts only against dealer's low up card
+    done = (player.score() == 21) & (up_card < TEN_UP_CARD)
+    payouts[done] = 1.5
+    # Player's turn
+    active = every[~done]
+    first = 1
+    while active.size:
+        score = player.score(active)
+        actions = strategy[first, player.soft(active).astype(np.intp),
+                           score, up_card[active]]
+        if not first:
+            # Double is only possible on the first decision
+            actions[actions == DOUBLE] = HIT
+        drawing = active[actions != STAND]
+        player.take(drawing, shoes.draw(drawing))
+        # Dealer's blackjack goes first in round result, even on bust
+        busted = ((player.score(drawing) > 21) &
+                  ~dealer_blackjack[drawing])
+        doubles = actions[actions != STAND] == DOUBLE
+        doubled[drawing[doubles]] = True
+        # Hit ends the round if dealer has a blackjack, see hit handler
+        hit_lost = ~doubles & (busted | dealer_blackjack[drawing])
+        lost = drawing[hit_lost]
+        payouts[lost] = -1
+        player_bust[lost] = busted[hit_lost]
+        double_lost = doubles & busted
+        lost = drawing[double_lost]
+        payouts[lost] = -2
+        player_bust[lost] = True
+        done[drawing[hit_lost | double_lost]] = True
+        active = drawing[~doubles & ~hit_lost]
+        first = 0
+    # Dealer's turn, same as Game.stand
+    rows = every[~done]
+    drawing = rows[dealer.score(rows) <= diller_hit_on]
+    while drawing.size:
+        dealer.take(drawing, shoes.draw(drawing))
+        drawing = drawing[dealer.score(drawing) <= diller_hit_on]
+    # Round result, same as Game.__get_round_result
+    d_score = dealer.score(rows)
+    p_score = player.score(rows)
+    d_blackjack = (d_score == 21) & (dealer.cards[rows] == 2)
+    p_twenty_one = (p_score == 21) & (player.cards[rows] == 2)
+    dealer_bust = d_score > 21
+    outcome = np.where(d_blackjack, np.where(p_twenty_one, 0, -1),
+                       np.where(dealer_bust, 1, np.sign(p_score - d_score)))
+    payouts[rows] = outcome * np.where(doubled[rows], 2, 1)
+    bust = np.zeros(count, dtype=bool)
+    bust[rows] = dealer_bust
+    return payouts, player_bust, bust
+
+
+def simulate(rounds: int, deck_count: int = 4,
+             low_deck_threshold: float = 0.2, diller_hit_on: int = 16,
+             strategy: np.ndarray = None, shoes: int = 100000,
+             seed: int = None) -> SimulationResult:
+    """
+    Play target number of rounds on independent shoes, return summary
+
+    Every shoe plays its rounds one by one, so shoes are shuffled
+    and reshuffled the same way as in the game
+    """
+    if strategy is None:
+        strategy = make_strategy()
+    rng = np.random.default_rng(seed)
+    shoes = min(shoes, rounds)
+    shoe = Shoes(shoes, deck_count, low_deck_threshold, rng)
+    total = total_squared = 0.0
+    player_busts = dealer_busts = 0
+    payout_counts = np.zeros(len(PAYOUTS), dtype=np.int64)
+    payout_codes = np.array([int(2 * p) + 4 for p in PAYOUTS])
+    played = 0
+    while played < rounds:
+        payouts, player_bust, dealer_bust = play_rounds(
+            shoe, shoes, diller_hit_on, strategy)
+        # Last batch could be bigger than we need
+        needed = min(shoes, rounds - played)
+        payouts = payouts[:needed]
+        total += payouts.sum()
+        total_squared += np.square(payouts).sum()
+        player_busts += np.count_nonzero(player_bust[:needed])
+        dealer_busts += np.count_nonzero(dealer_bust[:needed])
+        counts = np.bincount((2 * payouts).astype(np.intp) + 4,
+                             minlength=9)
+        payout_counts += counts[payout_codes]
+        played += needed
+    mean = total / rounds
+    variance = max(total_squared / rounds - mean ** 2, 0.0)
+    return SimulationResult(
+        rounds=rounds,
+        house_edge=-mean,
+        house_edge_error=(variance / rounds) ** 0.5,
+        player_bust_rate=player_busts / rounds,
+        dealer_bust_rate=dealer_busts / rounds,
+        payouts={payout: count / rounds for payout, count
+                 in zip(PAYOUTS, payout_counts.tolist())})
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Blackjack batch simulator')
+    parser.add_argument('-r', '--rounds', type=int, default=1000000,
+                        help='number of rounds')
+    parser.add_argument('-d', '--deck-count', type=int, default=4,
+                        help='number of decks')
+    parser.add_argument('-t', '--low-deck-threshold', type=float,
+                        default=0.2, help='shuffle threshold')
+    parser.add_argument('-H', '--diller-hit-on', type=int, default=16,
+                        help='score dealer still hits on')
+    parser.add_argument('-p', '--player-stand-on', type=int, default=17,
+                        help='score player stands on')
+    parser.add_argument('-f', '--strategy-file',
+                        help='play by strategy table file instead')
+    parser.add_argument('-s', '--seed', type=int, help='random seed')
+    args = parser.parse_args()
+    strategy = make_strategy(args.player_stand_on)
+    if args.strategy_file:
+        table = Strategy(args.strategy_file).table(args.deck_count,
+                                                   args.diller_hit_on)
+        strategy = np.array(table, dtype=np.int8)
+    result = simulate(args.rounds, args.deck_count,
+                      args.low_deck_threshold, args.diller_hit_on,
+                      strategy, seed=args.seed)
+    print(f'Rounds:           {result.rounds}')
+    print(f'House edge:       {result.house_edge:.4%} '
+          f'± {1.96 * result.house_edge_error:.4%}')
+    print(f'Player bust rate: {result.player_bust_rate:.4%}')
+    print(f'Dealer bust rate: {result.dealer_bust_rate:.4%}')
+    for payout, share in result.payouts.items():
+        print(f'Payout {payout:>4}:      {share:.4%}')
+
+
+if __name__ == '__main__':
+    main()
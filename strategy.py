@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+"""
+Basic strategy table
+
+Best player action by player's score, soft or hard hand and dealer's up
+card, for every supported deck count and dealer hit score. The table is
+generated once into a small binary file and read with mmap by the bot
+"""
+
+from argparse import ArgumentParser
+from mmap import ACCESS_READ, mmap
+from struct import Struct
+
+from game import RULES_VERSION
+from odds import (ACE, KIND_POINTS, KINDS, count_score, dealer_odds,
+                  make_composition)
+
+# Player actions, same as in simulator
+STAND, HIT, DOUBLE = 0, 1, 2
+DECK_COUNTS = range(1, 9)
+DILLER_HIT_ON = range(12, 21)
+SCORES = 22
+# File header: magic, rules version, deck counts and dealer hit scores
+HEADER = Struct('<4sHBBBB')
+MAGIC = b'BJST'
+
+
+def make_hand(score: int, soft: bool) -> tuple:
+    """ Hand with target score, as points without aces and aces """
+    if not soft:
+        return score, 0
+    elif score == 12:
+        # Soft 12 is only a pair of aces
+        return 0, 2
+    return score - 11, 1
+
+
+def make_actions(deck_count: int, diller_hit_on: int,
+                 up_card: int) -> dict:
+    """
+    Best actions for every player's hand against dealer's up card
+
+    Cards are drawn with shoe probabilities. There is no peek, so when
+    dealer has a blackjack player loses the bet whatever he does, and
+    twice the bet after double
+
+    Returns: {(soft, score): (first action, action after hit)}
+    """
+    counts = list(make_composition(deck_count))
+    counts[up_card] -= 1
+    total = sum(counts)
+    shares = [count / total for count in counts]
+    odds = dealer_odds(up_card, tuple(counts), diller_hit_on)
+    blackjack = odds.pop('blackjack')
+    bust = odds.pop('bust')
+
+    def stand(score: int) -> float:
+        """ Stand result, if dealer has no blackjack """
+        result = bust
+        for dealer_score, odd in odds.items():
+            if dealer_score < score:
+                result += odd
+            elif dealer_score > score:
+                result -= odd
+        return result
+
+    stands = [stand(score) for score in range(SCORES)]
+    best = {}
+
+    def play(points: int, aces: int) -> float:
+        """ Result of the best play without double """
+        if (points, aces) not in best:
+            best[points, aces] = max(stands[count_score(points, aces)],
+                                     hit(points, aces))
+        return best[points, aces]
+
+    def hit(points: int, aces: int) -> float:
+        """ Hit result, if dealer has no blackjack """
+        result = 0.0
+        for kind in range(KINDS):
+            next_points = points + KIND_POINTS[kind]
+            next_aces = aces + (kind == ACE)
+            if count_score(next_points, next_aces) > 21:
+                result -= shares[kind] * (1 - blackjack)
+            else:
+                result += shares[kind] * play(next_points, next_aces)
+        return result
+
+    def double(points: int, aces: int) -> float:
+        """ Double result, if dealer has no blackjack """
+        result = 0.0
+        for kind in range(KINDS):
+            score = count_score(points + KIND_POINTS[kind],
+                                aces + (kind == ACE))
+            if score > 21:
+                result -= shares[kind] * (1 - blackjack)
+            else:
+                result += shares[kind] * stands[score]
+        return 2 * result
+
+    actions = {}
+    for soft in (False, True):
+        for score in range(12 if soft else 4, 22):
+            points, aces = make_hand(score, soft)
+            results = (stands[score] - blackjack,
+                       hit(points, aces) - blackjack,
+                       double(points, aces) - 2 * blackjack)
+            first = max(range(3), key=results.__getitem__)
+            later = max(range(2), key=results.__getitem__)
+            actions[soft, score] = first, later
+    return actions
+
+
+def generate(filename: str) -> None:
+    """ Generate strategy table file """
+    header = HEADER.pack(MAGIC, RULES_VERSION, DECK_COUNTS[0],
+                         DECK_COUNTS[-1], DILLER_HIT_ON[0],
+                         DILLER_HIT_ON[-1])
+    table = bytearray(len(DECK_COUNTS) * len(DILLER_HIT_ON) * 2 *
+                      SCORES * KINDS)
+    offset = 0
+    for deck_count in DECK_COUNTS:
+        for diller_hit_on in DILLER_HIT_ON:
+            actions = [make_actions(deck_count, diller_hit_on, up_card)
+                       for up_card in range(KINDS)]
+            for soft in (False, True):
+                for score in range(SCORES):
+                    for up_card in range(KINDS):
+                        first, later = actions[up_card].get(
+                            (soft, score), (STAND, STAND))
+                        table[offset] = first | later << 2
+                        offset += 1
+    with open(filename, 'wb') as file:
+        file.write(header + table)
+
+
+class Strategy:
+    """ Strategy table file, every lookup is a single read """
+    def __init__(self, filename: str) -> None:
+        with open(filename, 'rb') as file:
+            self.__data = mmap(file.fileno(), 0, access=ACCESS_READ)
+        (magic, rules_version, self.__min_decks, self.__max_decks,
+         self.__min_hit_on, self.__max_hit_on) = HEADER.unpack_from(
+            self.__data)
+        if magic != MAGIC:
+            raise ValueError(f'"{filename}" is not a strategy file')
+        if rules_version != RULES_VERSION:
+            raise ValueError(f'"{filename}" is made for other game rules, '
+                             'generate it again')
+        self.__hit_on_count = self.__max_hit_on - self.__min_hit_on + 1
+
+    def supports(self, deck_count: int, diller_hit_on: int) -> bool:
+        return (self.__min_decks <= deck_count <= self.__max_decks and
+                self.__min_hit_on <= diller_hit_on <= self.__max_hit_on)
+
+    def __offset(self, deck_count: int, diller_hit_on: int) -> int:
+        """ Offset of the table for deck count and dealer hit score """
+        table = ((deck_count - self.__min_decks) * self.__hit_on_count +
+                 diller_hit_on - self.__min_hit_on)
+        return HEADER.size + table * 2 * SCORES * KINDS
+
+    def action(self, deck_count: int, diller_hit_on: int, soft: bool,
+               score: int, up_card: int, first: bool) -> int:
+        """
+        Best action for player's hand and dealer's up card kind,
+        first - if it's the first decision, when double is possible
+        """
+        cell = self.__data[self.__offset(deck_count, diller_hit_on) +
+                           (soft * SCORES + score) * KINDS + up_card]
+        if first:
+            return cell & 3
+        return cell >> 2
+
+    def table(self, deck_count: int, diller_hit_on: int) -> list:
+        """
+        Whole table for deck count and dealer hit score, as nested lists
+        indexed like simulator strategy: first decision, soft, score,
+        up card
+        """
+        offset = self.__offset(deck_count, diller_hit_on)
+        cells = self.__data[offset:offset + 2 * SCORES * KINDS]
+        return [[[[cells[(soft * SCORES + score) * KINDS + up_card] >>
+                   (0 if first else 2) & 3 for up_card in range(KINDS)]
+                  for score in range(SCORES)] for soft in (0, 1)]
+                for first in (0, 1)]
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Basic strategy table generator')
+    parser.add_argument('-o', '--output', default='strategy.bin',
+                        help='strategy file name')
+    args = parser.parse_args()
+    generate(args.output)
+
+
+if __name__ == '__main__':
+    main()
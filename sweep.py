@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+"""
+Game settings sweep
+
+Simulates every combination of deck count, dealer hit score and shuffle
+threshold in parallel and prints house edge table. Results of seeded
+sweeps are cached on disk, so repeated sweeps only simulate new
+combinations
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from json import dump, load
+from os import cpu_count, replace
+
+from game import RULES_VERSION
+from simulator import SIMULATOR_VERSION, make_strategy, simulate
+from strategy import DECK_COUNTS
+
+# Dealer always takes the hole card, so he hits at least on 11, an ace
+# alone, and never on 21
+DILLER_HIT_ON = range(11, 21)
+
+
+def parse_range(values: list, cast=int) -> list:
+    """
+    Values from command line: single value, or start and stop
+    (inclusive) with step, optional for integers
+    """
+    values = [cast(value) for value in values]
+    if len(values) == 1:
+        return values
+    if len(values) > 3:
+        raise ValueError(f'too many values: {values}')
+    start, stop = values[:2]
+    if len(values) == 2 and cast is not int:
+        raise ValueError(f'range {start} - {stop} needs a step')
+    step = values[2] if len(values) == 3 else 1
+    if not step:
+        raise ValueError('step must not be 0')
+    result = []
+    # Count steps to avoid float accumulation errors
+    for num in range(int(round((stop - start) / step)) + 1):
+        result.append(round(start + num * step, 10))
+    if len(result) < 2:
+        raise ValueError(f'range {start} - {stop} with step {step} '
+                         f'gives less than two values')
+    return result
+
+
+def read_cache(filename: str) -> dict:
+    """ Read cached results, empty if there is no cache yet """
+    try:
+        with open(filename) as file:
+            return load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def write_cache(filename: str, cache: dict) -> None:
+    """ Save cache, replace file at once to survive interruption """
+    with open(filename + '.tmp', 'w') as file:
+        dump(cache, file, indent=1, sort_keys=True)
+    replace(filename + '.tmp', filename)
+
+
+def cache_key(cell: tuple, rounds: int, stand_on: int, seed: int) -> str:
+    """
+    Cache key - parameters, random seed, game rules and simulator
+    versions, None for unseeded results, they are not cached
+    """
+    if seed is None:
+        return None
+    deck_count, diller_hit_on, low_deck_threshold = cell
+    return (f'decks={deck_count} hit_on={diller_hit_on} '
+            f'threshold={low_deck_threshold} rounds={rounds} '
+            f'stand_on={stand_on} seed={seed} rules={RULES_VERSION} '
+            f'simulator={SIMULATOR_VERSION}')
+
+
+def simulate_cell(cell: tuple, rounds: int, stand_on: int,
+                  seed: int) -> dict:
+    """ Simulate one combination of settings, return result as dict """
+    deck_count, diller_hit_on, low_deck_threshold = cell
+    # Every cell gets its own reproducible random stream
+    cell_seed = None
+    if seed is not None:
+        cell_seed = [seed, deck_count, diller_hit_on,
+                     int(low_deck_threshold * 10 ** 6)]
+    result = simulate(rounds, deck_count, low_deck_threshold,
+                      diller_hit_on, make_strategy(stand_on),
+                      seed=cell_seed)
+    return result._asdict()
+
+
+def main() -> None:
+    parser = ArgumentParser(prog='Blackjack settings sweep')
+    parser.add_argument('-d', '--deck-count', nargs='+', default=['1', '8'],
+                        metavar='N', help='deck count: value or start stop')
+    parser.add_argument('-H', '--diller-hit-on', nargs='+', default=['16'],
+                        metavar='N',
+                        help='dealer hit score: value or start stop [step]')
+    parser.add_argument('-t', '--low-deck-threshold', nargs='+',
+                        default=['0.2'], metavar='T',
+                        help='shuffle threshold: value or start stop step')
+    parser.add_argument('-r', '--rounds', type=int, default=1000000,
+                        help='rounds for every combination')
+    parser.add_argument('-p', '--player-stand-on', type=int, default=17,
+                        help='score player stands on')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='random seed, negative - unseeded and not '
+                             'cached')
+    parser.add_argument('-w', '--workers', type=int, default=cpu_count(),
+                        help='number of processes')
+    parser.add_argument('--cache', default='sweep_cache.json',
+                        help='results cache file name')
+    args = parser.parse_args()
+    try:
+        deck_counts = parse_range(args.deck_count)
+        hit_scores = parse_range(args.diller_hit_on)
+        thresholds = parse_range(args.low_deck_threshold, float)
+    except ValueError as error:
+        parser.error(str(error))
+    if not all(count in DECK_COUNTS for count in deck_counts):
+        parser.error(f'deck count must be from {DECK_COUNTS[0]} to '
+                     f'{DECK_COUNTS[-1]}')
+    if not all(score in DILLER_HIT_ON for score in hit_scores):
+        parser.error(f'dealer hit score must be from {DILLER_HIT_ON[0]} '
+                     f'to {DILLER_HIT_ON[-1]}')
+    if not all(0 <= threshold < 1 for threshold in thresholds):
+        parser.error('shuffle threshold must be from 0 to below 1')
+    cells = list(product(deck_counts, hit_scores, thresholds))
+    seed = args.seed if args.seed >= 0 else None
+    cache = read_cache(args.cache)
+    keys = {cell: cache_key(cell, args.rounds, args.player_stand_on, seed)
+            for cell in cells}
+    results = {cell: cache[keys[cell]] for cell in cells
+               if keys[cell] in cache}
+    missing = [cell for cell in cells if cell not in results]
+    print(f'{len(cells)} combinations, {len(results)} cached')
+    if missing:
+        with ProcessPoolExecutor(args.workers) as executor:
+            futures = {executor.submit(simulate_cell, cell, args.rounds,
+                                       args.player_stand_on, seed): cell
+                       for cell in missing}
+            for future in as_completed(futures):
+                cell = futures[future]
+                results[cell] = future.result()
+                if keys[cell] is not None:
+                    cache[keys[cell]] = results[cell]
+                    # Keep finished cells even if the sweep is interrupted
+                    write_cache(args.cache, cache)
+    print(f'{"decks":>5} {"hit on":>6} {"threshold":>9} {"house edge":>10} '
+          f'{"95% CI":>19} {"player bust":>11} {"dealer bust":>11}')
+    for cell in cells:
+        result = results[cell]
+        deck_count, diller_hit_on, low_deck_threshold = cell
+        edge = result['house_edge']
+        error = 1.96 * result['house_edge_error']
+        interval = f'{edge - error:.4%} - {edge + error:.4%}'
+        print(f'{deck_count:>5} {diller_hit_on:>6} '
+              f'{low_deck_threshold:>9} {edge:>10.4%} {interval:>19} '
+              f'{result["player_bust_rate"]:>11.4%} '
+              f'{result["dealer_bust_rate"]:>11.4%}')
+
+
+if __name__ == '__main__':
+    main()